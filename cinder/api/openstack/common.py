@@ -70,6 +70,28 @@ def _get_marker_param(request):
     return request.GET['marker']
 
 
+def get_limit_and_marker(request, max_limit=FLAGS.osapi_max_limit):
+    """Return the marker and the page size of a list request."""
+    params = get_pagination_params(request)
+    limit = params.get('limit', max_limit)
+    limit = min(max_limit, limit or max_limit)
+    return params.get('marker'), limit
+
+
+def get_sort_params(request, default_key='created_at', default_dir='desc'):
+    """Return the sort key and direction of a list request.
+
+    Results are always sorted by id after the sort key, so that pages
+    can be fetched with the last id of the previous page as marker.
+    """
+    sort_key = request.GET.get('sort_key', default_key)
+    sort_dir = request.GET.get('sort_dir', default_dir)
+    if sort_dir not in ('asc', 'desc'):
+        msg = _("sort_dir must be 'asc' or 'desc'")
+        raise webob.exc.HTTPBadRequest(explanation=msg)
+    return sort_key, sort_dir
+
+
 def limited(items, request, max_limit=FLAGS.osapi_max_limit):
     """Return a slice of items according to requested offset and limit.
 
@@ -221,8 +243,9 @@ class ViewBuilder(object):
     def _get_collection_links(self, request, items, id_key="uuid"):
         """Retrieve 'next' link, if applicable."""
         links = []
-        limit = int(request.params.get("limit", 0))
-        if limit and limit == len(items):
+        limit = int(request.params.get("limit", 0)) or FLAGS.osapi_max_limit
+        limit = min(limit, FLAGS.osapi_max_limit)
+        if items and limit == len(items):
             last_item = items[-1]
             if id_key in last_item:
                 last_item_id = last_item[id_key]
@@ -19,6 +19,7 @@ from webob import exc
 import webob
 
 from cinder.api.openstack import common
+from cinder.api.openstack.volume.views import snapshots as snapshot_views
 from cinder.api.openstack import wsgi
 from cinder.api.openstack import xmlutil
 from cinder import exception
@@ -80,7 +81,9 @@ class SnapshotsTemplate(xmlutil.TemplateBuilder):
         elem = xmlutil.SubTemplateElement(root, 'snapshot',
                                           selector='snapshots')
         make_snapshot(elem)
-        return xmlutil.MasterTemplate(root, 1)
+        xmlutil.make_links(root, 'snapshots_links')
+        return xmlutil.MasterTemplate(root, 1,
+                                      nsmap={'atom': xmlutil.XMLNS_ATOM})
 
 
 class SnapshotsController(object):
@@ -118,25 +121,45 @@ class SnapshotsController(object):
     @wsgi.serializers(xml=SnapshotsTemplate)
     def index(self, req):
         """Returns a summary list of snapshots."""
-        return self._items(req, entity_maker=_translate_snapshot_summary_view)
+        return self._items(req, entity_maker=_translate_snapshot_summary_view,
+                           view_builder=snapshot_views.ViewBuilder())
 
     @wsgi.serializers(xml=SnapshotsTemplate)
     def detail(self, req):
         """Returns a detailed list of snapshots."""
-        return self._items(req, entity_maker=_translate_snapshot_detail_view)
+        return self._items(req, entity_maker=_translate_snapshot_detail_view,
+                           view_builder=snapshot_views.DetailViewBuilder())
 
-    def _items(self, req, entity_maker):
-        """Returns a list of snapshots, transformed through entity_maker."""
+    def _items(self, req, entity_maker, view_builder):
+        """Returns a page of snapshots, transformed through entity_maker."""
         context = req.environ['cinder.context']
 
         search_opts = {}
         search_opts.update(req.GET)
-
-        snapshots = self.volume_api.get_all_snapshots(context,
-                                                      search_opts=search_opts)
-        limited_list = common.limited(snapshots, req)
-        res = [entity_maker(context, snapshot) for snapshot in limited_list]
-        return {'snapshots': res}
+        for key in ('marker', 'limit', 'offset', 'sort_key', 'sort_dir'):
+            search_opts.pop(key, None)
+
+        marker, limit = common.get_limit_and_marker(req)
+        sort_key, sort_dir = common.get_sort_params(req)
+        if 'offset' in req.GET:
+            # offset pages have to skip the snapshots before them, so they are
+            # still cut out in python.
+            limit = None
+        try:
+            snapshots = self.volume_api.get_all_snapshots(context,
+                    marker=marker, limit=limit, sort_key=sort_key,
+                    sort_dir=sort_dir, search_opts=search_opts)
+        except (exception.MarkerNotFound, exception.InvalidSortKey) as error:
+            raise exc.HTTPBadRequest(explanation=unicode(error))
+        if limit is None:
+            snapshots = common.limited(snapshots, req)
+        res = [entity_maker(context, snapshot) for snapshot in snapshots]
+        response = {'snapshots': res}
+        if limit is not None:
+            snapshots_links = view_builder.links(req, res)
+            if snapshots_links:
+                response['snapshots_links'] = snapshots_links
+        return response
 
     @wsgi.serializers(xml=SnapshotTemplate)
     def create(self, req, body):
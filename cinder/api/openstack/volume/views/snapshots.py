@@ -0,0 +1,32 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from cinder.api.openstack import common
+
+
+class ViewBuilder(common.ViewBuilder):
+
+    _collection_name = 'snapshots'
+
+    def links(self, request, snapshots):
+        """Return the link to the next page of a full page of snapshots."""
+        return self._get_collection_links(request, snapshots, id_key='id')
+
+
+class DetailViewBuilder(ViewBuilder):
+
+    _collection_name = 'snapshots/detail'
@@ -19,10 +19,12 @@ from webob import exc
 import webob
 
 from cinder.api.openstack import common
+from cinder.api.openstack.volume.views import volumes as volume_views
 from cinder.api.openstack import wsgi
 from cinder.api.openstack import xmlutil
 from cinder import exception
 from cinder import flags
+from cinder.openstack.common import jsonutils
 from cinder.openstack.common import log as logging
 from cinder import utils
 from cinder import volume
@@ -156,6 +158,7 @@ class VolumesTemplate(xmlutil.TemplateBuilder):
         root = xmlutil.TemplateElement('volumes')
         elem = xmlutil.SubTemplateElement(root, 'volume', selector='volumes')
         make_volume(elem)
+        xmlutil.make_links(root, 'volumes_links')
         return xmlutil.MasterTemplate(root, 1, nsmap=volume_nsmap)
 
 
@@ -195,27 +198,55 @@ class VolumeController(object):
     @wsgi.serializers(xml=VolumesTemplate)
     def index(self, req):
         """Returns a summary list of volumes."""
-        return self._items(req, entity_maker=_translate_volume_summary_view)
+        return self._items(req, entity_maker=_translate_volume_summary_view,
+                           view_builder=volume_views.ViewBuilder())
 
     @wsgi.serializers(xml=VolumesTemplate)
     def detail(self, req):
         """Returns a detailed list of volumes."""
-        return self._items(req, entity_maker=_translate_volume_detail_view)
+        return self._items(req, entity_maker=_translate_volume_detail_view,
+                           view_builder=volume_views.DetailViewBuilder())
 
-    def _items(self, req, entity_maker):
-        """Returns a list of volumes, transformed through entity_maker."""
+    def _items(self, req, entity_maker, view_builder):
+        """Returns a page of volumes, transformed through entity_maker."""
 
         search_opts = {}
-        search_opts.update(req.GET)
+        for key, values in req.GET.dict_of_lists().iteritems():
+            # a repeated option matches any of its values
+            search_opts[key] = values if len(values) > 1 else values[0]
+        for key in ('marker', 'limit', 'offset', 'sort_key', 'sort_dir'):
+            search_opts.pop(key, None)
 
         context = req.environ['cinder.context']
         remove_invalid_options(context,
                                search_opts, self._get_volume_search_options())
-
-        volumes = self.volume_api.get_all(context, search_opts=search_opts)
-        limited_list = common.limited(volumes, req)
-        res = [entity_maker(context, vol) for vol in limited_list]
-        return {'volumes': res}
+        if 'metadata' in search_opts:
+            search_opts['metadata'] = self._metadata_from_search_opt(
+                    search_opts['metadata'])
+
+        marker, limit = common.get_limit_and_marker(req)
+        sort_key, sort_dir = common.get_sort_params(req)
+        if 'offset' in req.GET:
+            # offset pages have to skip the volumes before them, so they are
+            # still cut out in python.
+            limit = None
+        try:
+            volumes = self.volume_api.get_all(context, marker=marker,
+                                              limit=limit,
+                                              sort_key=sort_key,
+                                              sort_dir=sort_dir,
+                                              search_opts=search_opts)
+        except (exception.MarkerNotFound, exception.InvalidSortKey) as error:
+            raise exc.HTTPBadRequest(explanation=unicode(error))
+        if limit is None:
+            volumes = common.limited(volumes, req)
+        res = [entity_maker(context, vol) for vol in volumes]
+        response = {'volumes': res}
+        if limit is not None:
+            volumes_links = view_builder.links(req, res)
+            if volumes_links:
+                response['volumes_links'] = volumes_links
+        return response
 
     def _image_uuid_from_href(self, image_href):
         # If the image href was generated by nova api, strip image_href
@@ -294,7 +325,21 @@ class VolumeController(object):
 
     def _get_volume_search_options(self):
         """Return volume search options allowed by non-admin."""
-        return ('name', 'status')
+        return ('name', 'status', 'availability_zone', 'metadata')
+
+    def _metadata_from_search_opt(self, metadata):
+        """Parse a metadata search option like {"key": "value"}."""
+        try:
+            metadata = jsonutils.loads(metadata)
+        except (ValueError, TypeError):
+            metadata = None
+        if (not isinstance(metadata, dict) or
+            not all(isinstance(item, basestring)
+                    for item in sum(metadata.items(), ()))):
+            msg = _("metadata must be a JSON object of string keys and "
+                    "values")
+            raise exc.HTTPBadRequest(explanation=msg)
+        return metadata
 
 
 def create_resource(ext_mgr):
@@ -44,7 +44,7 @@ class RequestContext(object):
     def __init__(self, user_id, project_id, is_admin=None, read_deleted="no",
                  roles=None, remote_address=None, timestamp=None,
                  request_id=None, auth_token=None, overwrite=True,
-                 quota_class=None, **kwargs):
+                 quota_class=None, db_written=False, **kwargs):
         """
         :param read_deleted: 'no' indicates deleted records are hidden, 'yes'
             indicates deleted records are visible, 'only' indicates that
@@ -53,6 +53,9 @@ class RequestContext(object):
         :param overwrite: Set to False to ensure that the greenthread local
             copy of the index is not overwritten.
 
+        :param db_written: True once the database has been written to
+            under this context, so its reads no longer go to the replica.
+
         :param kwargs: Extra arguments that might be present, but we ignore
             because they possibly came in from older rpc messages.
         """
@@ -80,6 +83,7 @@ class RequestContext(object):
         self.request_id = request_id
         self.auth_token = auth_token
         self.quota_class = quota_class
+        self.db_written = db_written
         if overwrite or not hasattr(local.store, 'context'):
             self.update_store()
 
@@ -111,7 +115,8 @@ class RequestContext(object):
                 'timestamp': timeutils.strtime(self.timestamp),
                 'request_id': self.request_id,
                 'auth_token': self.auth_token,
-                'quota_class': self.quota_class}
+                'quota_class': self.quota_class,
+                'db_written': self.db_written}
 
     @classmethod
     def from_dict(cls, values):
@@ -62,6 +62,17 @@ db_opts = [
     cfg.StrOpt('snapshot_name_template',
                default='snapshot-%s',
                help='Template string to be used to generate snapshot names'),
+    cfg.IntOpt('deleted_rows_retention_days',
+               default=90,
+               help='Days soft-deleted rows are kept before they can be '
+                    'archived, 0 to archive them right away'),
+    cfg.IntOpt('deleted_rows_archive_batch_size',
+               default=1000,
+               help='Maximum number of rows archived in one transaction'),
+    cfg.BoolOpt('deleted_rows_purge',
+                default=False,
+                help='Delete the archived rows rather than moving them to '
+                     'the shadow tables'),
     ]
 
 FLAGS = flags.FLAGS
@@ -124,9 +135,9 @@ def service_get_all_compute_sorted(context):
 
 
 def service_get_all_volume_sorted(context):
-    """Get all volume services sorted by volume count.
+    """Get all volume services sorted by allocated gigabytes.
 
-    :returns: a list of (Service, volume_count) tuples.
+    :returns: a list of (Service, volume_gigabytes) tuples.
 
     """
     return IMPL.service_get_all_volume_sorted(context)
@@ -231,14 +242,38 @@ def volume_detached(context, volume_id):
     return IMPL.volume_detached(context, volume_id)
 
 
-def volume_get(context, volume_id):
-    """Get a volume or raise if it does not exist."""
-    return IMPL.volume_get(context, volume_id)
+def volume_get(context, volume_id, columns_to_join=None):
+    """Get a volume or raise if it does not exist.
 
+    :param columns_to_join: the relationships to load with the volume,
+        by default volume_metadata and volume_type. Pass [] when only
+        the volume's own columns are used.
+    """
+    return IMPL.volume_get(context, volume_id,
+                           columns_to_join=columns_to_join)
+
+
+def volume_get_all(context, marker=None, limit=None, sort_key='created_at',
+                   sort_dir='desc', filters=None):
+    """Get all volumes, a page at a time.
+
+    :param marker: the id of the last volume of the previous page.
+    :param limit: the maximum number of volumes to return.
+    :param sort_key: 'created_at' or 'id', ties are broken by id.
+    :param sort_dir: 'asc' or 'desc'.
+    :param filters: a dict of column values the volumes must have; list
+                    values match any of their items and a 'metadata'
+                    dict matches volumes having all of its key/values.
+
+    """
+    return IMPL.volume_get_all(context, marker=marker, limit=limit,
+                               sort_key=sort_key, sort_dir=sort_dir,
+                               filters=filters)
 
-def volume_get_all(context):
-    """Get all volumes."""
-    return IMPL.volume_get_all(context)
+
+def volume_get_all_by_ids(context, volume_ids):
+    """Get the volumes with the given ids in a single query."""
+    return IMPL.volume_get_all_by_ids(context, volume_ids)
 
 
 def volume_get_all_by_host(context, host):
@@ -251,9 +286,15 @@ def volume_get_all_by_instance_uuid(context, instance_uuid):
     return IMPL.volume_get_all_by_instance_uuid(context, instance_uuid)
 
 
-def volume_get_all_by_project(context, project_id):
-    """Get all volumes belonging to a project."""
-    return IMPL.volume_get_all_by_project(context, project_id)
+def volume_get_all_by_project(context, project_id, marker=None, limit=None,
+                              sort_key='created_at', sort_dir='desc',
+                              filters=None):
+    """Get all volumes belonging to a project, a page at a time."""
+    return IMPL.volume_get_all_by_project(context, project_id,
+                                          marker=marker, limit=limit,
+                                          sort_key=sort_key,
+                                          sort_dir=sort_dir,
+                                          filters=filters)
 
 
 def volume_get_iscsi_target_num(context, volume_id):
@@ -270,6 +311,45 @@ def volume_update(context, volume_id, values):
     return IMPL.volume_update(context, volume_id, values)
 
 
+def volume_conditional_update(context, volume_id, values,
+                              expected_values=None):
+    """Set the given properties on a volume if it is as expected.
+
+    Runs a single UPDATE of the volume whose WHERE clause also checks
+    expected_values; a value that is a list matches any of its items,
+    like {'status': ['available', 'error']}. Unlike volume_update it
+    does not handle metadata or host and size changes.
+
+    :returns: True if the volume was updated, False if it does not exist
+              or does not match expected_values.
+    """
+    return IMPL.volume_conditional_update(context, volume_id, values,
+                                          expected_values)
+
+
+def volume_set_hosts(context, volume_hosts, scheduled_at):
+    """Assign volumes to hosts in a single transaction.
+
+    :param volume_hosts: a dict of host by volume id.
+
+    """
+    return IMPL.volume_set_hosts(context, volume_hosts, scheduled_at)
+
+
+def volume_host_allocation_get_all(context):
+    """Get the number and size of the volumes on each host."""
+    return IMPL.volume_host_allocation_get_all(context)
+
+
+def volume_host_allocation_refresh(context):
+    """Recount the volumes on each host and repair the allocations.
+
+    :returns: the hosts whose allocations had drifted.
+
+    """
+    return IMPL.volume_host_allocation_refresh(context)
+
+
 ####################
 
 
@@ -288,14 +368,21 @@ def snapshot_get(context, snapshot_id):
     return IMPL.snapshot_get(context, snapshot_id)
 
 
-def snapshot_get_all(context):
-    """Get all snapshots."""
-    return IMPL.snapshot_get_all(context)
+def snapshot_get_all(context, marker=None, limit=None,
+                     sort_key='created_at', sort_dir='desc'):
+    """Get all snapshots, a page at a time."""
+    return IMPL.snapshot_get_all(context, marker=marker, limit=limit,
+                                 sort_key=sort_key, sort_dir=sort_dir)
 
 
-def snapshot_get_all_by_project(context, project_id):
-    """Get all snapshots belonging to a project."""
-    return IMPL.snapshot_get_all_by_project(context, project_id)
+def snapshot_get_all_by_project(context, project_id, marker=None,
+                                limit=None, sort_key='created_at',
+                                sort_dir='desc'):
+    """Get all snapshots belonging to a project, a page at a time."""
+    return IMPL.snapshot_get_all_by_project(context, project_id,
+                                            marker=marker, limit=limit,
+                                            sort_key=sort_key,
+                                            sort_dir=sort_dir)
 
 
 def snapshot_get_all_for_volume(context, volume_id):
@@ -620,3 +707,22 @@ def quota_destroy_all_by_project(context, project_id):
 def reservation_expire(context):
     """Roll back any expired reservations."""
     return IMPL.reservation_expire(context)
+
+
+###################
+
+
+def archive_deleted_rows(context, max_rows=None, purge=None):
+    """Move soft-deleted rows into the shadow tables.
+
+    Only rows deleted more than deleted_rows_retention_days ago are
+    moved, at most deleted_rows_archive_batch_size of them per
+    transaction.
+
+    :param max_rows: the maximum number of rows to archive, all if None.
+    :param purge: delete the rows rather than moving them, by default
+                  deleted_rows_purge.
+    :returns: a dict of the number of rows archived by table name.
+    """
+    return IMPL.archive_deleted_rows(context, max_rows=max_rows,
+                                     purge=purge)
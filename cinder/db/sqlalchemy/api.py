@@ -23,16 +23,22 @@ import datetime
 import functools
 import warnings
 
+from cinder.common import sqlalchemyutils
 from cinder import db
 from cinder import exception
 from cinder import flags
 from cinder import utils
 from cinder.openstack.common import log as logging
 from cinder.db.sqlalchemy import models
+from cinder.db.sqlalchemy.session import db_call
+from cinder.db.sqlalchemy.session import get_engine
 from cinder.db.sqlalchemy.session import get_session
 from cinder.openstack.common import timeutils
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy import exists
+from sqlalchemy import MetaData
 from sqlalchemy import or_
+from sqlalchemy import select
 from sqlalchemy.orm import joinedload
 from sqlalchemy.orm import joinedload_all
 from sqlalchemy.sql.expression import asc
@@ -103,7 +109,8 @@ def require_admin_context(f):
     def wrapper(*args, **kwargs):
         if not is_admin_context(args[0]):
             raise exception.AdminRequired()
-        return f(*args, **kwargs)
+        with db_call(args[0]):
+            return f(*args, **kwargs)
     return wrapper
 
 
@@ -121,7 +128,27 @@ def require_context(f):
     def wrapper(*args, **kwargs):
         if not is_admin_context(args[0]) and not is_user_context(args[0]):
             raise exception.NotAuthorized()
-        return f(*args, **kwargs)
+        with db_call(args[0]):
+            return f(*args, **kwargs)
+    return wrapper
+
+
+def replica_safe(f):
+    """Decorator to read from the database replica.
+
+    Marks a DB API function that only reads and can return rows a little
+    behind the primary, like the listings. Its sessions use
+    sql_replica_connection, unless the context has already written to
+    the database. Goes under require_context or require_admin_context.
+
+    The first argument to the wrapped function must be the context.
+
+    """
+
+    def wrapper(context, *args, **kwargs):
+        with db_call(context, replica=True):
+            return f(context, *args, **kwargs)
+    wrapper.__name__ = f.__name__
     return wrapper
 
 
@@ -181,7 +208,9 @@ def exact_filter(query, model, filters, legal_keys):
                   filtering
     :param filters: dictionary of filters; values that are lists,
                     tuples, sets, or frozensets cause an 'IN' test to
-                    be performed, while exact matching ('==' operator)
+                    be performed, values that are dicts match rows of
+                    the key/value relationship named by the key (like
+                    metadata), while exact matching ('==' operator)
                     is used for other values
     :param legal_keys: list of keys to apply exact filtering to
     """
@@ -201,6 +230,13 @@ def exact_filter(query, model, filters, legal_keys):
             # Looking for values in a list; apply to query directly
             column_attr = getattr(model, key)
             query = query.filter(column_attr.in_(value))
+        elif isinstance(value, dict):
+            # Looking for key/value rows; each pair is an EXISTS test
+            # against the related table
+            relationship_attr = getattr(model, key)
+            for item_key, item_value in value.iteritems():
+                query = query.filter(relationship_attr.any(key=item_key,
+                                                           value=item_value))
         else:
             # OK, simple exact match; save for later
             filter_dict[key] = value
@@ -287,10 +323,10 @@ def service_get_all_volume_sorted(context):
     with session.begin():
         topic = FLAGS.volume_topic
         label = 'volume_gigabytes'
-        subq = model_query(context, models.Volume.host,
-                           func.sum(models.Volume.size).label(label),
+        subq = model_query(context, models.VolumeHostAllocation.host,
+                           models.VolumeHostAllocation.allocated_gb.\
+                                   label(label),
                            session=session, read_deleted="no").\
-                       group_by(models.Volume.host).\
                        subquery()
         return _service_get_all_topic_subquery(context,
                                                session,
@@ -761,13 +797,12 @@ def quota_reserve(context, resources, quotas, deltas, expire,
         if not overs:
             reservations = []
             for resource, delta in deltas.items():
-                reservation = reservation_create(elevated,
-                                                 str(utils.gen_uuid()),
-                                                 usages[resource],
-                                                 context.project_id,
-                                                 resource, delta, expire,
-                                                 session=session)
-                reservations.append(reservation.uuid)
+                reservations.append(dict(uuid=str(utils.gen_uuid()),
+                                         usage_id=usages[resource].id,
+                                         project_id=context.project_id,
+                                         resource=resource,
+                                         delta=delta,
+                                         expire=expire))
 
                 # Also update the reserved quantity
                 # NOTE(Vek): Again, we are only concerned here about
@@ -784,9 +819,11 @@ def quota_reserve(context, resources, quotas, deltas, expire,
                 if delta > 0:
                     usages[resource].reserved += delta
 
-        # Apply updates to the usages table
-        for usage_ref in usages.values():
-            usage_ref.save(session=session)
+            _reservations_create(session, reservations)
+            reservations = [r['uuid'] for r in reservations]
+
+        # the changed usages are written by the flush when the transaction
+        # commits, one UPDATE per usage.
 
     if unders:
         LOG.warning(_("Change will make usage less than 0 for the following "
@@ -800,6 +837,24 @@ def quota_reserve(context, resources, quotas, deltas, expire,
     return reservations
 
 
+def _reservations_create(session, reservations):
+    """Insert the reservations, a list of dicts, in one statement."""
+    session.execute(models.Reservation.__table__.insert(), reservations)
+
+
+def _quota_reservations_delete(session, reservation_refs):
+    """Soft delete the reservations in one statement."""
+    if not reservation_refs:
+        return
+    session.query(models.Reservation).\
+            filter(models.Reservation.id.in_([r.id
+                                              for r in reservation_refs])).\
+            update({'deleted': True,
+                    'deleted_at': timeutils.utcnow(),
+                    'updated_at': literal_column('updated_at')},
+                   synchronize_session=False)
+
+
 def _quota_reservations(session, context, reservations):
     """Return the relevant reservations."""
 
@@ -818,16 +873,14 @@ def reservation_commit(context, reservations):
     with session.begin():
         usages = _get_quota_usages(context, session)
 
-        for reservation in _quota_reservations(session, context, reservations):
+        reservation_refs = _quota_reservations(session, context, reservations)
+        for reservation in reservation_refs:
             usage = usages[reservation.resource]
             if reservation.delta >= 0:
                 usage.reserved -= reservation.delta
             usage.in_use += reservation.delta
 
-            reservation.delete(session=session)
-
-        for usage in usages.values():
-            usage.save(session=session)
+        _quota_reservations_delete(session, reservation_refs)
 
 
 @require_context
@@ -836,15 +889,13 @@ def reservation_rollback(context, reservations):
     with session.begin():
         usages = _get_quota_usages(context, session)
 
-        for reservation in _quota_reservations(session, context, reservations):
+        reservation_refs = _quota_reservations(session, context, reservations)
+        for reservation in reservation_refs:
             usage = usages[reservation.resource]
             if reservation.delta >= 0:
                 usage.reserved -= reservation.delta
 
-            reservation.delete(session=session)
-
-        for usage in usages.values():
-            usage.save(session=session)
+        _quota_reservations_delete(session, reservation_refs)
 
 
 @require_admin_context
@@ -886,13 +937,25 @@ def reservation_expire(context):
                           filter(models.Reservation.expire < current_time).\
                           all()
 
-        if results:
-            for reservation in results:
-                if reservation.delta >= 0:
-                    reservation.usage.reserved -= reservation.delta
-                    reservation.usage.save(session=session)
+        # Load the usages of all the expired reservations in one query,
+        # rather than one per reservation.
+        usage_ids = set(reservation.usage_id for reservation in results
+                        if reservation.delta >= 0)
+        usages = {}
+        if usage_ids:
+            rows = model_query(context, models.QuotaUsage, session=session,
+                               read_deleted="no").\
+                           filter(models.QuotaUsage.id.in_(usage_ids)).\
+                           with_lockmode('update').\
+                           all()
+            usages = dict((usage.id, usage) for usage in rows)
+
+        for reservation in results:
+            usage = usages.get(reservation.usage_id)
+            if usage and reservation.delta >= 0:
+                usage.reserved -= reservation.delta
 
-                reservation.delete(session=session)
+        _quota_reservations_delete(session, results)
 
 
 ###################
@@ -925,14 +988,12 @@ def volume_attached(context, volume_id, instance_uuid, mountpoint):
     if not utils.is_uuid_like(instance_uuid):
         raise exception.InvalidUUID(instance_uuid)
 
-    session = get_session()
-    with session.begin():
-        volume_ref = volume_get(context, volume_id, session=session)
-        volume_ref['status'] = 'in-use'
-        volume_ref['mountpoint'] = mountpoint
-        volume_ref['attach_status'] = 'attached'
-        volume_ref['instance_uuid'] = instance_uuid
-        volume_ref.save(session=session)
+    if not volume_conditional_update(context, volume_id,
+                                     {'status': 'in-use',
+                                      'mountpoint': mountpoint,
+                                      'attach_status': 'attached',
+                                      'instance_uuid': instance_uuid}):
+        raise exception.VolumeNotFound(volume_id=volume_id)
 
 
 @require_context
@@ -947,6 +1008,10 @@ def volume_create(context, values):
     session = get_session()
     with session.begin():
         volume_ref.save(session=session)
+        if volume_ref['host']:
+            _volume_host_allocation_adjust(context, volume_ref['host'],
+                                           1, volume_ref['size'],
+                                           session=session)
 
     meta = volume_metadata_get(context, volume_ref.id)
     volume_ref.metadata = meta
@@ -978,6 +1043,14 @@ def volume_data_get_for_project(context, project_id, session=None):
 def volume_destroy(context, volume_id):
     session = get_session()
     with session.begin():
+        volume_ref = model_query(context, models.Volume, session=session,
+                                 read_deleted="no").\
+                            filter_by(id=volume_id).\
+                            first()
+        if volume_ref and volume_ref['host']:
+            _volume_host_allocation_adjust(context, volume_ref['host'],
+                                           -1, -int(volume_ref['size'] or 0),
+                                           session=session)
         session.query(models.Volume).\
                 filter_by(id=volume_id).\
                 update({'deleted': True,
@@ -995,22 +1068,24 @@ def volume_destroy(context, volume_id):
 
 @require_admin_context
 def volume_detached(context, volume_id):
-    session = get_session()
-    with session.begin():
-        volume_ref = volume_get(context, volume_id, session=session)
-        volume_ref['status'] = 'available'
-        volume_ref['mountpoint'] = None
-        volume_ref['attach_status'] = 'detached'
-        volume_ref['instance_uuid'] = None
-        volume_ref.save(session=session)
+    if not volume_conditional_update(context, volume_id,
+                                     {'status': 'available',
+                                      'mountpoint': None,
+                                      'attach_status': 'detached',
+                                      'instance_uuid': None}):
+        raise exception.VolumeNotFound(volume_id=volume_id)
 
 
 @require_context
-def _volume_get_query(context, session=None, project_only=False):
-    return model_query(context, models.Volume, session=session,
-                       project_only=project_only).\
-                       options(joinedload('volume_metadata')).\
-                       options(joinedload('volume_type'))
+def _volume_get_query(context, session=None, project_only=False,
+                      columns_to_join=None):
+    if columns_to_join is None:
+        columns_to_join = ['volume_metadata', 'volume_type']
+    query = model_query(context, models.Volume, session=session,
+                        project_only=project_only)
+    for column in columns_to_join:
+        query = query.options(joinedload(column))
+    return query
 
 
 @require_context
@@ -1026,8 +1101,9 @@ def _ec2_snapshot_get_query(context, session=None, project_only=False):
 
 
 @require_context
-def volume_get(context, volume_id, session=None):
-    result = _volume_get_query(context, session=session, project_only=True).\
+def volume_get(context, volume_id, session=None, columns_to_join=None):
+    result = _volume_get_query(context, session=session, project_only=True,
+                               columns_to_join=columns_to_join).\
                     filter_by(id=volume_id).\
                     first()
 
@@ -1037,9 +1113,62 @@ def volume_get(context, volume_id, session=None):
     return result
 
 
+# The listings are indexed on created_at after their filters, and on id,
+# so a page sorted by one of these doesn't sort the whole table.
+_SORT_KEYS = ('created_at', 'id')
+
+
+def _paginate_query(context, query, model, marker, limit, sort_key,
+                    sort_dir):
+    """Sort the query and return the page of rows after the marker id."""
+    if sort_key not in _SORT_KEYS:
+        raise exception.InvalidSortKey()
+    sort_keys = [sort_key]
+    if sort_key != 'id':
+        sort_keys.append('id')
+    marker_ref = None
+    if marker is not None:
+        marker_ref = model_query(context, model, project_only=True).\
+                            filter_by(id=marker).\
+                            first()
+        if not marker_ref:
+            raise exception.MarkerNotFound(marker=marker)
+    return sqlalchemyutils.paginate_query(query, model, limit, sort_keys,
+                                          marker=marker_ref,
+                                          sort_dir=sort_dir)
+
+
+def _process_volume_filters(query, filters):
+    """Apply the volume listing filters to the query."""
+    filters = dict(filters)
+    if 'metadata' in filters:
+        filters['volume_metadata'] = filters.pop('metadata')
+    return exact_filter(query, models.Volume, filters,
+                        ['id', 'status', 'display_name', 'availability_zone',
+                         'host', 'size', 'attach_status', 'instance_uuid',
+                         'snapshot_id', 'volume_type_id', 'project_id',
+                         'volume_metadata'])
+
+
+@require_admin_context
+@replica_safe
+def volume_get_all(context, marker=None, limit=None, sort_key='created_at',
+                   sort_dir='desc', filters=None):
+    query = _volume_get_query(context)
+    if filters:
+        query = _process_volume_filters(query, filters)
+    query = _paginate_query(context, query, models.Volume, marker, limit,
+                            sort_key, sort_dir)
+    return query.all()
+
+
 @require_admin_context
-def volume_get_all(context):
-    return _volume_get_query(context).all()
+def volume_get_all_by_ids(context, volume_ids):
+    if not volume_ids:
+        return []
+    return _volume_get_query(context).\
+                    filter(models.Volume.id.in_(volume_ids)).\
+                    all()
 
 
 @require_admin_context
@@ -1062,9 +1191,17 @@ def volume_get_all_by_instance_uuid(context, instance_uuid):
 
 
 @require_context
-def volume_get_all_by_project(context, project_id):
+@replica_safe
+def volume_get_all_by_project(context, project_id, marker=None, limit=None,
+                              sort_key='created_at', sort_dir='desc',
+                              filters=None):
     authorize_project_context(context, project_id)
-    return _volume_get_query(context).filter_by(project_id=project_id).all()
+    query = _volume_get_query(context).filter_by(project_id=project_id)
+    if filters:
+        query = _process_volume_filters(query, filters)
+    query = _paginate_query(context, query, models.Volume, marker, limit,
+                            sort_key, sort_dir)
+    return query.all()
 
 
 @require_admin_context
@@ -1089,13 +1226,187 @@ def volume_update(context, volume_id, values):
                                 values.pop('metadata'),
                                 delete=True)
     with session.begin():
-        volume_ref = volume_get(context, volume_id, session=session)
-        volume_ref.update(values)
-        volume_ref.save(session=session)
+        # only the host and size are needed to adjust the allocations, so skip
+        # loading the volume and its metadata and type.
+        result = model_query(context, models.Volume.host, models.Volume.size,
+                             session=session, project_only=True).\
+                         filter_by(id=volume_id).\
+                         first()
+        if not result:
+            raise exception.VolumeNotFound(volume_id=volume_id)
+        old_host, old_size = result
+        model_query(context, models.Volume, session=session,
+                    project_only=True).\
+                filter_by(id=volume_id).\
+                update(dict(values, updated_at=timeutils.utcnow()),
+                       synchronize_session=False)
+        host = values.get('host', old_host)
+        size = values.get('size', old_size)
+        deltas = {}
+        if old_host:
+            deltas[old_host] = (-1, -int(old_size or 0))
+        if host:
+            count, gigs = deltas.get(host, (0, 0))
+            deltas[host] = (count + 1, gigs + int(size or 0))
+        # the rows are locked in host order, as volume_set_hosts does, so
+        # concurrent moves between two hosts can't deadlock.
+        for host, (count, gigs) in sorted(deltas.iteritems()):
+            if count or gigs:
+                _volume_host_allocation_adjust(context, host, count, gigs,
+                                               session=session)
+
+
+@require_context
+def volume_conditional_update(context, volume_id, values,
+                              expected_values=None):
+    query = model_query(context, models.Volume, read_deleted="no",
+                        project_only=True).\
+                    filter_by(id=volume_id)
+    for key, value in (expected_values or {}).iteritems():
+        column = getattr(models.Volume, key)
+        if isinstance(value, (list, tuple, set, frozenset)):
+            query = query.filter(column.in_(value))
+        else:
+            query = query.filter(column == value)
+
+    values = dict(values, updated_at=timeutils.utcnow())
+    # the mysql dialect connects with FOUND_ROWS, so the count is of the
+    # matched rows even if none changed.
+    return query.update(values, synchronize_session=False) == 1
+
+
+@require_admin_context
+def volume_set_hosts(context, volume_hosts, scheduled_at):
+    if not volume_hosts:
+        return
+    session = get_session()
+    with session.begin():
+        volume_refs = model_query(context, models.Volume, session=session,
+                                  read_deleted="no").\
+                              filter(models.Volume.id.in_(volume_hosts)).\
+                              all()
+        deltas = {}
+        for volume_ref in volume_refs:
+            size = int(volume_ref['size'] or 0)
+            old_host = volume_ref['host']
+            new_host = volume_hosts[volume_ref['id']]
+            if old_host != new_host:
+                for host, sign in ((old_host, -1), (new_host, 1)):
+                    if host:
+                        count, gigs = deltas.get(host, (0, 0))
+                        deltas[host] = (count + sign, gigs + sign * size)
+            volume_ref['host'] = new_host
+            volume_ref['scheduled_at'] = scheduled_at
+            volume_ref.save(session=session)
+        # one update per host rather than per volume
+        for host, (count, gigs) in sorted(deltas.iteritems()):
+            _volume_host_allocation_adjust(context, host, count, gigs,
+                                           session=session)
 
 
 ####################
 
+
+# volume_host_allocations keeps the number and size of the volumes on each
+# host, so that placement doesn't have to sum the volumes table. It is updated
+# in the same transaction as the volume, and volume_host_allocation_refresh
+# repairs any drift.
+
+def _volume_host_allocation_adjust(context, host, count, size, session):
+    allocation_ref = model_query(context, models.VolumeHostAllocation,
+                                 session=session, read_deleted="no").\
+                            filter_by(host=host).\
+                            with_lockmode('update').\
+                            first()
+    if not allocation_ref:
+        allocation_ref = _volume_host_allocation_create(context, host,
+                                                        session)
+    allocation_ref.volume_count += count
+    allocation_ref.allocated_gb += int(size or 0)
+    allocation_ref.save(session=session)
+
+
+def _volume_host_allocation_create(context, host, session):
+    """Add the allocation row of a host and return it locked.
+
+    If another transaction added the row since it was looked up, the
+    unique constraint on (host, deleted) rejects this insert and the
+    existing row is returned instead.
+    """
+    values = {'created_at': timeutils.utcnow(),
+              'deleted': False,
+              'host': host,
+              'volume_count': 0,
+              'allocated_gb': 0}
+    insert = models.VolumeHostAllocation.__table__.insert()
+    try:
+        # the savepoint keeps a rejected insert from aborting the rest of
+        # the transaction on databases that abort it on errors. sqlite
+        # doesn't, and pysqlite commits the transaction before a savepoint.
+        if session.bind.name == 'sqlite':
+            session.execute(insert, values)
+        else:
+            with session.begin_nested():
+                session.execute(insert, values)
+    except IntegrityError:
+        LOG.debug(_("Volume allocations of host %s were added "
+                    "concurrently"), host)
+    return model_query(context, models.VolumeHostAllocation,
+                       session=session, read_deleted="no").\
+                   filter_by(host=host).\
+                   with_lockmode('update').\
+                   one()
+
+
+@require_admin_context
+def volume_host_allocation_get_all(context):
+    return model_query(context, models.VolumeHostAllocation,
+                       read_deleted="no").\
+                   all()
+
+
+@require_admin_context
+def volume_host_allocation_refresh(context):
+    session = get_session()
+    with session.begin():
+        rows = model_query(context, models.VolumeHostAllocation,
+                           session=session, read_deleted="no").\
+                       with_lockmode('update').\
+                       all()
+        counts = model_query(context, models.Volume.host,
+                             func.count(models.Volume.id),
+                             func.sum(models.Volume.size),
+                             session=session, read_deleted="no").\
+                         filter(models.Volume.host != None).\
+                         group_by(models.Volume.host).\
+                         all()
+
+        drifted = set()
+        allocations = dict((allocation_ref.host, allocation_ref)
+                           for allocation_ref in rows)
+
+        actual = dict((host, (count, int(size or 0)))
+                      for host, count, size in counts)
+        for host in set(actual) | set(allocations):
+            volume_count, allocated_gb = actual.get(host, (0, 0))
+            allocation_ref = allocations.get(host)
+            if allocation_ref is None:
+                allocation_ref = models.VolumeHostAllocation()
+                allocation_ref.host = host
+            elif (allocation_ref.volume_count == volume_count and
+                  allocation_ref.allocated_gb == allocated_gb):
+                continue
+            LOG.warning(_("Volume allocations of host %(host)s are out of "
+                          "sync, setting them to %(volume_count)d volumes "
+                          "and %(allocated_gb)d GB"), locals())
+            allocation_ref.volume_count = volume_count
+            allocation_ref.allocated_gb = allocated_gb
+            allocation_ref.save(session=session)
+            drifted.add(host)
+
+    return sorted(drifted)
+
+
 def _volume_metadata_get_query(context, volume_id, session=None):
     return model_query(context, models.VolumeMetadata,
                        session=session, read_deleted="no").\
@@ -1213,8 +1524,13 @@ def snapshot_get(context, snapshot_id, session=None):
 
 
 @require_admin_context
-def snapshot_get_all(context):
-    return model_query(context, models.Snapshot).all()
+@replica_safe
+def snapshot_get_all(context, marker=None, limit=None,
+                     sort_key='created_at', sort_dir='desc'):
+    query = _paginate_query(context, model_query(context, models.Snapshot),
+                            models.Snapshot, marker, limit, sort_key,
+                            sort_dir)
+    return query.all()
 
 
 @require_context
@@ -1225,11 +1541,16 @@ def snapshot_get_all_for_volume(context, volume_id):
 
 
 @require_context
-def snapshot_get_all_by_project(context, project_id):
+@replica_safe
+def snapshot_get_all_by_project(context, project_id, marker=None,
+                                limit=None, sort_key='created_at',
+                                sort_dir='desc'):
     authorize_project_context(context, project_id)
-    return model_query(context, models.Snapshot).\
-                   filter_by(project_id=project_id).\
-                   all()
+    query = model_query(context, models.Snapshot).\
+                   filter_by(project_id=project_id)
+    query = _paginate_query(context, query, models.Snapshot, marker, limit,
+                            sort_key, sort_dir)
+    return query.all()
 
 
 @require_context
@@ -1331,6 +1652,7 @@ def volume_type_create(context, values):
 
 
 @require_context
+@replica_safe
 def volume_type_get_all(context, inactive=False, filters=None):
     """
     Returns a dict describing all volume_types with name as key.
@@ -1657,6 +1979,7 @@ def quota_get(context, project_id, resource, session=None):
 
 
 @require_context
+@replica_safe
 def quota_get_all_by_project(context, project_id):
     authorize_project_context(context, project_id)
 
@@ -1729,6 +2052,7 @@ def quota_class_get(context, class_name, resource, session=None):
 
 
 @require_context
+@replica_safe
 def quota_class_get_all_by_name(context, class_name):
     authorize_quota_class_context(context, class_name)
 
@@ -1800,6 +2124,7 @@ def quota_usage_get(context, project_id, resource, session=None):
 
 
 @require_context
+@replica_safe
 def quota_usage_get_all_by_project(context, project_id):
     authorize_project_context(context, project_id)
 
@@ -1859,3 +2184,95 @@ def quota_usage_destroy(context, project_id, resource):
         quota_usage_ref = quota_usage_get(context, project_id, resource,
                                           session=session)
         quota_usage_ref.delete(session=session)
+
+
+###################
+
+
+_SHADOW_TABLE_PREFIX = 'shadow_'
+
+
+def _archive_deleted_rows_for_table(engine, table, shadow_table, max_rows,
+                                    deleted_before, purge):
+    """Archive up to max_rows soft-deleted rows of the table.
+
+    The rows are copied to the shadow table, unless purge is True, and
+    deleted in one short transaction that only touches the rows it
+    selected. Rows still referenced by a row of another table are left
+    for a later run.
+
+    :returns: the number of rows archived.
+    """
+    query = select([table]).where(table.c.deleted == True)
+    if deleted_before is not None:
+        query = query.where(table.c.deleted_at < deleted_before)
+    for referencing_table in table.metadata.tables.values():
+        for foreign_key in referencing_table.foreign_keys:
+            if foreign_key.column.table is not table:
+                continue
+            referencing = referencing_table.alias()
+            column = referencing.c[foreign_key.parent.name]
+            query = query.where(~exists().where(
+                    column == table.c[foreign_key.column.name]))
+    query = query.order_by(table.c.id).limit(max_rows)
+
+    conn = engine.connect()
+    try:
+        transaction = conn.begin()
+        try:
+            rows = conn.execute(query).fetchall()
+            if rows:
+                if not purge:
+                    conn.execute(shadow_table.insert(),
+                                 [dict(row) for row in rows])
+                conn.execute(table.delete().where(
+                        table.c.id.in_([row['id'] for row in rows])))
+            transaction.commit()
+        except IntegrityError:
+            # a reference to one of the rows was added after they were
+            # selected; the next run will leave that row out
+            transaction.rollback()
+            LOG.warn(_("Deleted rows of %s were referenced while being "
+                       "archived, skipping them"), table.name)
+            return 0
+        except Exception:
+            transaction.rollback()
+            raise
+    finally:
+        conn.close()
+    return len(rows)
+
+
+@require_admin_context
+def archive_deleted_rows(context, max_rows=None, purge=None):
+    if purge is None:
+        purge = FLAGS.deleted_rows_purge
+    deleted_before = None
+    if FLAGS.deleted_rows_retention_days > 0:
+        deleted_before = timeutils.utcnow() - datetime.timedelta(
+                days=FLAGS.deleted_rows_retention_days)
+
+    engine = get_engine()
+    meta = MetaData(bind=engine)
+    meta.reflect()
+    archived = {}
+    total = 0
+    # the referencing tables come first, so the rows of metadata go before the
+    # volumes they belong to.
+    for table in reversed(meta.sorted_tables):
+        shadow_table = meta.tables.get(_SHADOW_TABLE_PREFIX + table.name)
+        if shadow_table is None:
+            continue
+        archived[table.name] = 0
+        while max_rows is None or total < max_rows:
+            batch_size = FLAGS.deleted_rows_archive_batch_size
+            if max_rows is not None:
+                batch_size = min(batch_size, max_rows - total)
+            count = _archive_deleted_rows_for_table(engine, table,
+                                                    shadow_table, batch_size,
+                                                    deleted_before, purge)
+            archived[table.name] += count
+            total += count
+            if count < batch_size:
+                break
+    return archived
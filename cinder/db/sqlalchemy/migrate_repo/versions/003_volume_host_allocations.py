@@ -0,0 +1,95 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Boolean, Column, DateTime, func, Index, select
+from sqlalchemy import MetaData, Integer, String, Table
+
+from cinder.openstack.common import log as logging
+from cinder.openstack.common import timeutils
+
+LOG = logging.getLogger(__name__)
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    volumes = Table('volumes', meta, autoload=True)
+
+    # New table
+    volume_host_allocations = Table('volume_host_allocations', meta,
+            Column('created_at', DateTime(timezone=False)),
+            Column('updated_at', DateTime(timezone=False)),
+            Column('deleted_at', DateTime(timezone=False)),
+            Column('deleted', Boolean(create_constraint=True, name=None)),
+            Column('id', Integer(), primary_key=True),
+            Column('host',
+                   String(length=255, convert_unicode=True,
+                          assert_unicode=None, unicode_error=None,
+                          _warn_on_bytestring=False), index=True),
+            Column('volume_count', Integer(), nullable=False),
+            Column('allocated_gb', Integer(), nullable=False),
+            mysql_engine='InnoDB',
+            mysql_charset='utf8',
+            )
+
+    try:
+        volume_host_allocations.create()
+    except Exception:
+        LOG.error(_("Table |%s| not created!"),
+                  repr(volume_host_allocations))
+        raise
+
+    # A host has one live row, so the first allocations of a host can't be
+    # added twice by concurrent transactions.
+    try:
+        Index('volume_host_allocations_host_deleted_idx',
+              volume_host_allocations.c.host,
+              volume_host_allocations.c.deleted,
+              unique=True).create(migrate_engine)
+    except Exception:
+        LOG.error(_("Index volume_host_allocations_host_deleted_idx "
+                    "not created!"))
+        raise
+
+    # Count the volumes that already exist
+    query = select([volumes.c.host,
+                    func.count(volumes.c.id),
+                    func.sum(volumes.c.size)]).\
+            where(volumes.c.deleted == False).\
+            where(volumes.c.host != None).\
+            group_by(volumes.c.host)
+    now = timeutils.utcnow()
+    for host, volume_count, allocated_gb in query.execute():
+        volume_host_allocations.insert().execute(
+                created_at=now,
+                deleted=False,
+                host=host,
+                volume_count=volume_count,
+                allocated_gb=allocated_gb or 0)
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    volume_host_allocations = Table('volume_host_allocations', meta,
+                                    autoload=True)
+    try:
+        volume_host_allocations.drop()
+    except Exception:
+        LOG.error(_("volume_host_allocations table not dropped"))
+        raise
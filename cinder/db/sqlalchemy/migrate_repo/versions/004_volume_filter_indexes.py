@@ -0,0 +1,56 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Index, MetaData, Table
+
+from cinder.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    volumes = Table('volumes', meta, autoload=True)
+    volume_metadata = Table('volume_metadata', meta, autoload=True)
+
+    Index('volumes_project_id_status_idx',
+          volumes.c.project_id, volumes.c.status).create(migrate_engine)
+
+    if migrate_engine.name == 'mysql':
+        # utf8 key and value columns are too long to be indexed together by
+        # innodb, so index a prefix.
+        migrate_engine.execute('CREATE INDEX volume_metadata_key_value_idx '
+                               'ON volume_metadata (`key`(64), value(64))')
+    else:
+        Index('volume_metadata_key_value_idx',
+              volume_metadata.c.key,
+              volume_metadata.c.value).create(migrate_engine)
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    volumes = Table('volumes', meta, autoload=True)
+    volume_metadata = Table('volume_metadata', meta, autoload=True)
+
+    Index('volumes_project_id_status_idx',
+          volumes.c.project_id, volumes.c.status).drop(migrate_engine)
+    Index('volume_metadata_key_value_idx',
+          volume_metadata.c.key,
+          volume_metadata.c.value).drop(migrate_engine)
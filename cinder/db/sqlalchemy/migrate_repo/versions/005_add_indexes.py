@@ -0,0 +1,106 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Index, MetaData, String, Table
+
+from cinder.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+# each index matches the filters of the queries in cinder/db/sqlalchemy/api.py
+# that use it; model_query adds deleted to almost every query, so it follows
+# the equality columns.
+INDEXES = [
+    # volume_get_all_by_host, volume_host_allocation_refresh
+    ('volumes', 'volumes_host_deleted_idx', ['host', 'deleted']),
+    # volume_get_all_by_project, volume_data_get_for_project
+    ('volumes', 'volumes_project_id_deleted_created_at_idx',
+     ['project_id', 'deleted', 'created_at']),
+    # volume_get_all
+    ('volumes', 'volumes_deleted_created_at_idx', ['deleted', 'created_at']),
+    # volume_get_all_by_instance_uuid
+    ('volumes', 'volumes_instance_uuid_deleted_idx',
+     ['instance_uuid', 'deleted']),
+    # snapshot_get_all_for_volume
+    ('snapshots', 'snapshots_volume_id_deleted_idx',
+     ['volume_id', 'deleted']),
+    # snapshot_get_all_by_project
+    ('snapshots', 'snapshots_project_id_deleted_created_at_idx',
+     ['project_id', 'deleted', 'created_at']),
+    # volume_allocate_iscsi_target, iscsi_target_count_by_host
+    ('iscsi_targets', 'iscsi_targets_host_volume_id_idx',
+     ['host', 'volume_id']),
+    # volume_get_iscsi_target_num
+    ('iscsi_targets', 'iscsi_targets_volume_id_idx', ['volume_id']),
+    # volume_metadata_get, volume_metadata_get_item and the joined loads
+    ('volume_metadata', 'volume_metadata_volume_id_key_idx',
+     ['volume_id', 'key']),
+    # volume_type_extra_specs_get, volume_type_extra_specs_get_item
+    ('volume_type_extra_specs', 'volume_type_extra_specs_type_id_key_idx',
+     ['volume_type_id', 'key']),
+    # service_get_all_by_topic, service_get_all_volume_sorted
+    ('services', 'services_topic_disabled_idx', ['topic', 'disabled']),
+    # service_get_by_host_and_topic, service_get_all_by_host,
+    # service_get_by_args
+    ('services', 'services_host_topic_idx', ['host', 'topic']),
+    # quota_get, quota_get_all_by_project
+    ('quotas', 'quotas_project_id_deleted_idx', ['project_id', 'deleted']),
+    # reservation_get, reservation_commit, reservation_rollback
+    ('reservations', 'reservations_uuid_idx', ['uuid']),
+    # reservation_expire
+    ('reservations', 'reservations_deleted_expire_idx',
+     ['deleted', 'expire']),
+    ]
+
+# utf8 strings of 255 characters are too long to be indexed together by innodb,
+# so mysql indexes a prefix of them.
+MYSQL_PREFIX_LENGTH = 64
+
+
+def _mysql_column(column):
+    if (isinstance(column.type, String) and
+        (column.type.length or 0) > MYSQL_PREFIX_LENGTH):
+        return '`%s`(%d)' % (column.name, MYSQL_PREFIX_LENGTH)
+    return '`%s`' % column.name
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    for table_name, index_name, column_names in INDEXES:
+        table = Table(table_name, meta, autoload=True)
+        columns = [table.c[column_name] for column_name in column_names]
+        try:
+            if migrate_engine.name == 'mysql':
+                migrate_engine.execute('CREATE INDEX %s ON %s (%s)' %
+                        (index_name, table_name,
+                         ', '.join(_mysql_column(c) for c in columns)))
+            else:
+                Index(index_name, *columns).create(migrate_engine)
+        except Exception:
+            LOG.error(_("Index %s not created!"), index_name)
+            raise
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    for table_name, index_name, column_names in reversed(INDEXES):
+        table = Table(table_name, meta, autoload=True)
+        columns = [table.c[column_name] for column_name in column_names]
+        Index(index_name, *columns).drop(migrate_engine)
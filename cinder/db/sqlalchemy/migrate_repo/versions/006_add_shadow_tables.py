@@ -0,0 +1,58 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Column, MetaData, Table
+
+from cinder.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+SHADOW_TABLE_PREFIX = 'shadow_'
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+    meta.reflect(migrate_engine)
+
+    # a shadow table has the columns of its table but none of its indexes or
+    # foreign keys, so archived rows don't depend on each other.
+    for table in meta.sorted_tables:
+        if 'deleted' not in table.c:
+            continue
+        columns = [Column(column.name, column.type,
+                          primary_key=column.primary_key,
+                          autoincrement=False)
+                   for column in table.columns]
+        shadow_table = Table(SHADOW_TABLE_PREFIX + table.name, meta,
+                             *columns,
+                             mysql_engine='InnoDB',
+                             mysql_charset='utf8')
+        try:
+            shadow_table.create()
+        except Exception:
+            LOG.error(_("Table |%s| not created!"), repr(shadow_table))
+            raise
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+    meta.reflect(migrate_engine)
+
+    for table in meta.sorted_tables:
+        if table.name.startswith(SHADOW_TABLE_PREFIX):
+            table.drop()
@@ -172,6 +172,20 @@ class VolumeMetadata(BASE, CinderBase):
                           'VolumeMetadata.deleted == False)')
 
 
+class VolumeHostAllocation(BASE, CinderBase):
+    """Represents the number and size of the volumes placed on a host."""
+
+    __tablename__ = 'volume_host_allocations'
+    __table_args__ = (schema.UniqueConstraint("host", "deleted"),
+                      {'mysql_engine': 'InnoDB'})
+    id = Column(Integer, primary_key=True)
+
+    host = Column(String(255), index=True)
+
+    volume_count = Column(Integer)
+    allocated_gb = Column(Integer)
+
+
 class VolumeTypes(BASE, CinderBase):
     """Represent possible volume_types of volumes offered"""
     __tablename__ = "volume_types"
@@ -375,6 +389,7 @@ def register_models():
               SMFlavors,
               SMVolume,
               Volume,
+              VolumeHostAllocation,
               VolumeMetadata,
               VolumeTypeExtraSpecs,
               VolumeTypes,
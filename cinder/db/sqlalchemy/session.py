@@ -18,12 +18,15 @@
 
 """Session Handling for SQLAlchemy backend."""
 
+import contextlib
 import time
 
+from eventlet import corolocal
 import sqlalchemy.interfaces
 import sqlalchemy.orm
 from sqlalchemy.exc import DisconnectionError, OperationalError
-from sqlalchemy.pool import NullPool, StaticPool
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import NullPool, QueuePool, StaticPool
 
 import cinder.exception
 import cinder.flags as flags
@@ -35,40 +38,169 @@ LOG = logging.getLogger(__name__)
 
 _ENGINE = None
 _MAKER = None
+_REPLICA_ENGINE = None
+_REPLICA_MAKER = None
 
+# the context of the DB API call running in each greenthread and whether its
+# sessions use the replica, see db_call().
+_CALL = corolocal.local()
 
-def get_session(autocommit=True, expire_on_commit=False):
-    """Return a SQLAlchemy session."""
-    global _MAKER
+_POOL_STATS = {'checkouts': 0,
+               'overflow_checkouts': 0,
+               'timeouts': 0,
+               'wait_seconds': 0.0,
+               'max_wait_seconds': 0.0,
+               'pings': 0,
+               'invalidations': 0}
+_POOL_STATS_LOGGED_AT = [None]
 
-    if _MAKER is None:
-        engine = get_engine()
-        _MAKER = get_maker(engine, autocommit, expire_on_commit)
 
-    session = _MAKER()
+def get_pool_stats():
+    """Return the connection pool counters of this process.
+
+    checkouts counts the connections handed out by the pool, and
+    overflow_checkouts the ones opened beyond sql_max_pool_size.
+    wait_seconds and max_wait_seconds are the total and the longest time
+    spent getting a connection, timeouts the checkouts that gave up after
+    sql_pool_timeout. pings counts the liveness checks and invalidations
+    the dead connections they found.
+    """
+    return dict(_POOL_STATS)
+
+
+def _log_pool_stats():
+    interval = FLAGS.sql_pool_stats_interval
+    if not interval:
+        return
+    now = time.time()
+    if _POOL_STATS_LOGGED_AT[0] is None:
+        _POOL_STATS_LOGGED_AT[0] = now
+    elif now - _POOL_STATS_LOGGED_AT[0] >= interval:
+        _POOL_STATS_LOGGED_AT[0] = now
+        LOG.info(_("Database pool: %(checkouts)d checkouts, "
+                   "%(overflow_checkouts)d overflow, %(timeouts)d "
+                   "timeouts, %(wait_seconds).3fs waited (max "
+                   "%(max_wait_seconds).3fs), %(pings)d pings, "
+                   "%(invalidations)d invalidations") % _POOL_STATS)
+
+
+class StatsQueuePool(QueuePool):
+    """QueuePool that counts checkouts and the time spent waiting."""
+
+    def _do_get(self):
+        start = time.time()
+        try:
+            conn = super(StatsQueuePool, self)._do_get()
+        except TimeoutError:
+            _POOL_STATS['timeouts'] += 1
+            raise
+        finally:
+            wait = time.time() - start
+            _POOL_STATS['wait_seconds'] += wait
+            _POOL_STATS['max_wait_seconds'] = max(
+                    _POOL_STATS['max_wait_seconds'], wait)
+        _POOL_STATS['checkouts'] += 1
+        if self.checkedout() > self.size():
+            _POOL_STATS['overflow_checkouts'] += 1
+        _log_pool_stats()
+        return conn
+
+
+def get_session(autocommit=True, expire_on_commit=False, replica=None):
+    """Return a SQLAlchemy session.
+
+    The session reads from sql_replica_connection, if it is set, when
+    replica is True, or when it is None and the DB API call running in
+    this greenthread is replica safe.
+    """
+    global _MAKER, _REPLICA_MAKER
+
+    if replica is None:
+        replica = getattr(_CALL, 'replica', False)
+
+    if replica and FLAGS.sql_replica_connection:
+        if _REPLICA_MAKER is None:
+            engine = get_replica_engine()
+            _REPLICA_MAKER = get_maker(engine, autocommit, expire_on_commit)
+        session = _REPLICA_MAKER()
+    else:
+        if _MAKER is None:
+            engine = get_engine()
+            _MAKER = get_maker(engine, autocommit, expire_on_commit)
+        session = _MAKER()
+
     session.query = cinder.exception.wrap_db_error(session.query)
     session.flush = cinder.exception.wrap_db_error(session.flush)
     return session
 
 
+@contextlib.contextmanager
+def db_call(context, replica=False):
+    """Route the sessions of a DB API call and track its writes.
+
+    Sessions from get_session() inside the block use the replica if
+    replica is True, or if the block is nested in a replica safe call
+    under the same context, and nothing has been written under the
+    context yet. A statement other than a SELECT run on the primary
+    inside the block sets db_written on the context, so the reads that
+    follow it under the same context see the write.
+    """
+    saved = (getattr(_CALL, 'context', None),
+             getattr(_CALL, 'replica', False))
+    replica = replica or (saved[0] is context and saved[1])
+    _CALL.context = context
+    _CALL.replica = replica and not getattr(context, 'db_written', False)
+    try:
+        yield
+    finally:
+        _CALL.context, _CALL.replica = saved
+
+
+def write_listener(conn, cursor, statement, parameters, context,
+                   executemany):
+    """Mark the context of the running DB API call as written to."""
+    call_context = getattr(_CALL, 'context', None)
+    if (call_context is not None and
+        not statement.lstrip().upper().startswith('SELECT')):
+        call_context.db_written = True
+
+
 def synchronous_switch_listener(dbapi_conn, connection_rec):
     """Switch sqlite connections to non-synchronous mode"""
     dbapi_conn.execute("PRAGMA synchronous = OFF")
 
 
+def checkin_listener(dbapi_conn, connection_rec):
+    """Remember when the connection went back to the pool."""
+    connection_rec.info['checked_in_at'] = time.time()
+
+
 def ping_listener(dbapi_conn, connection_rec, connection_proxy):
     """
     Ensures that MySQL connections checked out of the
     pool are alive.
 
+    Connections that were checked in less than sql_ping_interval
+    seconds ago are handed out without a round trip, the others are
+    checked with a protocol level ping rather than a query.
+
     Borrowed from:
     http://groups.google.com/group/sqlalchemy/msg/a4ce563d802c929f
     """
+    checked_in_at = connection_rec.info.get('checked_in_at')
+    if (checked_in_at is not None and
+        time.time() - checked_in_at < FLAGS.sql_ping_interval):
+        return
+    _POOL_STATS['pings'] += 1
     try:
-        dbapi_conn.cursor().execute('select 1')
+        if hasattr(dbapi_conn, 'ping'):
+            dbapi_conn.ping(False)
+        else:
+            dbapi_conn.cursor().execute('select 1')
     except dbapi_conn.OperationalError, ex:
         if ex.args[0] in (2006, 2013, 2014, 2045, 2055):
             LOG.warn('Got mysql server has gone away: %s', ex)
+            _POOL_STATS['invalidations'] += 1
             raise DisconnectionError("Database server went away")
         else:
             raise
@@ -89,59 +221,80 @@ def get_engine():
     """Return a SQLAlchemy engine."""
     global _ENGINE
     if _ENGINE is None:
-        connection_dict = sqlalchemy.engine.url.make_url(FLAGS.sql_connection)
+        _ENGINE = _create_engine(FLAGS.sql_connection)
+        sqlalchemy.event.listen(_ENGINE, 'before_cursor_execute',
+                                write_listener)
+    return _ENGINE
 
-        engine_args = {
-            "pool_recycle": FLAGS.sql_idle_timeout,
-            "echo": False,
-            'convert_unicode': True,
-        }
 
-        # Map our SQL debug level to SQLAlchemy's options
-        if FLAGS.sql_connection_debug >= 100:
-            engine_args['echo'] = 'debug'
-        elif FLAGS.sql_connection_debug >= 50:
-            engine_args['echo'] = True
+def get_replica_engine():
+    """Return the SQLAlchemy engine of sql_replica_connection."""
+    global _REPLICA_ENGINE
+    if _REPLICA_ENGINE is None:
+        _REPLICA_ENGINE = _create_engine(FLAGS.sql_replica_connection)
+    return _REPLICA_ENGINE
 
-        if "sqlite" in connection_dict.drivername:
-            engine_args["poolclass"] = NullPool
 
-            if FLAGS.sql_connection == "sqlite://":
-                engine_args["poolclass"] = StaticPool
-                engine_args["connect_args"] = {'check_same_thread': False}
+def _create_engine(sql_connection):
+    connection_dict = sqlalchemy.engine.url.make_url(sql_connection)
 
-        _ENGINE = sqlalchemy.create_engine(FLAGS.sql_connection, **engine_args)
+    engine_args = {
+        "pool_recycle": FLAGS.sql_idle_timeout,
+        "echo": False,
+        'convert_unicode': True,
+    }
 
-        if 'mysql' in connection_dict.drivername:
-            sqlalchemy.event.listen(_ENGINE, 'checkout', ping_listener)
-        elif "sqlite" in connection_dict.drivername:
-            if not FLAGS.sqlite_synchronous:
-                sqlalchemy.event.listen(_ENGINE, 'connect',
-                                        synchronous_switch_listener)
+    # Map our SQL debug level to SQLAlchemy's options
+    if FLAGS.sql_connection_debug >= 100:
+        engine_args['echo'] = 'debug'
+    elif FLAGS.sql_connection_debug >= 50:
+        engine_args['echo'] = True
 
-        try:
-            _ENGINE.connect()
-        except OperationalError, e:
-            if not is_db_connection_error(e.args[0]):
-                raise
-
-            remaining = FLAGS.sql_max_retries
-            if remaining == -1:
-                remaining = 'infinite'
-            while True:
-                msg = _('SQL connection failed. %s attempts left.')
-                LOG.warn(msg % remaining)
-                if remaining != 'infinite':
-                    remaining -= 1
-                time.sleep(FLAGS.sql_retry_interval)
-                try:
-                    _ENGINE.connect()
-                    break
-                except OperationalError, e:
-                    if (remaining != 'infinite' and remaining == 0) or \
-                       not is_db_connection_error(e.args[0]):
-                        raise
-    return _ENGINE
+    if "sqlite" in connection_dict.drivername:
+        engine_args["poolclass"] = NullPool
+
+        if sql_connection == "sqlite://":
+            engine_args["poolclass"] = StaticPool
+            engine_args["connect_args"] = {'check_same_thread': False}
+    else:
+        engine_args["poolclass"] = StatsQueuePool
+        engine_args["pool_size"] = FLAGS.sql_max_pool_size
+        engine_args["max_overflow"] = FLAGS.sql_max_overflow
+        engine_args["pool_timeout"] = FLAGS.sql_pool_timeout
+
+    engine = sqlalchemy.create_engine(sql_connection, **engine_args)
+
+    if 'mysql' in connection_dict.drivername:
+        sqlalchemy.event.listen(engine, 'checkout', ping_listener)
+        sqlalchemy.event.listen(engine, 'checkin', checkin_listener)
+    elif "sqlite" in connection_dict.drivername:
+        if not FLAGS.sqlite_synchronous:
+            sqlalchemy.event.listen(engine, 'connect',
+                                    synchronous_switch_listener)
+
+    try:
+        engine.connect()
+    except OperationalError, e:
+        if not is_db_connection_error(e.args[0]):
+            raise
+
+        remaining = FLAGS.sql_max_retries
+        if remaining == -1:
+            remaining = 'infinite'
+        while True:
+            msg = _('SQL connection failed. %s attempts left.')
+            LOG.warn(msg % remaining)
+            if remaining != 'infinite':
+                remaining -= 1
+            time.sleep(FLAGS.sql_retry_interval)
+            try:
+                engine.connect()
+                break
+            except OperationalError, e:
+                if (remaining != 'infinite' and remaining == 0) or \
+                   not is_db_connection_error(e.args[0]):
+                    raise
+    return engine
 
 
 def get_maker(engine, autocommit=True, expire_on_commit=False):
@@ -209,10 +209,19 @@ class ImageUnacceptable(Invalid):
     message = _("Image %(image_id)s is unacceptable: %(reason)s")
 
 
+class ImageChecksumMismatch(Invalid):
+    message = _("Downloaded image %(image_id)s has checksum %(actual)s, "
+                "expected %(expected)s")
+
+
 class InvalidUUID(Invalid):
     message = _("Expected a uuid but received %(uuid).")
 
 
+class InvalidSortKey(Invalid):
+    message = _("Sort key supplied was not valid.")
+
+
 class NotFound(CinderException):
     message = _("Resource could not be found.")
     code = 404
@@ -292,6 +301,10 @@ class ImageNotFound(NotFound):
     message = _("Image %(image_id)s could not be found.")
 
 
+class MarkerNotFound(NotFound):
+    message = _("Marker %(marker)s could not be found.")
+
+
 class ServiceNotFound(NotFound):
     message = _("Service %(service_id)s could not be found.")
 
@@ -86,6 +86,11 @@ core_opts = [
                default=0,
                help='Verbosity of SQL debugging information. 0=None, '
                     '100=Everything'),
+    cfg.StrOpt('sql_replica_connection',
+               default=None,
+               help='The SQLAlchemy connection string of a read-only '
+                    'replica of the database. Replica safe DB API calls '
+                    'read from it if it is set'),
     cfg.StrOpt('api_paste_config',
                default="api-paste.ini",
                help='File name for the paste.deploy config for cinder-api'),
@@ -211,6 +216,26 @@ global_opts = [
     cfg.IntOpt('sql_retry_interval',
                default=10,
                help='interval between retries of opening a sql connection'),
+    cfg.IntOpt('sql_max_pool_size',
+               default=5,
+               help='maximum number of connections kept open in the sql '
+                    'connection pool'),
+    cfg.IntOpt('sql_max_overflow',
+               default=10,
+               help='number of connections that can be opened beyond '
+                    'sql_max_pool_size when the pool is exhausted'),
+    cfg.IntOpt('sql_pool_timeout',
+               default=30,
+               help='seconds to wait for a connection from the pool '
+                    'before giving up'),
+    cfg.IntOpt('sql_ping_interval',
+               default=10,
+               help='seconds a pooled MySQL connection can be idle before '
+                    'it is pinged on checkout. 0 pings on every checkout'),
+    cfg.IntOpt('sql_pool_stats_interval',
+               default=0,
+               help='seconds between logs of the sql connection pool '
+                    'statistics. 0 disables them'),
     cfg.StrOpt('volume_manager',
                default='cinder.volume.manager.VolumeManager',
                help='full class name for the Manager for volume'),
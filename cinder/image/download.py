@@ -0,0 +1,222 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Parallel ranged download of image data from Glance.
+
+The image is split into byte ranges that are fetched concurrently and
+written at their offsets by writers the caller opens. Ranges are hashed in
+order as they complete, so the checksum is known as soon as the last range
+arrives. A range that fails part way is resumed from the last byte received
+instead of restarting the whole image. Hashing and writing a range yield to
+the other green threads after every block.
+
+"""
+
+import collections
+import hashlib
+import httplib
+import sys
+import time
+
+import eventlet
+
+from cinder import exception
+from cinder import flags
+from cinder.openstack.common import cfg
+from cinder.openstack.common import log as logging
+
+
+LOG = logging.getLogger(__name__)
+
+download_opts = [
+    cfg.IntOpt('glance_download_ranges',
+               default=4,
+               help='Number of byte ranges of an image downloaded '
+                    'concurrently'),
+    cfg.IntOpt('glance_download_range_mb',
+               default=8,
+               help='Size of the byte ranges an image is downloaded in'),
+    cfg.IntOpt('glance_download_range_retries',
+               default=3,
+               help='Number of times a failed byte range is resumed before '
+                    'the download fails'),
+    ]
+
+FLAGS = flags.FLAGS
+FLAGS.register_opts(download_opts)
+
+CHUNK_SIZE = 64 * 1024
+HASH_SIZE = 1024 * 1024
+
+
+class RangesNotSupported(Exception):
+    """The server sent the whole image instead of a byte range."""
+    pass
+
+
+class RangedDownload(object):
+    """Downloads the data of an image from a Glance v1 server.
+
+    open_writer(offset) must return a context manager with a write method
+    that writes data from offset onwards. An offset of None means the whole
+    image is written in one stream.
+    """
+
+    def __init__(self, host, port, image_id, headers=None):
+        self.host = host
+        self.port = port
+        self.image_id = image_id
+        self.headers = headers or {}
+        self.retries = 0
+
+    def _open(self, start=None, end=None):
+        """Requests bytes start to end of the image, or all of it."""
+        headers = dict(self.headers)
+        if start is not None:
+            headers['Range'] = 'bytes=%d-%d' % (start, end - 1)
+        conn = httplib.HTTPConnection(self.host, self.port)
+        conn.request('GET', '/v1/images/%s' % self.image_id,
+                     headers=headers)
+        resp = conn.getresponse()
+        if resp.status == 404:
+            conn.close()
+            raise exception.ImageNotFound(image_id=self.image_id)
+        if resp.status in (401, 403):
+            conn.close()
+            raise exception.ImageNotAuthorized(image_id=self.image_id)
+        if resp.status not in (200, 206):
+            conn.close()
+            raise httplib.HTTPException(_("Unexpected status %d") %
+                                        resp.status)
+        return conn, resp
+
+    def _fetch_range(self, open_writer, start, end):
+        """Writes bytes start to end of the image and returns them."""
+        chunks = []
+        received = 0
+        attempt = 0
+        while start + received < end:
+            try:
+                conn, resp = self._open(start + received, end)
+                try:
+                    if resp.status != 206:
+                        raise RangesNotSupported()
+                    while start + received < end:
+                        chunk = resp.read(CHUNK_SIZE)
+                        if not chunk:
+                            raise IOError(_("Connection closed early"))
+                        chunks.append(chunk)
+                        received += len(chunk)
+                finally:
+                    conn.close()
+            except (IOError, httplib.HTTPException), e:
+                attempt += 1
+                if attempt > FLAGS.glance_download_range_retries:
+                    raise exception.GlanceConnectionFailed(host=self.host,
+                                                           port=self.port,
+                                                           reason=str(e))
+                self.retries += 1
+                offset = start + received
+                LOG.warn(_("Error downloading image %(image_id)s at offset "
+                           "%(offset)d, resuming: %(e)s") %
+                         {'image_id': self.image_id, 'offset': offset,
+                          'e': e})
+                time.sleep(1)
+        data = ''.join(chunks)[:end - start]
+        with open_writer(start) as writer:
+            writer.write(data)
+        return data
+
+    def _range_worker(self, open_writer, start, end):
+        # hand failures to the waiter instead of letting the hub print them.
+        try:
+            return self._fetch_range(open_writer, start, end), None
+        except Exception:
+            return None, sys.exc_info()
+
+    @staticmethod
+    def _hash_next(md5, pending):
+        data, exc_info = pending.popleft().wait()
+        if exc_info:
+            raise exc_info[0], exc_info[1], exc_info[2]
+        for offset in xrange(0, len(data), HASH_SIZE):
+            md5.update(buffer(data, offset, HASH_SIZE))
+            eventlet.sleep(0)
+
+    def _fetch_ranges(self, open_writer, size):
+        md5 = hashlib.md5()
+        range_size = FLAGS.glance_download_range_mb * 1024 * 1024
+        window = max(1, FLAGS.glance_download_ranges)
+        pool = eventlet.GreenPool(window)
+        pending = collections.deque()
+        try:
+            # at most window ranges are kept in memory until all ranges before
+            # them have been hashed.
+            for start in xrange(0, size, range_size):
+                pending.append(pool.spawn(self._range_worker, open_writer,
+                                          start,
+                                          min(start + range_size, size)))
+                if len(pending) >= window:
+                    self._hash_next(md5, pending)
+            while pending:
+                self._hash_next(md5, pending)
+        except Exception:
+            for thread in pending:
+                thread.kill()
+            raise
+        return md5
+
+    def _fetch_stream(self, open_writer):
+        md5 = hashlib.md5()
+        conn, resp = self._open()
+        try:
+            with open_writer(None) as writer:
+                while True:
+                    chunk = resp.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    writer.write(chunk)
+                    md5.update(chunk)
+        finally:
+            conn.close()
+        return md5
+
+    def fetch(self, open_writer, size=None, checksum=None):
+        """Writes the image with writers from open_writer.
+
+        The image is downloaded in ranges if its size is known and the
+        server supports them. If a checksum is given it is verified.
+        """
+        start_time = time.time()
+        md5 = None
+        if size:
+            try:
+                md5 = self._fetch_ranges(open_writer, size)
+            except RangesNotSupported:
+                LOG.debug(_("Glance server %(host)s:%(port)s does not "
+                            "support ranges") % self.__dict__)
+        if md5 is None:
+            md5 = self._fetch_stream(open_writer)
+        if checksum and md5.hexdigest() != checksum:
+            raise exception.ImageChecksumMismatch(image_id=self.image_id,
+                                                  actual=md5.hexdigest(),
+                                                  expected=checksum)
+        stats = {'seconds': time.time() - start_time,
+                 'retries': self.retries}
+        LOG.debug(_("Downloaded image %(image_id)s: %(stats)s") %
+                  {'image_id': self.image_id, 'stats': stats})
+        return stats
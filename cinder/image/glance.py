@@ -31,6 +31,7 @@ import glanceclient.exc
 
 from cinder import exception
 from cinder import flags
+from cinder.image import download
 from cinder.openstack.common import jsonutils
 from cinder.openstack.common import log as logging
 from cinder.openstack.common import timeutils
@@ -105,6 +106,14 @@ class GlanceClientWrapper(object):
         self.host, self.port = self.api_servers.next()
         return _create_glance_client(context, self.host, self.port, version)
 
+    def get_endpoint(self):
+        """Returns the host and port of a glance server for raw requests."""
+        if self.client is not None:
+            return self.host, self.port
+        if self.api_servers is None:
+            self.api_servers = get_api_servers()
+        return self.api_servers.next()
+
     def call(self, context, version, method, *args, **kwargs):
         """
         Call a glance client method.  If we get a connection error,
@@ -208,6 +217,21 @@ class GlanceImageService(object):
         for chunk in image_chunks:
             data.write(chunk)
 
+    def download_ranges(self, context, image_id, open_writer):
+        """Writes the image with writers returned by open_writer(offset).
+
+        The image is fetched in concurrent byte ranges and its checksum is
+        verified, see cinder.image.download.
+        """
+        image_meta = self.show(context, image_id)
+        host, port = self._client.get_endpoint()
+        headers = {}
+        if FLAGS.auth_strategy == 'keystone':
+            headers['X-Auth-Token'] = context.auth_token
+        fetcher = download.RangedDownload(host, port, image_id, headers)
+        return fetcher.fetch(open_writer, image_meta.get('size'),
+                             image_meta.get('checksum'))
+
     def create(self, context, image_meta, data=None):
         """Store the image data and return the new image object."""
         sent_service_image_meta = self._translate_to_glance(image_meta)
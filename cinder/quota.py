@@ -50,6 +50,10 @@ quota_opts = [
     cfg.StrOpt('quota_driver',
                default='cinder.quota.DbQuotaDriver',
                help='default driver to use for quota checks'),
+    cfg.IntOpt('quota_limit_cache_ttl',
+               default=30,
+               help='number of seconds the quota limits checked by '
+                    'reserve and limit_check are cached for, 0 to disable'),
     ]
 
 FLAGS = flags.FLAGS
@@ -63,6 +67,11 @@ class DbQuotaDriver(object):
     database.
     """
 
+    def __init__(self):
+        # (project_id, quota_class) -> (expire, project quotas, class quotas);
+        # the defaults come from the flags.
+        self._limits = {}
+
     def get_by_project(self, context, project_id, resource):
         """Get a specific quota by project."""
 
@@ -201,12 +210,67 @@ class DbQuotaDriver(object):
             unknown = desired - set(sub_resources.keys())
             raise exception.QuotaResourceUnknown(unknown=sorted(unknown))
 
-        # Grab and return the quotas (without usages)
-        quotas = self.get_project_quotas(context, sub_resources,
-                                         context.project_id,
-                                         context.quota_class, usages=False)
+        # Grab and return the limits (without usages)
+        project_quotas, class_quotas = self._get_limits(context)
+
+        return dict((k, project_quotas.get(k, class_quotas.get(k, v.default)))
+                    for k, v in sub_resources.items())
+
+    def _get_limits(self, context):
+        """
+        A helper method which returns the project and quota class
+        limits of the context from the database, caching them for
+        --quota_limit_cache_ttl seconds.
+
+        :param context: The request context, for access checks.
+        """
+
+        key = (context.project_id, context.quota_class)
+        now = timeutils.utcnow()
+        cached = self._limits.get(key)
+        if cached and cached[0] > now:
+            return cached[1:]
+
+        project_quotas = db.quota_get_all_by_project(context,
+                                                     context.project_id)
+        if context.quota_class:
+            class_quotas = db.quota_class_get_all_by_name(context,
+                                                          context.quota_class)
+        else:
+            class_quotas = {}
+
+        ttl = FLAGS.quota_limit_cache_ttl
+        if ttl > 0:
+            # Every project making requests adds an entry, so drop the
+            # expired ones rather than keep them for the process' life.
+            for cached_key in [k for k, v in self._limits.items()
+                               if v[0] <= now]:
+                del self._limits[cached_key]
+            expire = now + datetime.timedelta(seconds=ttl)
+            self._limits[key] = (expire, project_quotas, class_quotas)
 
-        return dict((k, v['limit']) for k, v in quotas.items())
+        return project_quotas, class_quotas
+
+    def invalidate_limits(self, project_id=None, quota_class=None):
+        """
+        Drop the cached limits of a project and of a quota class, or
+        all of them if neither is given.
+
+        The cache is per process, so other processes keep using their
+        cached limits until they expire.
+
+        :param project_id: The ID of the project whose quotas changed.
+        :param quota_class: The name of the quota class which changed.
+        """
+
+        if project_id is None and quota_class is None:
+            self._limits.clear()
+            return
+
+        for key in self._limits.keys():
+            if ((project_id is not None and key[0] == project_id) or
+                (quota_class is not None and key[1] == quota_class)):
+                self._limits.pop(key, None)
 
     def limit_check(self, context, resources, values):
         """Check simple quota limits.
@@ -333,6 +397,7 @@ class DbQuotaDriver(object):
         """
 
         db.quota_destroy_all_by_project(context, project_id)
+        self.invalidate_limits(project_id=project_id)
 
     def expire(self, context):
         """Expire reservations.
@@ -711,6 +776,20 @@ class QuotaEngine(object):
 
         self._driver.destroy_all_by_project(context, project_id)
 
+    def invalidate_limits(self, project_id=None, quota_class=None):
+        """
+        Drop the cached limits of a project and of a quota class, or
+        all of them if neither is given.
+
+        :param project_id: The ID of the project whose quotas changed.
+        :param quota_class: The name of the quota class which changed.
+        """
+
+        # drivers that don't cache limits don't need to implement this
+        invalidate_limits = getattr(self._driver, 'invalidate_limits', None)
+        if invalidate_limits is not None:
+            invalidate_limits(project_id=project_id, quota_class=quota_class)
+
     def expire(self, context):
         """Expire reservations.
 
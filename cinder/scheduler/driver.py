@@ -96,6 +96,10 @@ class Scheduler(object):
         self.host_manager.update_service_capabilities(service_name,
                 host, capabilities)
 
+    def update_service_states(self, context):
+        """Refresh the state of the services known to the HostManager."""
+        self.host_manager.update_service_states(context)
+
     def hosts_up(self, context, topic):
         """Return the list of hosts that have a running service for topic."""
 
@@ -104,6 +108,20 @@ class Scheduler(object):
                 for service in services
                 if utils.service_is_up(service)]
 
+    def schedule_create_volumes(self, context, volume_ids, **kwargs):
+        """Place several volumes, one at a time unless overridden."""
+        for volume_id in volume_ids:
+            try:
+                if hasattr(self, 'schedule_create_volume'):
+                    self.schedule_create_volume(context, volume_id, **kwargs)
+                else:
+                    self.schedule(context, FLAGS.volume_topic,
+                                  'create_volume', volume_id=volume_id,
+                                  **kwargs)
+            except Exception:
+                LOG.exception(_("Failed to schedule volume %s"), volume_id)
+                db.volume_update(context, volume_id, {'status': 'error'})
+
     def schedule(self, context, topic, method, *_args, **_kwargs):
         """Must override schedule method for scheduler to work."""
         raise NotImplementedError(_("Must implement a fallback schedule"))
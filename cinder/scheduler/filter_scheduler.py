@@ -0,0 +1,203 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+The FilterScheduler is for creating volumes.
+
+It filters the hosts known to the HostManager down to those that can take
+the volume, weighs them and picks the best one. Host selection only uses
+the host states cached in memory.
+"""
+
+from cinder import db
+from cinder import exception
+from cinder import flags
+from cinder.openstack.common import cfg
+from cinder.openstack.common import importutils
+from cinder.openstack.common import log as logging
+from cinder.openstack.common import timeutils
+from cinder.scheduler import chance
+from cinder.scheduler import driver
+from cinder.scheduler import filters
+from cinder.scheduler import weights
+
+
+LOG = logging.getLogger(__name__)
+
+filter_scheduler_opts = [
+    cfg.ListOpt('scheduler_default_filters',
+                default=['AvailabilityZoneFilter',
+                         'CapacityFilter',
+                         'CapabilitiesFilter',
+                         'ServiceLivenessFilter'],
+                help='Host filters used by the filter scheduler, either '
+                     'class names from cinder.scheduler.filters or full '
+                     'class paths'),
+    cfg.ListOpt('scheduler_default_weighers',
+                default=['FreeCapacityWeigher',
+                         'VolumeCountWeigher'],
+                help='Host weighers used by the filter scheduler, either '
+                     'class names from cinder.scheduler.weights or full '
+                     'class paths'),
+    ]
+
+FLAGS = flags.FLAGS
+FLAGS.register_opts(filter_scheduler_opts)
+
+
+def _load_objects(module, names):
+    objects = []
+    for name in names:
+        if '.' in name:
+            cls = importutils.import_class(name)
+        else:
+            cls = getattr(module, name)
+        objects.append(cls())
+    return objects
+
+
+class FilterScheduler(chance.ChanceScheduler):
+    """Scheduler that places volumes with host filters and weighers."""
+
+    def __init__(self, *args, **kwargs):
+        super(FilterScheduler, self).__init__(*args, **kwargs)
+        self.filters = _load_objects(filters,
+                                     FLAGS.scheduler_default_filters)
+        self.weighers = _load_objects(weights,
+                                      FLAGS.scheduler_default_weighers)
+
+    def _get_filter_properties(self, context, volume_ref,
+                               type_extra_specs=None, **kwargs):
+        zone = volume_ref.get('availability_zone')
+        if zone:
+            zone = zone.partition(':')[0]
+        extra_specs = {}
+        volume_type_id = volume_ref.get('volume_type_id')
+        if volume_type_id:
+            if type_extra_specs is None:
+                type_extra_specs = {}
+            if volume_type_id not in type_extra_specs:
+                type_extra_specs[volume_type_id] = \
+                        db.volume_type_extra_specs_get(context, volume_type_id)
+            extra_specs = type_extra_specs[volume_type_id]
+        filter_properties = kwargs.get('filter_properties') or {}
+        return {'size': volume_ref['size'],
+                'availability_zone': zone,
+                'extra_specs': extra_specs,
+                'ignore_hosts': filter_properties.get('ignore_hosts', [])}
+
+    def filter_hosts(self, host_states, filter_properties):
+        """Return the host states that pass all filters."""
+        ignore_hosts = filter_properties.get('ignore_hosts')
+        if ignore_hosts:
+            host_states = [host_state for host_state in host_states
+                           if host_state.host not in ignore_hosts]
+        for host_filter in self.filters:
+            host_states = host_filter.filter_all(host_states,
+                                                 filter_properties)
+            if not host_states:
+                break
+        return host_states
+
+    def weigh_hosts(self, host_states, filter_properties):
+        """Return the host state with the highest weight."""
+        totals = [0.0] * len(host_states)
+        for weigher in self.weighers:
+            scores = weigher.weigh_all(host_states, filter_properties)
+            totals = [total + score for total, score in zip(totals, scores)]
+        best = max(xrange(len(host_states)), key=totals.__getitem__)
+        return host_states[best]
+
+    def _get_host_states(self, context):
+        """Return the host states, checking any new hosts' services."""
+        host_states = self.host_manager.get_all_host_states()
+        if [h for h in host_states if h.service_up is None]:
+            # hosts that reported since the services were last checked
+            self.host_manager.update_service_states(context)
+        return host_states
+
+    def _select_host(self, context, volume_ref, host_states=None,
+                     type_extra_specs=None, **kwargs):
+        filter_properties = self._get_filter_properties(context, volume_ref,
+                type_extra_specs=type_extra_specs, **kwargs)
+        if host_states is None:
+            host_states = self._get_host_states(context)
+        if not host_states:
+            msg = _("No volume host has reported its capabilities")
+            raise exception.NoValidHost(reason=msg)
+        host_states = self.filter_hosts(host_states, filter_properties)
+        if not host_states:
+            msg = _("No host passed the filters")
+            raise exception.NoValidHost(reason=msg)
+        host_state = self.weigh_hosts(host_states, filter_properties)
+        host_state.consume_from_volume(volume_ref)
+        return host_state.host
+
+    def schedule_create_volume(self, context, volume_id, **_kwargs):
+        """Picks the best host that can take the volume."""
+        volume_ref = db.volume_get(context, volume_id)
+
+        availability_zone = volume_ref.get('availability_zone') or ''
+        host = availability_zone.partition(':')[2]
+        if host and context.is_admin:
+            host_state = self.host_manager.host_state_map.get(host)
+            if host_state is not None and host_state.service_up is None:
+                self.host_manager.update_service_states(context.elevated())
+            if host_state is None or not host_state.service_up:
+                raise exception.WillNotSchedule(host=host)
+            host_state.consume_from_volume(volume_ref)
+        else:
+            host = self._select_host(context.elevated(), volume_ref,
+                                     **_kwargs)
+
+        driver.cast_to_volume_host(context, host, 'create_volume',
+                volume_id=volume_id, **_kwargs)
+        return None
+
+    def schedule_create_volumes(self, context, volume_ids, **_kwargs):
+        """Places several volumes in a single pass.
+
+        All volumes are placed against the same snapshot of the host
+        states, each placement is claimed before the next volume is
+        weighed, and the hosts are written in one transaction. Volumes
+        that can't be placed are set to error.
+        """
+        elevated = context.elevated()
+        volume_refs = db.volume_get_all_by_ids(elevated, volume_ids)
+        host_states = self._get_host_states(elevated)
+        type_extra_specs = {}
+
+        volume_hosts = {}
+        failed = []
+        for volume_ref in volume_refs:
+            try:
+                volume_hosts[volume_ref['id']] = self._select_host(elevated,
+                        volume_ref, host_states=host_states,
+                        type_extra_specs=type_extra_specs, **_kwargs)
+            except exception.NoValidHost as e:
+                LOG.warning(_("Failed to schedule volume %(volume_id)s: "
+                              "%(e)s"), {'volume_id': volume_ref['id'],
+                                         'e': e})
+                failed.append(volume_ref['id'])
+
+        db.volume_set_hosts(elevated, volume_hosts, timeutils.utcnow())
+        for volume_id in failed:
+            db.volume_update(elevated, volume_id, {'status': 'error'})
+        for volume_id, host in volume_hosts.iteritems():
+            driver.cast_to_volume_host(context, host, 'create_volume',
+                    update_db=False, volume_id=volume_id, **_kwargs)
+        return None
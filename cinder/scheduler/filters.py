@@ -0,0 +1,127 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Host filters for the filter scheduler.
+
+A filter decides from a HostState and the filter properties of a request
+whether a volume may be placed on the host. Filters only look at the
+cached host state so that they stay cheap for large numbers of hosts.
+"""
+
+import operator
+
+from cinder.openstack.common import log as logging
+
+
+LOG = logging.getLogger(__name__)
+
+
+class BaseHostFilter(object):
+    """Base class for host filters."""
+
+    def host_passes(self, host_state, filter_properties):
+        """Return True if the host can take the requested volume."""
+        raise NotImplementedError()
+
+    def filter_all(self, host_states, filter_properties):
+        return [host_state for host_state in host_states
+                if self.host_passes(host_state, filter_properties)]
+
+
+class AvailabilityZoneFilter(BaseHostFilter):
+    """Passes hosts in the requested availability zone."""
+
+    def host_passes(self, host_state, filter_properties):
+        zone = filter_properties.get('availability_zone')
+        if not zone:
+            return True
+        return host_state.availability_zone == zone
+
+
+class CapacityFilter(BaseHostFilter):
+    """Passes hosts with enough free capacity for the volume.
+
+    Hosts that don't report their capacity always pass.
+    """
+
+    def host_passes(self, host_state, filter_properties):
+        if host_state.free_capacity_gb is None:
+            return True
+        reserved = host_state.capabilities.get('reserved_percentage', 0)
+        free = host_state.free_capacity_gb
+        if host_state.total_capacity_gb is not None:
+            free -= host_state.total_capacity_gb * reserved / 100.0
+        size = filter_properties.get('size', 0)
+        if free < size:
+            LOG.debug(_("%(host_state)s does not have %(size)d GB "
+                        "free"), locals())
+            return False
+        return True
+
+
+def _match(op, requirement, value):
+    if op == '<in>':
+        return requirement in str(value)
+    if op == '<is>':
+        return str(value).lower() == requirement.lower()
+    ops = {'==': operator.eq, '!=': operator.ne,
+           '>=': operator.ge, '<=': operator.le}
+    try:
+        return ops[op](float(value), float(requirement))
+    except (TypeError, ValueError):
+        return False
+
+
+class CapabilitiesFilter(BaseHostFilter):
+    """Passes hosts whose capabilities satisfy the volume type extra specs.
+
+    An extra spec is either a plain value that must equal the capability,
+    or an operator followed by a value: '<in> text', '<is> True',
+    '== 10', '!= 10', '>= 10' or '<= 10'. Keys may carry a
+    'capabilities:' prefix; keys with any other scope are ignored.
+    """
+
+    def host_passes(self, host_state, filter_properties):
+        extra_specs = filter_properties.get('extra_specs') or {}
+        for key, requirement in extra_specs.iteritems():
+            scope, _sep, name = key.rpartition(':')
+            if scope and scope != 'capabilities':
+                continue
+            if name not in host_state.capabilities:
+                return False
+            value = host_state.capabilities[name]
+            words = str(requirement).split(None, 1)
+            if len(words) == 2 and words[0] in ('<in>', '<is>', '==', '!=',
+                                                '>=', '<='):
+                if not _match(words[0], words[1], value):
+                    return False
+            elif str(value) != str(requirement):
+                return False
+        return True
+
+
+class ServiceLivenessFilter(BaseHostFilter):
+    """Passes hosts whose volume service is up and not disabled.
+
+    The state of the services is refreshed periodically by the host
+    manager. Hosts that haven't been checked against the services table
+    yet are not known to be up, so they don't pass.
+    """
+
+    def host_passes(self, host_state, filter_properties):
+        return bool(host_state.service_up)
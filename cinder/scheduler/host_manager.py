@@ -15,22 +15,170 @@
 
 """
 Manage hosts in the current zone.
+
+The capabilities that volume hosts publish to the schedulers are kept in
+memory as one HostState per host, so hosts can be chosen without querying
+the database. A host that has not reported within host_state_ttl seconds is
+dropped until it reports again.
 """
 
-# FIXME(ja): this code was written only for compute. re-implement for volumes
+from cinder import db
+from cinder import flags
+from cinder.openstack.common import cfg
+from cinder.openstack.common import log as logging
+from cinder.openstack.common import timeutils
+from cinder import utils
+
+
+LOG = logging.getLogger(__name__)
+
+host_manager_opts = [
+    cfg.IntOpt('host_state_ttl',
+               default=300,
+               help='Seconds after which the capabilities reported by a '
+                    'volume host are stale and the host is not scheduled to'),
+    cfg.IntOpt('scheduler_claim_ttl',
+               default=900,
+               help='Seconds the capacity of a volume placed on a host is '
+                    'held back if the host never reports that the volume '
+                    'was created'),
+    ]
+
+FLAGS = flags.FLAGS
+FLAGS.register_opts(host_manager_opts)
 
 
 class HostState(object):
-    pass
+    """Mutable and immutable information tracked for a volume host."""
+
+    def __init__(self, host, capabilities=None):
+        self.host = host
+        self.availability_zone = None
+        self.total_capacity_gb = None
+        self.free_capacity_gb = None
+        self.allocated_capacity_gb = 0
+        self.volume_count = 0
+        self.capabilities = {}
+        self.updated = None
+        self.service_up = None
+        # claims are the volumes placed on the host that it hasn't reported as
+        # created yet, by volume id.
+        self.claims = {}
+        if capabilities is not None:
+            self.update_from_capabilities(capabilities)
+
+    def update_from_capabilities(self, capabilities):
+        """Replace the tracked state with a fresh capability report.
+
+        Claims for the volumes the host reports as finished are released,
+        the others are subtracted again from the reported capacity.
+        Capacities are None when the driver does not report them.
+        """
+        capabilities = dict(capabilities)
+        finished_volume_ids = capabilities.pop('finished_volume_ids', [])
+        self.capabilities = capabilities
+        self.availability_zone = capabilities.get('availability_zone')
+        self.total_capacity_gb = capabilities.get('total_capacity_gb')
+        self.free_capacity_gb = capabilities.get('free_capacity_gb')
+        self.allocated_capacity_gb = capabilities.get(
+                'allocated_capacity_gb', 0)
+        self.volume_count = capabilities.get('volume_count',
+                capabilities.get('lv_count', 0))
+        self.updated = timeutils.utcnow()
+
+        for volume_id in finished_volume_ids:
+            self.claims.pop(volume_id, None)
+        for volume_id, (size, claimed_at) in self.claims.items():
+            if timeutils.is_older_than(claimed_at, FLAGS.scheduler_claim_ttl):
+                LOG.warning(_("Claim for volume %(volume_id)s on host "
+                              "%(host)s expired"),
+                            {'volume_id': volume_id, 'host': self.host})
+                del self.claims[volume_id]
+            else:
+                self._consume(size)
+
+    def _consume(self, size):
+        if self.free_capacity_gb is not None:
+            self.free_capacity_gb -= size
+        self.allocated_capacity_gb += size
+        self.volume_count += 1
+
+    def consume_from_volume(self, volume):
+        """Claim capacity for a volume that was just placed on this host.
+
+        The claim is held until the host reports that the volume was
+        created, or for scheduler_claim_ttl seconds.
+        """
+        size = volume['size']
+        if volume.get('id'):
+            self.claims[volume['id']] = (size, timeutils.utcnow())
+        self._consume(size)
+
+    def is_stale(self):
+        return timeutils.is_older_than(self.updated, FLAGS.host_state_ttl)
+
+    def __repr__(self):
+        return ("host '%s': free_capacity_gb: %s, volume_count: %s" %
+                (self.host, self.free_capacity_gb, self.volume_count))
 
 
 class HostManager(object):
+    """Keeps the capabilities of volume hosts in memory."""
+
+    host_state_cls = HostState
+
+    def __init__(self):
+        self.host_state_map = {}
+
+    def _expire_host_states(self):
+        for host, host_state in self.host_state_map.items():
+            if host_state.is_stale():
+                LOG.info(_("Removing stale capabilities of host %s"), host)
+                del self.host_state_map[host]
+
+    def get_all_host_states(self):
+        """Return the HostStates of all hosts that reported recently.
+
+        The returned objects are the cached ones, so placement decisions
+        can be recorded on them with consume_from_volume.
+        """
+        self._expire_host_states()
+        return self.host_state_map.values()
+
+    def get_host_list(self):
+        """Return the hosts that can currently be scheduled to."""
+        return [{'host': host_state.host, 'service': 'volume'}
+                for host_state in self.get_all_host_states()]
+
+    def update_service_capabilities(self, service_name, host, capabilities):
+        """Update the HostState of a host with its latest capabilities."""
+        if service_name != 'volume':
+            LOG.debug(_('Ignoring %(service_name)s service update '
+                        'from %(host)s'), locals())
+            return
+        LOG.debug(_("Received %(service_name)s service update from "
+                    "%(host)s."), locals())
+        host_state = self.host_state_map.get(host)
+        if host_state is None:
+            host_state = self.host_state_cls(host)
+            self.host_state_map[host] = host_state
+        host_state.update_from_capabilities(capabilities)
 
-    def get_host_list(self, *args):
-        pass
+    def update_service_states(self, context):
+        """Refresh whether the volume services are up and enabled.
 
-    def update_service_capabilities(self, *args):
-        pass
+        This runs periodically rather than for every request, so that
+        placement doesn't have to read the services table. Hosts whose
+        service is disabled are marked down.
+        """
+        services = db.service_get_all_by_topic(context, FLAGS.volume_topic)
+        services = dict((service['host'], service) for service in services)
+        for host, host_state in self.host_state_map.iteritems():
+            service = services.get(host)
+            host_state.service_up = bool(service and
+                                         utils.service_is_up(service))
 
-    def get_service_capabilities(self, *args):
-        pass
+    def get_service_capabilities(self):
+        """Return the capabilities last reported by each live host."""
+        return dict((host_state.host, dict(host_state.capabilities))
+                    for host_state in self.get_all_host_states())
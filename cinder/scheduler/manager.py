@@ -30,27 +30,43 @@ from cinder import manager
 from cinder.openstack.common import cfg
 from cinder.openstack.common import excutils
 from cinder.openstack.common import importutils
+from cinder.openstack.common import timeutils
 
 
 LOG = logging.getLogger(__name__)
 
-scheduler_driver_opt = cfg.StrOpt('scheduler_driver',
-        default='cinder.scheduler.simple.SimpleScheduler',
-        help='Default driver to use for the scheduler')
+scheduler_manager_opts = [
+    cfg.StrOpt('scheduler_driver',
+               default='cinder.scheduler.simple.SimpleScheduler',
+               help='Default driver to use for the scheduler'),
+    cfg.IntOpt('volume_allocation_refresh_interval',
+               default=3600,
+               help='Seconds between recounts of the volumes on each host '
+                    'that repair drifted allocations, 0 to disable'),
+    cfg.IntOpt('deleted_rows_archive_interval',
+               default=0,
+               help='Seconds between archivals of the soft-deleted rows, '
+                    '0 to disable'),
+    cfg.IntOpt('deleted_rows_archive_max_rows',
+               default=10000,
+               help='Maximum number of rows archived by each run'),
+    ]
 
 FLAGS = flags.FLAGS
-FLAGS.register_opt(scheduler_driver_opt)
+FLAGS.register_opts(scheduler_manager_opts)
 
 
 class SchedulerManager(manager.Manager):
     """Chooses a host to create volumes"""
 
-    RPC_API_VERSION = '1.0'
+    RPC_API_VERSION = '1.1'
 
     def __init__(self, scheduler_driver=None, *args, **kwargs):
         if not scheduler_driver:
             scheduler_driver = FLAGS.scheduler_driver
         self.driver = importutils.import_object(scheduler_driver)
+        self._allocations_refreshed_at = None
+        self._deleted_rows_archived_at = None
         super(SchedulerManager, self).__init__(*args, **kwargs)
 
     def __getattr__(self, key):
@@ -76,6 +92,44 @@ class SchedulerManager(manager.Manager):
         self.driver.update_service_capabilities(service_name, host,
                 capabilities)
 
+    @manager.periodic_task
+    def _update_service_states(self, context):
+        """Refresh which volume services are up for the driver."""
+        self.driver.update_service_states(context)
+
+    @manager.periodic_task
+    def _refresh_volume_allocations(self, context):
+        """Repair the per host volume allocations from the volumes table."""
+        interval = FLAGS.volume_allocation_refresh_interval
+        if interval <= 0:
+            return
+        if (self._allocations_refreshed_at and
+            not timeutils.is_older_than(self._allocations_refreshed_at,
+                                        interval)):
+            return
+        self._allocations_refreshed_at = timeutils.utcnow()
+        drifted = db.volume_host_allocation_refresh(context)
+        if drifted:
+            LOG.warning(_("Repaired volume allocations of hosts %s"),
+                        ', '.join(drifted))
+
+    @manager.periodic_task
+    def _archive_deleted_rows(self, context):
+        """Move old soft-deleted rows out of the live tables."""
+        interval = FLAGS.deleted_rows_archive_interval
+        if interval <= 0:
+            return
+        if (self._deleted_rows_archived_at and
+            not timeutils.is_older_than(self._deleted_rows_archived_at,
+                                        interval)):
+            return
+        self._deleted_rows_archived_at = timeutils.utcnow()
+        archived = db.archive_deleted_rows(context,
+                max_rows=FLAGS.deleted_rows_archive_max_rows)
+        total = sum(archived.values())
+        if total:
+            LOG.info(_("Archived %d deleted rows"), total)
+
     def _schedule(self, method, context, topic, *args, **kwargs):
         """Tries to call schedule_* method on the driver to retrieve host.
         Falls back to schedule(context, topic) if method doesn't exist.
@@ -94,5 +148,7 @@ class SchedulerManager(manager.Manager):
             return driver_method(*args, **kwargs)
         except Exception:
             with excutils.save_and_reraise_exception():
-                volume_id = kwargs.get('volume_id')
-                db.volume_update(context, volume_id, {'status': 'error'})
+                volume_ids = kwargs.get('volume_ids',
+                                        [kwargs.get('volume_id')])
+                for volume_id in volume_ids:
+                    db.volume_update(context, volume_id, {'status': 'error'})
@@ -31,6 +31,7 @@ class SchedulerAPI(cinder.openstack.common.rpc.proxy.RpcProxy):
     API version history:
 
         1.0 - Initial version.
+        1.1 - Adds create_volumes to place several volumes in one call.
     '''
 
     RPC_API_VERSION = '1.0'
@@ -44,3 +45,12 @@ class SchedulerAPI(cinder.openstack.common.rpc.proxy.RpcProxy):
         self.fanout_cast(ctxt, self.make_msg('update_service_capabilities',
                 service_name=service_name, host=host,
                 capabilities=capabilities))
+
+    # volume.API creates one volume per request, so nothing in the tree
+    # casts this yet. Callers that create several volumes at once should
+    # use it rather than one create_volume cast per volume.
+    def create_volumes(self, ctxt, topic, volume_ids, snapshot_id=None,
+            image_id=None):
+        self.cast(ctxt, self.make_msg('create_volumes', topic=topic,
+                volume_ids=volume_ids, snapshot_id=snapshot_id,
+                image_id=image_id), version='1.1')
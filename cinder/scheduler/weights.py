@@ -0,0 +1,89 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Host weighers for the filter scheduler.
+
+Each weigher rates the hosts that passed the filters. The ratings are
+scaled to the range 0..1 over the candidate hosts and multiplied by the
+weigher's multiplier, and the host with the highest sum wins.
+"""
+
+from cinder import flags
+from cinder.openstack.common import cfg
+
+
+weight_opts = [
+    cfg.FloatOpt('capacity_weight_multiplier',
+                 default=1.0,
+                 help='Multiplier for the free capacity of a host, negative '
+                      'values stack volumes on the fullest hosts'),
+    cfg.FloatOpt('volume_count_weight_multiplier',
+                 default=-1.0,
+                 help='Multiplier for the number of volumes on a host, '
+                      'negative values spread volumes over hosts'),
+    ]
+
+FLAGS = flags.FLAGS
+FLAGS.register_opts(weight_opts)
+
+
+class BaseHostWeigher(object):
+    """Base class for host weighers."""
+
+    def weight_multiplier(self):
+        return 1.0
+
+    def host_weight(self, host_state, weight_properties):
+        """Return the raw weight of a host."""
+        raise NotImplementedError()
+
+    def weigh_all(self, host_states, weight_properties):
+        """Return the scaled weights of the hosts, in the same order."""
+        weights = [self.host_weight(host_state, weight_properties)
+                   for host_state in host_states]
+        multiplier = self.weight_multiplier()
+        low, high = min(weights), max(weights)
+        if not multiplier or low == high:
+            return [0.0] * len(weights)
+        scale = multiplier / float(high - low)
+        return [(weight - low) * scale for weight in weights]
+
+
+class FreeCapacityWeigher(BaseHostWeigher):
+    """Prefers hosts with more free capacity."""
+
+    def weight_multiplier(self):
+        return FLAGS.capacity_weight_multiplier
+
+    def host_weight(self, host_state, weight_properties):
+        free = host_state.free_capacity_gb
+        # hosts that don't report their capacity are rated as if they were
+        # full.
+        if free is None:
+            return 0
+        return free
+
+
+class VolumeCountWeigher(BaseHostWeigher):
+    """Rates hosts by the number of volumes they hold."""
+
+    def weight_multiplier(self):
+        return FLAGS.volume_count_weight_multiplier
+
+    def host_weight(self, host_state, weight_properties):
+        return host_state.volume_count
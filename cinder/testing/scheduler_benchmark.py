@@ -0,0 +1,350 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Simulate volume scheduling against a synthetic fleet.
+
+Creates a fleet of fake volume services with pre-existing volumes in an
+sqlite database, then schedules a stream of volume creations through the
+SchedulerManager with each scheduler driver, using the fake rpc backend.
+The fleet consumes the create_volume casts and records the host of each
+volume, as cinder-volume does, so every driver's placements are counted
+the same way. Every report_interval requests the fleet reports its
+capabilities as if all scheduled volumes had been created. For each
+driver the decisions per second, the p50 and p99 latency of a decision
+and how evenly the fleet ended up utilised are reported. Runs offline
+on one machine:
+
+    python -m cinder.testing.scheduler_benchmark --hosts=1000 \\
+        --requests=5000 --drivers=simple,filter
+"""
+
+import random
+import sys
+import time
+
+from cinder import context
+from cinder import db
+from cinder.db.sqlalchemy import models
+from cinder.db.sqlalchemy.session import get_session
+from cinder import exception
+from cinder import flags
+from cinder.openstack.common import cfg
+from cinder.openstack.common import rpc
+from cinder.openstack.common import timeutils
+from cinder.scheduler import manager
+from cinder import utils
+
+
+benchmark_opts = [
+    cfg.ListOpt('drivers',
+                default=['chance', 'simple', 'filter'],
+                help='Scheduler drivers to run, by short name or class '
+                     'path'),
+    cfg.IntOpt('hosts',
+               default=1000,
+               help='Number of volume services in the fleet'),
+    cfg.IntOpt('host_capacity_gb',
+               default=10000,
+               help='Mean capacity of a volume service in GB'),
+    cfg.IntOpt('capacity_spread_percent',
+               default=50,
+               help='Capacities vary uniformly by up to this percentage '
+                    'around host_capacity_gb'),
+    cfg.IntOpt('zones',
+               default=1,
+               help='Number of availability zones the hosts are spread over'),
+    cfg.IntOpt('volumes_per_host',
+               default=10,
+               help='Number of volumes on each host before the run'),
+    cfg.IntOpt('requests',
+               default=2000,
+               help='Number of volume creations to schedule'),
+    cfg.StrOpt('request_sizes',
+               default='1:50,10:30,100:15,500:5',
+               help='Mix of requested volume sizes as size_gb:weight pairs'),
+    cfg.IntOpt('zone_request_percent',
+               default=0,
+               help='Percentage of requests that ask for a specific '
+                    'availability zone'),
+    cfg.IntOpt('report_interval',
+               default=100,
+               help='Number of requests between capability reports of the '
+                    'fleet'),
+    cfg.IntOpt('seed',
+               default=0,
+               help='Seed of the random fleet and request stream'),
+    ]
+
+FLAGS = flags.FLAGS
+
+DRIVERS = {
+    'chance': 'cinder.scheduler.chance.ChanceScheduler',
+    'simple': 'cinder.scheduler.simple.SimpleScheduler',
+    'filter': 'cinder.scheduler.filter_scheduler.FilterScheduler',
+    }
+
+
+def parse_request_sizes(spec):
+    """Parse 'size:weight,...' into a list of (size, weight) tuples."""
+    sizes = []
+    for item in spec.split(','):
+        size, _sep, weight = item.strip().partition(':')
+        sizes.append((int(size), int(weight or 1)))
+    return sizes
+
+
+def _choose_size(rand, request_sizes):
+    point = rand.uniform(0, sum(weight for size, weight in request_sizes))
+    for size, weight in request_sizes:
+        point -= weight
+        if point <= 0:
+            return size
+    return request_sizes[-1][0]
+
+
+def _percentile(values, percent):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = int(round(percent / 100.0 * (len(values) - 1)))
+    return values[index]
+
+
+class _VolumeService(object):
+    """Consumes the casts to one host of the fleet."""
+
+    def __init__(self, host, placements):
+        self.host = host
+        self.placements = placements
+
+    def dispatch(self, ctxt, version, method, **kwargs):
+        if method == 'create_volume':
+            self.placements.append((kwargs['volume_id'], self.host))
+
+
+class Fleet(object):
+    """A synthetic set of volume services."""
+
+    def __init__(self, hosts, capacity_gb, spread_percent=0, zones=1,
+                 volumes_per_host=0, request_sizes=None, seed=0):
+        rand = random.Random(seed)
+        spread = capacity_gb * spread_percent / 100
+        self.hosts = []
+        for i in xrange(hosts):
+            self.hosts.append({'host': 'bench-host-%d' % i,
+                               'zone': 'zone%d' % (i % zones),
+                               'total': capacity_gb + rand.randint(-spread,
+                                                                   spread)})
+        self.zones = ['zone%d' % i for i in xrange(zones)]
+        self.volumes_per_host = volumes_per_host
+        self.request_sizes = request_sizes or [(1, 1)]
+        self.seed = seed
+        self.placements = []
+        self.connection = None
+
+    def create(self, ctxt):
+        """Insert the services and their volumes into the database."""
+        rand = random.Random(self.seed)
+        now = timeutils.utcnow()
+        services = []
+        volumes = []
+        allocations = []
+        for host in self.hosts:
+            services.append({'host': host['host'],
+                             'binary': 'cinder-volume',
+                             'topic': FLAGS.volume_topic,
+                             'report_count': 0,
+                             'disabled': False,
+                             'availability_zone': host['zone'],
+                             'created_at': now,
+                             'updated_at': now,
+                             'deleted': False})
+            allocated = 0
+            for i in xrange(self.volumes_per_host):
+                size = _choose_size(rand, self.request_sizes)
+                allocated += size
+                volumes.append({'id': str(utils.gen_uuid()),
+                                'host': host['host'],
+                                'size': size,
+                                'availability_zone': host['zone'],
+                                'status': 'available',
+                                'attach_status': 'detached',
+                                'created_at': now,
+                                'deleted': False})
+            allocations.append({'host': host['host'],
+                                'volume_count': self.volumes_per_host,
+                                'allocated_gb': allocated,
+                                'created_at': now,
+                                'deleted': False})
+        session = get_session()
+        with session.begin():
+            for model, rows in ((models.Service, services),
+                                (models.Volume, volumes),
+                                (models.VolumeHostAllocation, allocations)):
+                if rows:
+                    session.execute(model.__table__.insert(), rows)
+        self.connection = rpc.create_connection(new=True)
+        for host in self.hosts:
+            self.connection.create_consumer(
+                    rpc.queue_get_for(ctxt, FLAGS.volume_topic, host['host']),
+                    _VolumeService(host['host'], self.placements))
+
+    def place(self, ctxt):
+        """Record the host of the volumes cast to the fleet so far."""
+        for volume_id, host in self.placements:
+            db.volume_update(ctxt, volume_id, {'host': host})
+        del self.placements[:]
+
+    def destroy(self, ctxt):
+        """Remove everything the fleet and the run added."""
+        if self.connection:
+            self.connection.close()
+            self.connection = None
+        del self.placements[:]
+        session = get_session()
+        with session.begin():
+            for model in (models.Volume, models.VolumeHostAllocation,
+                          models.Service):
+                session.execute(model.__table__.delete())
+
+    def report(self, ctxt, scheduler_manager, finished_volume_ids):
+        """Send the capabilities of every host to the scheduler."""
+        allocations = dict((a['host'], a)
+                           for a in db.volume_host_allocation_get_all(ctxt))
+        finished = {}
+        # sqlite allows at most 999 parameters in a query
+        for i in xrange(0, len(finished_volume_ids), 500):
+            for volume in db.volume_get_all_by_ids(ctxt,
+                    finished_volume_ids[i:i + 500]):
+                finished.setdefault(volume['host'], []).append(volume['id'])
+        for host in self.hosts:
+            allocation = allocations.get(host['host'])
+            allocated = allocation['allocated_gb'] if allocation else 0
+            scheduler_manager.update_service_capabilities(ctxt,
+                    service_name='volume', host=host['host'],
+                    capabilities={
+                        'total_capacity_gb': host['total'],
+                        'free_capacity_gb': host['total'] - allocated,
+                        'allocated_capacity_gb': allocated,
+                        'volume_count': (allocation['volume_count']
+                                         if allocation else 0),
+                        'availability_zone': host['zone'],
+                        'finished_volume_ids': finished.get(host['host'],
+                                                            [])})
+        # service heartbeats, so the services stay up
+        session = get_session()
+        with session.begin():
+            session.query(models.Service).\
+                    update({'updated_at': timeutils.utcnow()})
+
+    def utilization(self, ctxt):
+        """Return the fraction of the capacity used on each host."""
+        allocations = dict((a['host'], a['allocated_gb'])
+                           for a in db.volume_host_allocation_get_all(ctxt))
+        return [allocations.get(host['host'], 0) / float(host['total'])
+                for host in self.hosts]
+
+
+def run(driver, fleet, requests, request_sizes, report_interval=100,
+        zone_request_percent=0, seed=0):
+    """Schedule a stream of volume creations and measure it.
+
+    :returns: a dict of the benchmark results for the driver.
+    """
+    ctxt = context.get_admin_context()
+    rand = random.Random(seed)
+    scheduler_manager = manager.SchedulerManager(
+            scheduler_driver=DRIVERS.get(driver, driver))
+    fleet.create(ctxt)
+    try:
+        fleet.report(ctxt, scheduler_manager, [])
+        latencies = []
+        failures = 0
+        pending = []
+        start = time.time()
+        for i in xrange(requests):
+            zone = None
+            if rand.randint(1, 100) <= zone_request_percent:
+                zone = rand.choice(fleet.zones)
+            volume = db.volume_create(ctxt, {
+                    'size': _choose_size(rand, request_sizes),
+                    'availability_zone': zone,
+                    'status': 'creating',
+                    'attach_status': 'detached'})
+            before = time.time()
+            try:
+                scheduler_manager.create_volume(ctxt,
+                        topic=FLAGS.volume_topic, volume_id=volume['id'],
+                        snapshot_id=None, image_id=None)
+            except (exception.NoValidHost, exception.WillNotSchedule):
+                failures += 1
+            latencies.append(time.time() - before)
+            fleet.place(ctxt)
+            pending.append(volume['id'])
+            if report_interval and (i + 1) % report_interval == 0:
+                fleet.report(ctxt, scheduler_manager, pending)
+                pending = []
+        elapsed = time.time() - start
+
+        utilization = fleet.utilization(ctxt)
+        mean = sum(utilization) / len(utilization)
+        variance = sum((u - mean) ** 2 for u in utilization) / len(utilization)
+        return {'driver': driver,
+                'decisions_per_second': requests / sum(latencies),
+                'requests_per_second': requests / elapsed,
+                'p50_ms': _percentile(latencies, 50) * 1000,
+                'p99_ms': _percentile(latencies, 99) * 1000,
+                'failures': failures,
+                'utilization_mean': mean,
+                'utilization_cv': variance ** 0.5 / mean if mean else 0.0,
+                'utilization_max': max(utilization),
+                'overcommitted_hosts': len([u for u in utilization
+                                            if u > 1.0])}
+    finally:
+        fleet.destroy(ctxt)
+
+
+def main():
+    FLAGS.register_cli_opts(benchmark_opts)
+    FLAGS.set_default('sql_connection', 'sqlite://')
+    FLAGS.set_default('rpc_backend',
+                      'cinder.openstack.common.rpc.impl_fake')
+    flags.parse_args(sys.argv)
+
+    from cinder.db import migration
+    migration.db_sync()
+
+    request_sizes = parse_request_sizes(FLAGS.request_sizes)
+    print ('%-8s %11s %10s %9s %9s %8s %8s %8s %8s %6s' %
+           ('driver', 'decisions/s', 'requests/s', 'p50 ms', 'p99 ms',
+            'failed', 'util', 'util cv', 'util max', 'over'))
+    for driver in FLAGS.drivers:
+        fleet = Fleet(FLAGS.hosts, FLAGS.host_capacity_gb,
+                      FLAGS.capacity_spread_percent, FLAGS.zones,
+                      FLAGS.volumes_per_host, request_sizes, FLAGS.seed)
+        result = run(driver, fleet, FLAGS.requests, request_sizes,
+                     FLAGS.report_interval, FLAGS.zone_request_percent,
+                     FLAGS.seed)
+        print ('%(driver)-8s %(decisions_per_second)11.1f '
+               '%(requests_per_second)10.1f %(p50_ms)9.2f %(p99_ms)9.2f '
+               '%(failures)8d %(utilization_mean)8.3f %(utilization_cv)8.3f '
+               '%(utilization_max)8.3f %(overcommitted_hosts)6d' % result)
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
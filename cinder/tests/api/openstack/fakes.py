@@ -243,13 +243,14 @@ def stub_volume_get_notfound(self, context, volume_id):
     raise exc.NotFound
 
 
-def stub_volume_get_all(context, search_opts=None):
+def stub_volume_get_all(context, search_opts=None, **kwargs):
     return [stub_volume(100, project_id='fake'),
             stub_volume(101, project_id='superfake'),
             stub_volume(102, project_id='superduperfake')]
 
 
-def stub_volume_get_all_by_project(self, context, search_opts=None):
+def stub_volume_get_all_by_project(self, context, search_opts=None,
+                                   **kwargs):
     return [stub_volume_get(self, context, '1')]
 
 
@@ -269,11 +270,11 @@ def stub_snapshot(id, **kwargs):
     return snapshot
 
 
-def stub_snapshot_get_all(self):
+def stub_snapshot_get_all(self, **kwargs):
     return [stub_snapshot(100, project_id='fake'),
             stub_snapshot(101, project_id='superfake'),
             stub_snapshot(102, project_id='superduperfake')]
 
 
-def stub_snapshot_get_all_by_project(self, context):
+def stub_snapshot_get_all_by_project(self, context, **kwargs):
     return [stub_snapshot(1)]
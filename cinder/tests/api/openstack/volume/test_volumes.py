@@ -232,6 +232,86 @@ class VolumeApiTest(test.TestCase):
                                  'size': 1}]}
         self.assertEqual(res_dict, expected)
 
+    def test_volume_list_pagination(self):
+        calls = []
+
+        def stub_get_all(self, context, **kwargs):
+            calls.append(kwargs)
+            return [fakes.stub_volume('2'), fakes.stub_volume('3')]
+
+        self.stubs.Set(volume_api.API, 'get_all', stub_get_all)
+        req = fakes.HTTPRequest.blank('/v1/fake/volumes/detail?marker=1'
+                                      '&limit=2&sort_key=id&sort_dir=asc')
+        res_dict = self.controller.detail(req)
+        self.assertEqual(calls, [{'marker': '1', 'limit': 2,
+                                  'sort_key': 'id', 'sort_dir': 'asc',
+                                  'search_opts': {}}])
+        self.assertEqual([v['id'] for v in res_dict['volumes']], ['2', '3'])
+        links = res_dict['volumes_links']
+        self.assertEqual(links[0]['rel'], 'next')
+        self.assertTrue('/fake/volumes/detail?' in links[0]['href'])
+        self.assertTrue('marker=3' in links[0]['href'])
+
+        req = fakes.HTTPRequest.blank('/v1/fake/volumes?limit=3')
+        res_dict = self.controller.index(req)
+        self.assertFalse('volumes_links' in res_dict)
+
+    def test_volume_list_offset(self):
+        self.stubs.Set(volume_api.API, 'get_all',
+                       lambda self, context, **kwargs:
+                           [fakes.stub_volume(i) for i in range(4)])
+        req = fakes.HTTPRequest.blank('/v1/fake/volumes?offset=1&limit=2')
+        res_dict = self.controller.index(req)
+        self.assertEqual([v['id'] for v in res_dict['volumes']], [1, 2])
+
+    def test_volume_list_search_options(self):
+        calls = []
+
+        def stub_get_all(self, context, **kwargs):
+            calls.append(kwargs['search_opts'])
+            return []
+
+        self.stubs.Set(volume_api.API, 'get_all', stub_get_all)
+        req = fakes.HTTPRequest.blank('/v1/fake/volumes?status=available'
+                                      '&status=error&name=vol'
+                                      '&metadata=%7B%22a%22%3A%221%22%7D'
+                                      '&host=host1')
+        self.controller.index(req)
+        self.assertEqual(calls, [{'status': ['available', 'error'],
+                                  'name': 'vol',
+                                  'metadata': {'a': '1'}}])
+
+        for metadata in ('a', '%5B%22a%22%5D', '%7B%22a%22%3A1%7D',
+                         '%7B%22a%22%3A%7B%7D%7D', "%7B'a'%3A'1'%7D"):
+            # not a JSON object of string keys and values
+            req = fakes.HTTPRequest.blank('/v1/fake/volumes?metadata=' +
+                                          metadata)
+            self.assertRaises(webob.exc.HTTPBadRequest, self.controller.index,
+                              req)
+
+    def test_volume_list_invalid_sort_dir(self):
+        req = fakes.HTTPRequest.blank('/v1/fake/volumes?sort_dir=up')
+        self.assertRaises(webob.exc.HTTPBadRequest, self.controller.index,
+                          req)
+
+    def test_volume_list_invalid_sort_key(self):
+        def stub_get_all(self, context, **kwargs):
+            raise exception.InvalidSortKey()
+
+        self.stubs.Set(volume_api.API, 'get_all', stub_get_all)
+        req = fakes.HTTPRequest.blank('/v1/fake/volumes?sort_key=size')
+        self.assertRaises(webob.exc.HTTPBadRequest, self.controller.index,
+                          req)
+
+    def test_volume_list_marker_not_found(self):
+        def stub_get_all(self, context, **kwargs):
+            raise exception.MarkerNotFound(marker=kwargs['marker'])
+
+        self.stubs.Set(volume_api.API, 'get_all', stub_get_all)
+        req = fakes.HTTPRequest.blank('/v1/fake/volumes?marker=missing')
+        self.assertRaises(webob.exc.HTTPBadRequest, self.controller.index,
+                          req)
+
     def test_volume_show(self):
         req = fakes.HTTPRequest.blank('/v1/volumes/1')
         res_dict = self.controller.show(req, '1')
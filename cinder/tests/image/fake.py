@@ -159,6 +159,10 @@ class _FakeImageService(object):
         self.show(context, image_id)
         data.write(self._imagedata.get(image_id, ''))
 
+    def download_ranges(self, context, image_id, open_writer):
+        with open_writer(None) as writer:
+            self.download(context, image_id, writer)
+
     def show(self, context, image_id):
         """Get data about specified image.
 
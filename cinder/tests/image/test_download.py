@@ -0,0 +1,201 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Tests for ranged image downloads against a local http server."""
+
+import BaseHTTPServer
+import collections
+import hashlib
+import os
+import re
+import shutil
+import SocketServer
+import tempfile
+import threading
+import time
+
+import eventlet
+
+from cinder import context
+from cinder import exception
+from cinder.image import download
+from cinder.image import glance
+from cinder import test
+from cinder.volume import blockcopy
+
+
+class FakeGlanceServer(SocketServer.ThreadingMixIn,
+                       BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, images):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0),
+                                           FakeGlanceHandler)
+        self.images = images
+        self.requests = []
+        self.ranges = True
+        # last byte of a range -> how many more of its requests to drop
+        self.failures = {}
+
+
+class FakeGlanceHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        image_id = self.path.split('/')[-1]
+        byte_range = self.headers.get('Range')
+        server.requests.append((image_id, byte_range,
+                                self.headers.get('X-Auth-Token')))
+        if image_id not in server.images:
+            self.send_error(404)
+            return
+        data = server.images[image_id]
+        match = re.match(r'bytes=(\d+)-(\d+)', byte_range or '')
+        if match and server.ranges:
+            start, end = int(match.group(1)), int(match.group(2)) + 1
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %d-%d/%d' %
+                             (start, end - 1, len(data)))
+            data = data[start:end]
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        # the ranges are fetched concurrently, so failures are keyed on
+        # the range rather than on the order of the requests; a resumed
+        # range ends at the same byte as the range it resumes
+        end = match and int(match.group(2))
+        if server.failures.get(end):
+            # simulate a connection dropped half way through
+            server.failures[end] -= 1
+            data = data[:len(data) / 2]
+        self.wfile.write(data)
+
+
+class RangedDownloadTestCase(test.TestCase):
+
+    def setUp(self):
+        super(RangedDownloadTestCase, self).setUp()
+        self.flags(glance_download_range_mb=1, glance_download_ranges=3,
+                   volume_copy_block_size_kb=64)
+        self.stubs.Set(time, 'sleep', lambda seconds: None)
+        self.image = os.urandom(1024 * 1024) * 3 + 'tail' + '\0' * 100000
+        self.server = FakeGlanceServer({'image': self.image})
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       args=(0.01,))
+        self.thread.daemon = True
+        self.thread.start()
+        self.tmpdir = tempfile.mkdtemp()
+        self.dest = os.path.join(self.tmpdir, 'dest')
+        with open(self.dest, 'wb') as f:
+            f.truncate(len(self.image))
+        self.fetcher = download.RangedDownload('127.0.0.1',
+                                               self.server.server_port,
+                                               'image', {'X-Auth-Token': 't'})
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmpdir)
+        super(RangedDownloadTestCase, self).tearDown()
+
+    def _open_writer(self, offset):
+        return blockcopy.BlockWriter(self.dest, offset=offset)
+
+    def _fetch(self, checksum=None):
+        if checksum is None:
+            checksum = hashlib.md5(self.image).hexdigest()
+        return self.fetcher.fetch(self._open_writer, len(self.image),
+                                  checksum)
+
+    def _read(self):
+        with open(self.dest, 'rb') as f:
+            return f.read()
+
+    def test_image_is_fetched_in_ranges(self):
+        self._fetch()
+        self.assertEqual(self._read(), self.image)
+        self.assertEqual(sorted(r[1] for r in self.server.requests),
+                         ['bytes=0-1048575', 'bytes=1048576-2097151',
+                          'bytes=2097152-3145727',
+                          'bytes=3145728-3245731'])
+        self.assertEqual(set(r[2] for r in self.server.requests), set('t'))
+
+    def test_hashing_yields_to_other_green_threads(self):
+        data = os.urandom(1024) * 1024 * 4
+        result = eventlet.event.Event()
+        result.send((data, None))
+        md5 = hashlib.md5()
+        ticks = []
+
+        def tick():
+            while True:
+                ticks.append(len(ticks))
+                eventlet.sleep(0)
+        thread = eventlet.spawn(tick)
+        try:
+            download.RangedDownload._hash_next(md5,
+                                               collections.deque([result]))
+        finally:
+            thread.kill()
+        self.assertEqual(md5.hexdigest(), hashlib.md5(data).hexdigest())
+        self.assertTrue(len(ticks) >= 4)
+
+    def test_failed_range_is_resumed(self):
+        self.server.failures = {1048575: 1}
+        stats = self._fetch()
+        self.assertEqual(self._read(), self.image)
+        self.assertEqual(stats['retries'], 1)
+        self.assertEqual(sorted(r[1] for r in self.server.requests),
+                         ['bytes=0-1048575', 'bytes=1048576-2097151',
+                          'bytes=2097152-3145727',
+                          'bytes=3145728-3245731',
+                          'bytes=524288-1048575'])
+
+    def test_too_many_failures(self):
+        self.flags(glance_download_range_retries=1)
+        self.server.failures = {1048575: 2}
+        self.assertRaises(exception.GlanceConnectionFailed, self._fetch)
+
+    def test_checksum_mismatch(self):
+        self.assertRaises(exception.ImageChecksumMismatch, self._fetch,
+                          'bad')
+
+    def test_server_without_ranges(self):
+        self.server.ranges = False
+        self._fetch()
+        self.assertEqual(self._read(), self.image)
+        self.assertEqual(self.server.requests[-1][1], None)
+
+    def test_image_not_found(self):
+        self.fetcher.image_id = 'missing'
+        self.assertRaises(exception.ImageNotFound, self._fetch)
+
+    def test_glance_download_ranges(self):
+        client = glance.GlanceClientWrapper()
+        client.client = True
+        client.host = '127.0.0.1'
+        client.port = self.server.server_port
+        service = glance.GlanceImageService(client)
+        self.stubs.Set(service, 'show', lambda ctxt, image_id: {
+            'size': len(self.image),
+            'checksum': hashlib.md5(self.image).hexdigest()})
+        service.download_ranges(context.get_admin_context(), 'image',
+                                self._open_writer)
+        self.assertEqual(self._read(), self.image)
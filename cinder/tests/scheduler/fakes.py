@@ -21,40 +21,31 @@ from cinder.scheduler import host_manager
 
 
 class FakeHostManager(host_manager.HostManager):
-    """host1: free_ram_mb=1024-512-512=0, free_disk_gb=1024-512-512=0
-       host2: free_ram_mb=2048-512=1536  free_disk_gb=2048-512=1536
-       host3: free_ram_mb=4096-1024=3072  free_disk_gb=4096-1024=3072
-       host4: free_ram_mb=8192  free_disk_gb=8192"""
+    """host1: free_capacity_gb=1024-1000=24
+       host2: free_capacity_gb=2048-1000=1048
+       host3: free_capacity_gb=4096-500=3596
+       host4: free_capacity_gb=8192"""
 
     def __init__(self):
         super(FakeHostManager, self).__init__()
 
         self.service_states = {
-            'host1': {
-                'compute': {'host_memory_free': 1073741824},
-            },
-            'host2': {
-                'compute': {'host_memory_free': 2147483648},
-            },
-            'host3': {
-                'compute': {'host_memory_free': 3221225472},
-            },
-            'host4': {
-                'compute': {'host_memory_free': 999999999},
-            },
+            'host1': {'total_capacity_gb': 1024, 'free_capacity_gb': 24,
+                      'volume_count': 10, 'availability_zone': 'zone1'},
+            'host2': {'total_capacity_gb': 2048, 'free_capacity_gb': 1048,
+                      'volume_count': 5, 'availability_zone': 'zone1'},
+            'host3': {'total_capacity_gb': 4096, 'free_capacity_gb': 3596,
+                      'volume_count': 1, 'availability_zone': 'zone2'},
+            'host4': {'total_capacity_gb': 8192, 'free_capacity_gb': 8192,
+                      'volume_count': 0, 'availability_zone': 'zone2'},
         }
-
-    def get_host_list_from_db(self, context):
-        return [
-            ('host1', dict(free_disk_gb=1024, free_ram_mb=1024)),
-            ('host2', dict(free_disk_gb=2048, free_ram_mb=2048)),
-            ('host3', dict(free_disk_gb=4096, free_ram_mb=4096)),
-            ('host4', dict(free_disk_gb=8192, free_ram_mb=8192)),
-        ]
+        for host, capabilities in self.service_states.iteritems():
+            self.update_service_capabilities('volume', host, capabilities)
+            self.host_state_map[host].service_up = True
 
 
 class FakeHostState(host_manager.HostState):
-    def __init__(self, host, topic, attribute_dict):
-        super(FakeHostState, self).__init__(host, topic)
+    def __init__(self, host, attribute_dict):
+        super(FakeHostState, self).__init__(host)
         for (key, val) in attribute_dict.iteritems():
             setattr(self, key, val)
@@ -0,0 +1,228 @@
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For Filter Scheduler.
+"""
+
+import mox
+
+from cinder import context
+from cinder import db
+from cinder import exception
+from cinder.scheduler import driver
+from cinder.scheduler import filter_scheduler
+from cinder.scheduler import filters
+from cinder.scheduler import weights
+from cinder import test
+from cinder.tests.scheduler import fakes
+
+
+class HostFiltersTestCase(test.TestCase):
+    """Test case for host filters."""
+
+    def test_availability_zone_filter(self):
+        host_filter = filters.AvailabilityZoneFilter()
+        host = fakes.FakeHostState('host1', {'availability_zone': 'zone1'})
+        self.assertTrue(host_filter.host_passes(host, {}))
+        self.assertTrue(host_filter.host_passes(host,
+                {'availability_zone': 'zone1'}))
+        self.assertFalse(host_filter.host_passes(host,
+                {'availability_zone': 'zone2'}))
+
+    def test_capacity_filter(self):
+        host_filter = filters.CapacityFilter()
+        host = fakes.FakeHostState('host1', {'total_capacity_gb': 100,
+                                             'free_capacity_gb': 20,
+                                             'capabilities':
+                                                 {'reserved_percentage': 10}})
+        self.assertTrue(host_filter.host_passes(host, {'size': 10}))
+        self.assertFalse(host_filter.host_passes(host, {'size': 11}))
+
+    def test_capacity_filter_passes_unknown_capacity(self):
+        host_filter = filters.CapacityFilter()
+        host = fakes.FakeHostState('host1', {})
+        self.assertTrue(host_filter.host_passes(host, {'size': 1000}))
+
+    def test_capabilities_filter(self):
+        host_filter = filters.CapabilitiesFilter()
+        host = fakes.FakeHostState('host1', {'capabilities':
+                {'lvm_type': 'thin', 'thin_pool_used_percent': 25.0,
+                 'QoS_support': True}})
+        self.assertTrue(host_filter.host_passes(host, {'extra_specs': {}}))
+        self.assertTrue(host_filter.host_passes(host, {'extra_specs':
+                {'capabilities:lvm_type': 'thin',
+                 'thin_pool_used_percent': '<= 50',
+                 'QoS_support': '<is> True',
+                 'qos:maxIOPS': '1000'}}))
+        self.assertFalse(host_filter.host_passes(host, {'extra_specs':
+                {'lvm_type': 'default'}}))
+        self.assertFalse(host_filter.host_passes(host, {'extra_specs':
+                {'thin_pool_used_percent': '>= 50'}}))
+        self.assertFalse(host_filter.host_passes(host, {'extra_specs':
+                {'missing': 'value'}}))
+
+    def test_service_liveness_filter(self):
+        host_filter = filters.ServiceLivenessFilter()
+        for service_up, passes in ((None, False), (True, True),
+                                   (False, False)):
+            host = fakes.FakeHostState('host1', {'service_up': service_up})
+            self.assertEqual(host_filter.host_passes(host, {}), passes)
+
+
+class HostWeighersTestCase(test.TestCase):
+    """Test case for host weighers."""
+
+    def setUp(self):
+        super(HostWeighersTestCase, self).setUp()
+        self.host_states = fakes.FakeHostManager().get_all_host_states()
+
+    def test_free_capacity_weigher(self):
+        scores = weights.FreeCapacityWeigher().weigh_all(self.host_states,
+                                                         {})
+        best = max(zip(scores, self.host_states))[1]
+        self.assertEqual(best.host, 'host4')
+        self.assertEqual(max(scores), 1.0)
+        self.assertEqual(min(scores), 0.0)
+
+    def test_volume_count_weigher(self):
+        scores = weights.VolumeCountWeigher().weigh_all(self.host_states, {})
+        best = max(zip(scores, self.host_states))[1]
+        self.assertEqual(best.host, 'host4')
+
+    def test_zero_multiplier(self):
+        self.flags(volume_count_weight_multiplier=0.0)
+        scores = weights.VolumeCountWeigher().weigh_all(self.host_states, {})
+        self.assertEqual(scores, [0.0] * 4)
+
+
+class FilterSchedulerTestCase(test.TestCase):
+    """Test case for Filter Scheduler."""
+
+    def setUp(self):
+        super(FilterSchedulerTestCase, self).setUp()
+        self.driver = filter_scheduler.FilterScheduler()
+        self.driver.host_manager = fakes.FakeHostManager()
+        self.context = context.RequestContext('fake_user', 'fake_project')
+        self.casts = []
+        self.stubs.Set(driver, 'cast_to_volume_host',
+                       lambda ctxt, host, method, **kwargs:
+                           self.casts.append(host))
+
+    def _stub_volume(self, size, availability_zone=None,
+                     volume_type_id=None):
+        volume = {'id': 'fake_volume', 'size': size,
+                  'availability_zone': availability_zone,
+                  'volume_type_id': volume_type_id}
+        self.stubs.Set(db, 'volume_get', lambda ctxt, volume_id: volume)
+        self.mox.StubOutWithMock(db, 'service_get_all_volume_sorted')
+        self.mox.ReplayAll()
+
+    def test_schedule_create_volume_picks_best_host(self):
+        self._stub_volume(10)
+        self.driver.schedule_create_volume(self.context, 'fake_volume')
+        self.assertEqual(self.casts, ['host4'])
+        host_state = self.driver.host_manager.host_state_map['host4']
+        self.assertEqual(host_state.free_capacity_gb, 8182)
+        self.assertEqual(host_state.volume_count, 1)
+
+    def test_burst_of_creates_spreads_over_hosts(self):
+        self.flags(volume_count_weight_multiplier=0.0)
+        volumes = {}
+        for i in range(4):
+            volumes['vol%d' % i] = {'id': 'vol%d' % i, 'size': 2000,
+                                    'availability_zone': None,
+                                    'volume_type_id': None}
+        self.stubs.Set(db, 'volume_get',
+                       lambda ctxt, volume_id: volumes[volume_id])
+        for volume_id in sorted(volumes):
+            self.driver.schedule_create_volume(self.context, volume_id)
+        self.assertEqual(self.casts, ['host4', 'host4', 'host4', 'host3'])
+
+        # A report that doesn't include the volumes keeps the claims
+        self.driver.host_manager.update_service_capabilities('volume',
+                'host4', {'free_capacity_gb': 8192, 'volume_count': 0})
+        host_state = self.driver.host_manager.host_state_map['host4']
+        self.assertEqual(host_state.free_capacity_gb, 2192)
+
+    def test_schedule_create_volumes(self):
+        self.flags(volume_count_weight_multiplier=0.0)
+        volumes = [{'id': 'vol%d' % i, 'size': size,
+                    'availability_zone': None, 'volume_type_id': None}
+                   for i, size in enumerate([3000, 3000, 3000, 9000])]
+        self.stubs.Set(db, 'volume_get_all_by_ids',
+                       lambda ctxt, volume_ids: volumes)
+        self.mox.StubOutWithMock(db, 'volume_get')
+        self.mox.StubOutWithMock(db, 'volume_set_hosts')
+        self.mox.StubOutWithMock(db, 'volume_update')
+        db.volume_set_hosts(mox.IgnoreArg(),
+                            {'vol0': 'host4', 'vol1': 'host4',
+                             'vol2': 'host3'},
+                            mox.IgnoreArg())
+        db.volume_update(mox.IgnoreArg(), 'vol3', {'status': 'error'})
+        self.mox.ReplayAll()
+
+        self.driver.schedule_create_volumes(self.context,
+                [v['id'] for v in volumes], snapshot_id=None, image_id=None)
+        self.assertEqual(sorted(self.casts), ['host3', 'host4', 'host4'])
+
+    def test_schedule_create_volume_in_zone(self):
+        self._stub_volume(100, availability_zone='zone1')
+        self.driver.schedule_create_volume(self.context, 'fake_volume')
+        self.assertEqual(self.casts, ['host2'])
+
+    def test_schedule_create_volume_with_extra_specs(self):
+        self.driver.host_manager.host_state_map['host1'].capabilities[
+                'lvm_type'] = 'thin'
+        self.stubs.Set(db, 'volume_type_extra_specs_get',
+                       lambda ctxt, type_id: {'lvm_type': 'thin'})
+        self._stub_volume(10, volume_type_id=1)
+        self.driver.schedule_create_volume(self.context, 'fake_volume')
+        self.assertEqual(self.casts, ['host1'])
+
+    def test_schedule_create_volume_skips_down_hosts(self):
+        self.driver.host_manager.host_state_map['host4'].service_up = False
+        self._stub_volume(10)
+        self.driver.schedule_create_volume(self.context, 'fake_volume')
+        self.assertEqual(self.casts, ['host3'])
+
+    def test_schedule_create_volume_checks_new_hosts(self):
+        self.driver.host_manager.update_service_capabilities('volume',
+                'host5', {'free_capacity_gb': 100000})
+        self.mox.StubOutWithMock(self.driver.host_manager,
+                                 'update_service_states')
+        self.driver.host_manager.update_service_states(mox.IgnoreArg())
+        self._stub_volume(10)
+        self.driver.schedule_create_volume(self.context, 'fake_volume')
+        self.assertEqual(self.casts, ['host4'])
+
+    def test_schedule_create_volume_no_valid_host(self):
+        self._stub_volume(10000)
+        self.assertRaises(exception.NoValidHost,
+                          self.driver.schedule_create_volume,
+                          self.context, 'fake_volume')
+        self.assertEqual(self.casts, [])
+
+    def test_schedule_create_volume_forced_host(self):
+        self.context = context.get_admin_context()
+        self._stub_volume(10, availability_zone='zone1:host3')
+        self.driver.schedule_create_volume(self.context, 'fake_volume')
+        self.assertEqual(self.casts, ['host3'])
+
+    def test_schedule_create_volume_forced_host_unknown(self):
+        self.context = context.get_admin_context()
+        self._stub_volume(10, availability_zone='zone1:host5')
+        self.assertRaises(exception.WillNotSchedule,
+                          self.driver.schedule_create_volume,
+                          self.context, 'fake_volume')
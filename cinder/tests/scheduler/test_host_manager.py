@@ -0,0 +1,163 @@
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For HostManager
+"""
+
+import datetime
+
+from cinder import context
+from cinder import db
+from cinder import flags
+from cinder.openstack.common import timeutils
+from cinder.scheduler import host_manager
+from cinder import test
+from cinder.tests.scheduler import fakes
+
+
+FLAGS = flags.FLAGS
+
+
+class HostManagerTestCase(test.TestCase):
+    """Test case for HostManager class"""
+
+    def setUp(self):
+        super(HostManagerTestCase, self).setUp()
+        self.host_manager = host_manager.HostManager()
+
+    def tearDown(self):
+        timeutils.clear_time_override()
+        super(HostManagerTestCase, self).tearDown()
+
+    def test_update_service_capabilities(self):
+        timeutils.set_time_override()
+        self.host_manager.update_service_capabilities('volume', 'host1',
+                {'total_capacity_gb': 100, 'free_capacity_gb': 60,
+                 'allocated_capacity_gb': 40, 'lv_count': 3,
+                 'availability_zone': 'zone1'})
+        self.host_manager.update_service_capabilities('compute', 'host2',
+                {'free_ram_mb': 1024})
+
+        host_states = self.host_manager.get_all_host_states()
+        self.assertEqual(len(host_states), 1)
+        host_state = host_states[0]
+        self.assertEqual(host_state.host, 'host1')
+        self.assertEqual(host_state.availability_zone, 'zone1')
+        self.assertEqual(host_state.total_capacity_gb, 100)
+        self.assertEqual(host_state.free_capacity_gb, 60)
+        self.assertEqual(host_state.allocated_capacity_gb, 40)
+        self.assertEqual(host_state.volume_count, 3)
+        self.assertEqual(host_state.updated, timeutils.utcnow())
+        self.assertEqual(self.host_manager.get_host_list(),
+                         [{'host': 'host1', 'service': 'volume'}])
+
+    def test_update_replaces_host_state_in_place(self):
+        self.host_manager.update_service_capabilities('volume', 'host1',
+                {'free_capacity_gb': 60})
+        host_state = self.host_manager.get_all_host_states()[0]
+        self.host_manager.update_service_capabilities('volume', 'host1',
+                {'free_capacity_gb': 50})
+        self.assertTrue(self.host_manager.get_all_host_states()[0] is
+                        host_state)
+        self.assertEqual(host_state.free_capacity_gb, 50)
+
+    def test_stale_hosts_expire(self):
+        self.flags(host_state_ttl=60)
+        timeutils.set_time_override()
+        self.host_manager.update_service_capabilities('volume', 'host1', {})
+        timeutils.advance_time_seconds(30)
+        self.host_manager.update_service_capabilities('volume', 'host2', {})
+        timeutils.advance_time_seconds(40)
+
+        host_states = self.host_manager.get_all_host_states()
+        self.assertEqual([h.host for h in host_states], ['host2'])
+        self.assertEqual(self.host_manager.get_service_capabilities(),
+                         {'host2': {}})
+
+    def test_update_service_states(self):
+        ctxt = context.get_admin_context()
+        for host in ('host1', 'host2', 'host3'):
+            self.host_manager.update_service_capabilities('volume', host, {})
+        services = [{'host': 'host1', 'updated_at': timeutils.utcnow(),
+                     'created_at': None},
+                    {'host': 'host2', 'updated_at': None,
+                     'created_at': datetime.datetime(2000, 1, 1)}]
+        self.mox.StubOutWithMock(db, 'service_get_all_by_topic')
+        db.service_get_all_by_topic(ctxt,
+                                    FLAGS.volume_topic).AndReturn(services)
+        self.mox.ReplayAll()
+
+        self.host_manager.update_service_states(ctxt)
+        host_state_map = self.host_manager.host_state_map
+        self.assertEqual(host_state_map['host1'].service_up, True)
+        self.assertEqual(host_state_map['host2'].service_up, False)
+        self.assertEqual(host_state_map['host3'].service_up, False)
+
+    def test_get_all_host_states_does_not_use_db(self):
+        self.mox.StubOutWithMock(db, 'service_get_all_by_topic')
+        self.mox.StubOutWithMock(db, 'service_get_all_volume_sorted')
+        self.mox.ReplayAll()
+        fake_manager = fakes.FakeHostManager()
+        self.assertEqual(len(fake_manager.get_all_host_states()), 4)
+
+
+class HostStateTestCase(test.TestCase):
+    """Test case for HostState class"""
+
+    def test_consume_from_volume(self):
+        host_state = host_manager.HostState('host1',
+                {'total_capacity_gb': 100, 'free_capacity_gb': 60,
+                 'allocated_capacity_gb': 40, 'volume_count': 3})
+        host_state.consume_from_volume({'size': 10})
+        self.assertEqual(host_state.free_capacity_gb, 50)
+        self.assertEqual(host_state.allocated_capacity_gb, 50)
+        self.assertEqual(host_state.volume_count, 4)
+
+    def test_consume_without_reported_capacity(self):
+        host_state = host_manager.HostState('host1', {})
+        host_state.consume_from_volume({'size': 10})
+        self.assertEqual(host_state.free_capacity_gb, None)
+        self.assertEqual(host_state.allocated_capacity_gb, 10)
+        self.assertEqual(host_state.volume_count, 1)
+
+    def test_claims_survive_updates_until_finished(self):
+        host_state = host_manager.HostState('host1',
+                {'free_capacity_gb': 60, 'volume_count': 3})
+        host_state.consume_from_volume({'id': 'vol1', 'size': 10})
+        host_state.consume_from_volume({'id': 'vol2', 'size': 5})
+
+        host_state.update_from_capabilities({'free_capacity_gb': 60,
+                                             'volume_count': 3})
+        self.assertEqual(host_state.free_capacity_gb, 45)
+        self.assertEqual(host_state.volume_count, 5)
+
+        host_state.update_from_capabilities({'free_capacity_gb': 50,
+                                             'volume_count': 4,
+                                             'finished_volume_ids': ['vol1']})
+        self.assertEqual(host_state.free_capacity_gb, 45)
+        self.assertEqual(host_state.volume_count, 5)
+        self.assertEqual(host_state.claims.keys(), ['vol2'])
+        self.assertFalse('finished_volume_ids' in host_state.capabilities)
+
+    def test_claims_expire(self):
+        self.flags(scheduler_claim_ttl=60)
+        timeutils.set_time_override()
+        host_state = host_manager.HostState('host1', {'free_capacity_gb': 60})
+        host_state.consume_from_volume({'id': 'vol1', 'size': 10})
+        timeutils.advance_time_seconds(61)
+        host_state.update_from_capabilities({'free_capacity_gb': 60})
+        timeutils.clear_time_override()
+        self.assertEqual(host_state.free_capacity_gb, 60)
+        self.assertEqual(host_state.claims, {})
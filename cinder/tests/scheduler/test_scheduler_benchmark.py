@@ -0,0 +1,45 @@
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For the scheduler benchmark harness.
+"""
+
+from cinder import context
+from cinder import db
+from cinder import test
+from cinder.testing import scheduler_benchmark
+
+
+class SchedulerBenchmarkTestCase(test.TestCase):
+    """Test case for the scheduler benchmark harness."""
+
+    def test_parse_request_sizes(self):
+        self.assertEqual(scheduler_benchmark.parse_request_sizes('1:50, 10'),
+                         [(1, 50), (10, 1)])
+
+    def test_run_drivers(self):
+        ctxt = context.get_admin_context()
+        for driver in sorted(scheduler_benchmark.DRIVERS):
+            fleet = scheduler_benchmark.Fleet(hosts=5, capacity_gb=100,
+                                              zones=2, volumes_per_host=1)
+            result = scheduler_benchmark.run(driver, fleet, requests=10,
+                                             request_sizes=[(1, 1)],
+                                             report_interval=4,
+                                             zone_request_percent=50)
+            self.assertEqual(result['driver'], driver)
+            self.assertEqual(result['failures'], 0)
+            self.assertEqual(result['overcommitted_hosts'], 0)
+            self.assertAlmostEqual(result['utilization_mean'], 0.03)
+            self.assertEqual(db.volume_host_allocation_get_all(ctxt), [])
@@ -0,0 +1,443 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Unit tests for the DB API"""
+
+import datetime
+
+from cinder import context
+from cinder import db
+from cinder.db.sqlalchemy import api as sqlalchemy_api
+from cinder.db.sqlalchemy import models
+from cinder.db.sqlalchemy import session
+from cinder.db.sqlalchemy.session import get_session
+from cinder import exception
+from cinder import flags
+from cinder.openstack.common import timeutils
+from cinder import test
+
+FLAGS = flags.FLAGS
+
+
+class VolumeHostAllocationTestCase(test.TestCase):
+    """Tests for the per host volume allocations."""
+
+    def setUp(self):
+        super(VolumeHostAllocationTestCase, self).setUp()
+        self.context = context.get_admin_context()
+
+    def _allocations(self):
+        return dict((a['host'], (a['volume_count'], a['allocated_gb']))
+                    for a in db.volume_host_allocation_get_all(self.context))
+
+    def _create_volume(self, size, host=None):
+        return db.volume_create(self.context, {'size': size, 'host': host})
+
+    def test_allocations_follow_volumes(self):
+        volume = self._create_volume(10, host='host1')
+        self._create_volume(5, host='host1')
+        unplaced = self._create_volume(2)
+        self.assertEqual(self._allocations(), {'host1': (2, 15)})
+
+        db.volume_update(self.context, unplaced['id'], {'host': 'host2'})
+        db.volume_update(self.context, volume['id'], {'host': 'host2',
+                                                      'status': 'migrated'})
+        self.assertEqual(self._allocations(), {'host1': (1, 5),
+                                               'host2': (2, 12)})
+
+        db.volume_destroy(self.context, volume['id'])
+        db.volume_destroy(self.context, volume['id'])
+        self.assertEqual(self._allocations(), {'host1': (1, 5),
+                                               'host2': (1, 2)})
+
+    def test_allocations_follow_volume_resizes(self):
+        volume = self._create_volume(10, host='host1')
+        db.volume_update(self.context, volume['id'], {'size': 15})
+        self.assertEqual(self._allocations(), {'host1': (1, 15)})
+        db.volume_update(self.context, volume['id'], {'host': 'host2',
+                                                      'size': 20})
+        self.assertEqual(self._allocations(), {'host1': (0, 0),
+                                               'host2': (1, 20)})
+
+    def test_volume_set_hosts(self):
+        volume1 = self._create_volume(10)
+        volume2 = self._create_volume(5, host='host1')
+        now = timeutils.utcnow()
+        db.volume_set_hosts(self.context, {volume1['id']: 'host1',
+                                           volume2['id']: 'host2'}, now)
+        volumes = db.volume_get_all_by_ids(self.context,
+                                           [volume1['id'], volume2['id']])
+        self.assertEqual(sorted((v['id'], v['host'], v['scheduled_at'])
+                                for v in volumes),
+                         sorted([(volume1['id'], 'host1', now),
+                                 (volume2['id'], 'host2', now)]))
+        self.assertEqual(self._allocations(), {'host1': (1, 10),
+                                               'host2': (1, 5)})
+
+    def test_service_get_all_volume_sorted_uses_allocations(self):
+        for host in ('host1', 'host2'):
+            db.service_create(self.context, {'host': host,
+                                             'topic': FLAGS.volume_topic,
+                                             'binary': 'cinder-volume'})
+        self._create_volume(10, host='host1')
+        self._create_volume(5, host='host2')
+        results = db.service_get_all_volume_sorted(self.context)
+        self.assertEqual([(s['host'], gigs) for s, gigs in results],
+                         [('host2', 5), ('host1', 10)])
+
+    def test_first_allocations_of_a_host_added_concurrently(self):
+        self._create_volume(10, host='host1')
+        session = get_session()
+        with session.begin():
+            # another transaction added the row since the lookup
+            allocation_ref = sqlalchemy_api._volume_host_allocation_create(
+                    self.context, 'host1', session)
+            self.assertEqual(allocation_ref['volume_count'], 1)
+            allocation_ref.volume_count += 1
+            allocation_ref.save(session=session)
+        self.assertEqual(self._allocations(), {'host1': (2, 10)})
+        self.assertEqual(len(db.volume_host_allocation_get_all(self.context)),
+                         1)
+
+    def test_refresh_repairs_drift(self):
+        self._create_volume(10, host='host1')
+        self._create_volume(5, host='host2')
+        session = get_session()
+        with session.begin():
+            session.query(models.VolumeHostAllocation).\
+                    filter_by(host='host1').\
+                    update({'volume_count': 7, 'allocated_gb': 70})
+            session.query(models.VolumeHostAllocation).\
+                    filter_by(host='host2').\
+                    update({'deleted': True})
+            session.add(models.VolumeHostAllocation(host='host3',
+                                                    volume_count=1,
+                                                    allocated_gb=1))
+
+        drifted = db.volume_host_allocation_refresh(self.context)
+        self.assertEqual(drifted, ['host1', 'host2', 'host3'])
+        self.assertEqual(self._allocations(), {'host1': (1, 10),
+                                               'host2': (1, 5),
+                                               'host3': (0, 0)})
+        self.assertEqual(db.volume_host_allocation_refresh(self.context), [])
+
+
+class ReservationTestCase(test.TestCase):
+    """Tests for the quota reservations."""
+
+    def setUp(self):
+        super(ReservationTestCase, self).setUp()
+        self.context = context.get_admin_context()
+
+    def test_reservation_expire(self):
+        usage = db.quota_usage_create(self.context, 'fake_project',
+                                      'volumes', 0, 3, 0)
+        now = timeutils.utcnow()
+        for uuid, delta, expire in (('expired', 2, now),
+                                    ('negative', -1, now),
+                                    ('current', 1, now +
+                                     datetime.timedelta(days=1))):
+            db.reservation_create(self.context, uuid, usage, 'fake_project',
+                                  'volumes', delta, expire)
+        db.reservation_expire(self.context)
+        self.assertRaises(exception.ReservationNotFound,
+                          db.reservation_get, self.context, 'expired')
+        self.assertRaises(exception.ReservationNotFound,
+                          db.reservation_get, self.context, 'negative')
+        self.assertEqual(db.reservation_get(self.context, 'current')['delta'],
+                         1)
+        usages = db.quota_usage_get_all_by_project(self.context,
+                                                   'fake_project')
+        self.assertEqual(usages['volumes'], {'in_use': 0, 'reserved': 1})
+
+    def test_reservation_expire_several_usages(self):
+        now = timeutils.utcnow()
+        for resource, deltas in (('volumes', (1, 2)),
+                                 ('gigabytes', (10, 20, 30))):
+            usage = db.quota_usage_create(self.context, 'fake_project',
+                                          resource, 0, sum(deltas), 0)
+            for i, delta in enumerate(deltas):
+                db.reservation_create(self.context, '%s-%d' % (resource, i),
+                                      usage, 'fake_project', resource,
+                                      delta, now)
+        db.reservation_expire(self.context)
+        usages = db.quota_usage_get_all_by_project(self.context,
+                                                   'fake_project')
+        self.assertEqual(usages['volumes'], {'in_use': 0, 'reserved': 0})
+        self.assertEqual(usages['gigabytes'], {'in_use': 0, 'reserved': 0})
+
+
+class PaginationTestCase(test.TestCase):
+    """Tests for the paginated volume and snapshot listings."""
+
+    def setUp(self):
+        super(PaginationTestCase, self).setUp()
+        self.context = context.RequestContext('fake_user', 'fake_project')
+        self.volumes = [db.volume_create(self.context,
+                                         {'size': size,
+                                          'project_id': 'fake_project'})
+                        for size in (3, 1, 4, 1, 5)]
+        db.volume_create(context.get_admin_context(),
+                         {'size': 9, 'project_id': 'other_project'})
+
+    def _page_through(self, get_page, **kwargs):
+        pages = []
+        marker = None
+        while True:
+            page = get_page(marker=marker, limit=2, **kwargs)
+            if not page:
+                return pages
+            pages.append([v['id'] for v in page])
+            marker = page[-1]['id']
+
+    def test_volume_get_all_by_project_pages(self):
+        get_page = lambda **kwargs: db.volume_get_all_by_project(
+                self.context, 'fake_project', **kwargs)
+        pages = self._page_through(get_page, sort_key='id', sort_dir='asc')
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual(sum(pages, []), sorted(v['id'] for v in self.volumes))
+
+    def test_volume_get_all_pages(self):
+        admin_context = context.get_admin_context()
+        get_page = lambda **kwargs: db.volume_get_all(admin_context,
+                                                      **kwargs)
+        ids = sum(self._page_through(get_page), [])
+        all_ids = [v['id'] for v in db.volume_get_all(admin_context)]
+        self.assertEqual(len(ids), 6)
+        self.assertEqual(ids, all_ids)
+
+    def test_snapshot_get_all_by_project_pages(self):
+        snapshots = [db.snapshot_create(self.context,
+                                        {'volume_id': volume['id'],
+                                         'project_id': 'fake_project'})
+                     for volume in self.volumes]
+        get_page = lambda **kwargs: db.snapshot_get_all_by_project(
+                self.context, 'fake_project', **kwargs)
+        ids = sum(self._page_through(get_page, sort_key='id',
+                                     sort_dir='desc'), [])
+        self.assertEqual(ids, sorted([s['id'] for s in snapshots],
+                                     reverse=True))
+
+    def test_invalid_marker(self):
+        self.assertRaises(exception.MarkerNotFound,
+                          db.volume_get_all_by_project, self.context,
+                          'fake_project', marker='missing')
+
+    def test_invalid_sort_key(self):
+        self.assertRaises(exception.InvalidSortKey,
+                          db.volume_get_all_by_project, self.context,
+                          'fake_project', sort_key='missing')
+        # an existing but unindexed column can't be sorted on either
+        self.assertRaises(exception.InvalidSortKey,
+                          db.volume_get_all_by_project, self.context,
+                          'fake_project', sort_key='size')
+
+
+class VolumeFiltersTestCase(test.TestCase):
+    """Tests for the filters of the volume listings."""
+
+    def setUp(self):
+        super(VolumeFiltersTestCase, self).setUp()
+        self.context = context.RequestContext('fake_user', 'fake_project')
+        self.volumes = {}
+        for name, status, metadata in (('vol1', 'available', {'a': '1'}),
+                                       ('vol2', 'in-use', {'a': '1',
+                                                           'b': '2'}),
+                                       ('vol3', 'error', {'a': '2'})):
+            volume = db.volume_create(self.context,
+                                      {'display_name': name,
+                                       'status': status,
+                                       'project_id': 'fake_project',
+                                       'metadata': metadata})
+            self.volumes[volume['id']] = name
+
+    def _names(self, **filters):
+        volumes = db.volume_get_all_by_project(self.context, 'fake_project',
+                                               filters=filters)
+        return sorted(self.volumes[v['id']] for v in volumes)
+
+    def test_exact_filters(self):
+        self.assertEqual(self._names(status='in-use'), ['vol2'])
+        self.assertEqual(self._names(display_name='vol3', status='error'),
+                         ['vol3'])
+        self.assertEqual(self._names(display_name='vol3', status='in-use'),
+                         [])
+
+    def test_in_list_filter(self):
+        self.assertEqual(self._names(status=['available', 'error']),
+                         ['vol1', 'vol3'])
+
+    def test_metadata_filter(self):
+        self.assertEqual(self._names(metadata={'a': '1'}), ['vol1', 'vol2'])
+        self.assertEqual(self._names(metadata={'a': '1', 'b': '2'}),
+                         ['vol2'])
+        self.assertEqual(self._names(metadata={'a': '2', 'b': '2'}), [])
+
+    def test_deleted_metadata_does_not_match(self):
+        volume_id = [k for k, v in self.volumes.items() if v == 'vol2'][0]
+        db.volume_metadata_delete(self.context, volume_id, 'b')
+        self.assertEqual(self._names(metadata={'b': '2'}), [])
+
+    def test_unknown_filters_are_ignored(self):
+        self.assertEqual(self._names(unknown='value'),
+                         ['vol1', 'vol2', 'vol3'])
+
+
+class VolumeGetTestCase(test.TestCase):
+    """Tests for fetching and updating single volumes."""
+
+    def setUp(self):
+        super(VolumeGetTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        self.volume = db.volume_create(self.context,
+                                       {'status': 'available',
+                                        'metadata': {'k': 'v'}})
+
+    def test_volume_get_columns_to_join(self):
+        volume = db.volume_get(self.context, self.volume['id'])
+        self.assertEqual(volume['volume_metadata'][0]['value'], 'v')
+
+        volume = db.volume_get(self.context, self.volume['id'],
+                               columns_to_join=[])
+        self.assertEqual(volume['status'], 'available')
+        self.assertEqual(volume['name'], self.volume['name'])
+        self.assertFalse('volume_metadata' in volume.__dict__)
+
+    def test_volume_update(self):
+        db.volume_update(self.context, self.volume['id'],
+                         {'status': 'in-use', 'metadata': {'k': 'w'}})
+        volume = db.volume_get(self.context, self.volume['id'])
+        self.assertEqual(volume['status'], 'in-use')
+        self.assertEqual(volume['volume_metadata'][0]['value'], 'w')
+        self.assertRaises(exception.VolumeNotFound, db.volume_update,
+                          self.context, 'missing', {'status': 'error'})
+
+
+class ArchiveDeletedRowsTestCase(test.TestCase):
+    """Tests for moving soft-deleted rows into the shadow tables."""
+
+    def setUp(self):
+        super(ArchiveDeletedRowsTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        self.flags(deleted_rows_retention_days=0)
+        self.volume_ids = []
+        for i in range(3):
+            volume = db.volume_create(self.context,
+                                      {'metadata': {'k': 'v'}})
+            self.volume_ids.append(volume['id'])
+        db.volume_destroy(self.context, self.volume_ids[0])
+        db.volume_destroy(self.context, self.volume_ids[1])
+
+    def _count(self, table_name):
+        return session.get_engine().execute(
+                'SELECT COUNT(*) FROM %s' % table_name).scalar()
+
+    def test_archive_deleted_rows(self):
+        archived = db.archive_deleted_rows(self.context)
+        self.assertEqual(archived['volumes'], 2)
+        self.assertEqual(archived['volume_metadata'], 2)
+        self.assertEqual(self._count('volumes'), 1)
+        self.assertEqual(self._count('shadow_volumes'), 2)
+        self.assertEqual(self._count('volume_metadata'), 1)
+        self.assertEqual(self._count('shadow_volume_metadata'), 2)
+        self.assertEqual(db.volume_get(self.context,
+                                       self.volume_ids[2])['id'],
+                         self.volume_ids[2])
+        self.assertEqual(sum(db.archive_deleted_rows(self.context).values()),
+                         0)
+
+    def test_archive_deleted_rows_still_referenced(self):
+        db.iscsi_target_create_safe(self.context,
+                                    {'host': 'host1', 'target_num': 1,
+                                     'volume_id': self.volume_ids[0]})
+        archived = db.archive_deleted_rows(self.context)
+        self.assertEqual(archived['volumes'], 1)
+        self.assertEqual(archived['volume_metadata'], 2)
+        self.assertEqual(self._count('volumes'), 2)
+        self.assertEqual(session.get_engine().execute(
+                'SELECT id FROM shadow_volumes').fetchall(),
+                [(self.volume_ids[1],)])
+
+    def test_archive_deleted_rows_max_rows(self):
+        self.flags(deleted_rows_archive_batch_size=1)
+        archived = db.archive_deleted_rows(self.context, max_rows=3)
+        self.assertEqual(sum(archived.values()), 3)
+        self.assertEqual(self._count('shadow_volume_metadata') +
+                         self._count('shadow_volumes'), 3)
+
+    def test_archive_deleted_rows_purge(self):
+        archived = db.archive_deleted_rows(self.context, purge=True)
+        self.assertEqual(archived['volumes'], 2)
+        self.assertEqual(self._count('volumes'), 1)
+        self.assertEqual(self._count('shadow_volumes'), 0)
+
+    def test_archive_deleted_rows_retention(self):
+        self.flags(deleted_rows_retention_days=1)
+        self.assertEqual(sum(db.archive_deleted_rows(self.context).values()),
+                         0)
+        timeutils.set_time_override(timeutils.utcnow() +
+                                    datetime.timedelta(days=2))
+        try:
+            archived = db.archive_deleted_rows(self.context)
+        finally:
+            timeutils.clear_time_override()
+        self.assertEqual(archived['volumes'], 2)
+
+
+class ReplicaTestCase(test.TestCase):
+    """Tests for reading replica safe DB API calls from the replica."""
+
+    def setUp(self):
+        super(ReplicaTestCase, self).setUp()
+        # the replica is a second, empty in-memory database, so a read that
+        # finds the volume used the primary.
+        self.flags(sql_replica_connection='sqlite://')
+        self.stubs.Set(session, '_REPLICA_ENGINE', None)
+        self.stubs.Set(session, '_REPLICA_MAKER', None)
+        # some models reference tables cinder doesn't have, so only the
+        # tables the volume reads use are created
+        tables = [models.Volume.__table__, models.VolumeMetadata.__table__,
+                  models.VolumeTypes.__table__]
+        models.BASE.metadata.create_all(session.get_replica_engine(),
+                                        tables=tables)
+        self.volume = db.volume_create(context.get_admin_context(),
+                                       {'project_id': 'project'})
+
+    def _volume_ids(self, ctxt):
+        return [v['id'] for v in db.volume_get_all_by_project(ctxt,
+                                                              'project')]
+
+    def test_replica_safe_calls_read_the_replica(self):
+        ctxt = context.RequestContext('user', 'project')
+        self.assertEqual(self._volume_ids(ctxt), [])
+        self.assertEqual(db.volume_get(ctxt, self.volume['id'])['id'],
+                         self.volume['id'])
+        self.assertFalse(ctxt.db_written)
+
+    def test_reads_after_a_write_use_the_primary(self):
+        ctxt = context.RequestContext('user', 'project')
+        db.volume_update(ctxt, self.volume['id'], {'status': 'in-use'})
+        self.assertTrue(ctxt.db_written)
+        self.assertEqual(self._volume_ids(ctxt), [self.volume['id']])
+
+        ctxt = context.RequestContext.from_dict(ctxt.to_dict())
+        self.assertEqual(self._volume_ids(ctxt), [self.volume['id']])
+
+    def test_no_replica(self):
+        self.flags(sql_replica_connection=None)
+        ctxt = context.RequestContext('user', 'project')
+        self.assertEqual(self._volume_ids(ctxt), [self.volume['id']])
@@ -0,0 +1,35 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests that the DB API queries are answered from indexes."""
+
+from cinder import test
+from cinder.testing import db_explain
+
+
+# these read a row per host by design
+FULL_SCANS_ALLOWED = ('service_get_all_volume_sorted',
+                      'volume_host_allocation_get_all')
+
+
+class DbExplainTestCase(test.TestCase):
+
+    def test_no_full_table_scans(self):
+        scans = [(name, table) for name, table, statement
+                 in db_explain.explain()
+                 if name not in FULL_SCANS_ALLOWED]
+        self.assertEqual(scans, [])
@@ -0,0 +1,100 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Unit tests for the SQLAlchemy session handling."""
+
+import sqlite3
+import time
+
+from sqlalchemy.exc import DisconnectionError
+from sqlalchemy.exc import TimeoutError
+
+from cinder.db.sqlalchemy import session
+from cinder import test
+
+
+class FakeConnectionRecord(object):
+    def __init__(self):
+        self.info = {}
+
+
+class FakeMySQLConnection(object):
+    class OperationalError(Exception):
+        pass
+
+    def __init__(self, error=None):
+        self.pings = 0
+        self.error = error
+
+    def ping(self, reconnect):
+        self.pings += 1
+        if self.error:
+            raise self.OperationalError(self.error, 'gone away')
+
+
+class SessionTestCase(test.TestCase):
+
+    def setUp(self):
+        super(SessionTestCase, self).setUp()
+        self.stats = session.get_pool_stats()
+
+    def _stats_delta(self):
+        stats = session.get_pool_stats()
+        return dict((key, stats[key] - self.stats[key])
+                    for key in ('checkouts', 'overflow_checkouts',
+                                'timeouts', 'pings', 'invalidations'))
+
+    def test_ping_skips_recently_used_connections(self):
+        self.flags(sql_ping_interval=60)
+        conn = FakeMySQLConnection()
+        record = FakeConnectionRecord()
+        session.ping_listener(conn, record, None)
+        self.assertEqual(conn.pings, 1)
+
+        session.checkin_listener(conn, record)
+        session.ping_listener(conn, record, None)
+        self.assertEqual(conn.pings, 1)
+
+        record.info['checked_in_at'] = time.time() - 61
+        session.ping_listener(conn, record, None)
+        self.assertEqual(conn.pings, 2)
+        self.assertEqual(self._stats_delta()['pings'], 2)
+
+    def test_ping_invalidates_dead_connections(self):
+        conn = FakeMySQLConnection(error=2006)
+        self.assertRaises(DisconnectionError, session.ping_listener,
+                          conn, FakeConnectionRecord(), None)
+        self.assertEqual(self._stats_delta()['invalidations'], 1)
+
+        conn = FakeMySQLConnection(error=1045)
+        self.assertRaises(conn.OperationalError, session.ping_listener,
+                          conn, FakeConnectionRecord(), None)
+        self.assertEqual(self._stats_delta()['invalidations'], 1)
+
+    def test_stats_queue_pool(self):
+        pool = session.StatsQueuePool(lambda: sqlite3.connect(':memory:'),
+                                      pool_size=1, max_overflow=1,
+                                      timeout=0.01)
+        conn1 = pool.connect()
+        conn2 = pool.connect()
+        self.assertRaises(TimeoutError, pool.connect)
+        conn2.close()
+        conn1.close()
+        stats = self._stats_delta()
+        self.assertEqual(stats['checkouts'], 2)
+        self.assertEqual(stats['overflow_checkouts'], 1)
+        self.assertEqual(stats['timeouts'], 1)
@@ -15,11 +15,17 @@
 #    under the License.
 
 import os.path
+import shutil
 import string
+import tempfile
 
+from cinder import exception
+from cinder import flags
 from cinder import test
 from cinder.volume import iscsi
 
+FLAGS = flags.FLAGS
+
 
 class TargetAdminTestCase(object):
 
@@ -95,6 +101,33 @@ class TgtAdmTestCase(test.TestCase, TargetAdminTestCase):
         'tgt-admin --update iqn.2011-09.org.foo.bar:blaa',
         'tgt-admin --delete iqn.2010-10.org.openstack:volume-blaa'])
 
+    def test_create_iscsi_targets(self):
+        self.flags(volumes_dir=tempfile.mkdtemp())
+        tgtadm = iscsi.get_target_admin()
+        tgtadm.set_execute(self.fake_execute)
+        tgtadm.create_iscsi_targets([
+            ('iqn.2011-09.org.foo.bar:volume-1', 1, 0, '/dev/vg/volume-1'),
+            ('iqn.2011-09.org.foo.bar:volume-2', 1, 0, '/dev/vg/volume-2')])
+        self.verify_cmds(['tgt-admin --update ALL'])
+        self.assertEqual(sorted(os.listdir(FLAGS.volumes_dir)),
+                         ['volume-1', 'volume-2'])
+        shutil.rmtree(FLAGS.volumes_dir)
+
+    def test_create_iscsi_targets_failure(self):
+        self.flags(volumes_dir=tempfile.mkdtemp())
+
+        def _fake_execute(*cmd, **kwargs):
+            self.assertFalse('check_exit_code' in kwargs)
+            raise exception.ProcessExecutionError(exit_code=1)
+        tgtadm = iscsi.get_target_admin()
+        tgtadm.set_execute(_fake_execute)
+        self.assertRaises(exception.ISCSITargetCreateFailed,
+                          tgtadm.create_iscsi_targets,
+                          [('iqn.2011-09.org.foo.bar:volume-1', 1, 0,
+                            '/dev/vg/volume-1')],
+                          check_exit_code=False)
+        shutil.rmtree(FLAGS.volumes_dir)
+
 
 class IetAdmTestCase(test.TestCase, TargetAdminTestCase):
 
@@ -157,6 +157,9 @@ class FakeDriver(object):
     def destroy_all_by_project(self, context, project_id):
         self.called.append(('destroy_all_by_project', context, project_id))
 
+    def invalidate_limits(self, project_id=None, quota_class=None):
+        self.called.append(('invalidate_limits', project_id, quota_class))
+
     def expire(self, context):
         self.called.append(('expire', context))
 
@@ -524,6 +527,22 @@ class QuotaEngineTestCase(test.TestCase):
                 ('destroy_all_by_project', context, 'test_project'),
                 ])
 
+    def test_invalidate_limits(self):
+        driver = FakeDriver()
+        quota_obj = self._make_quota_obj(driver)
+        quota_obj.invalidate_limits(project_id='test_project')
+        quota_obj.invalidate_limits(quota_class='test_class')
+
+        self.assertEqual(driver.called, [
+                ('invalidate_limits', 'test_project', None),
+                ('invalidate_limits', None, 'test_class'),
+                ])
+
+    def test_invalidate_limits_of_a_driver_without_cache(self):
+        # drivers written before the limits cache lack invalidate_limits
+        quota_obj = self._make_quota_obj(object())
+        quota_obj.invalidate_limits(project_id='test_project')
+
     def test_expire(self):
         context = FakeContext(None, None)
         driver = FakeDriver()
@@ -742,19 +761,15 @@ class DbQuotaDriverTestCase(test.TestCase):
                     ),
                 ))
 
-    def _stub_get_project_quotas(self):
-        def fake_get_project_quotas(context, resources, project_id,
-                                    quota_class=None, defaults=True,
-                                    usages=True):
-            self.calls.append('get_project_quotas')
-            return dict((k, dict(limit=v.default))
-                        for k, v in resources.items())
+    def _stub_get_limits(self):
+        def fake_get_limits(context):
+            self.calls.append('_get_limits')
+            return {}, {}
 
-        self.stubs.Set(self.driver, 'get_project_quotas',
-                       fake_get_project_quotas)
+        self.stubs.Set(self.driver, '_get_limits', fake_get_limits)
 
     def test_get_quotas_has_sync_unknown(self):
-        self._stub_get_project_quotas()
+        self._stub_get_limits()
         self.assertRaises(exception.QuotaResourceUnknown,
                           self.driver._get_quotas,
                           None, quota.QUOTAS._resources,
@@ -762,7 +777,7 @@ class DbQuotaDriverTestCase(test.TestCase):
         self.assertEqual(self.calls, [])
 
     def test_get_quotas_no_sync_unknown(self):
-        self._stub_get_project_quotas()
+        self._stub_get_limits()
         self.assertRaises(exception.QuotaResourceUnknown,
                           self.driver._get_quotas,
                           None, quota.QUOTAS._resources,
@@ -770,7 +785,7 @@ class DbQuotaDriverTestCase(test.TestCase):
         self.assertEqual(self.calls, [])
 
     def test_get_quotas_has_sync_no_sync_resource(self):
-        self._stub_get_project_quotas()
+        self._stub_get_limits()
         self.assertRaises(exception.QuotaResourceUnknown,
                           self.driver._get_quotas,
                           None, quota.QUOTAS._resources,
@@ -778,7 +793,7 @@ class DbQuotaDriverTestCase(test.TestCase):
         self.assertEqual(self.calls, [])
 
     def test_get_quotas_no_sync_has_sync_resource(self):
-        self._stub_get_project_quotas()
+        self._stub_get_limits()
         self.assertRaises(exception.QuotaResourceUnknown,
                           self.driver._get_quotas,
                           None, quota.QUOTAS._resources,
@@ -786,19 +801,89 @@ class DbQuotaDriverTestCase(test.TestCase):
         self.assertEqual(self.calls, [])
 
     def test_get_quotas_has_sync(self):
-        self._stub_get_project_quotas()
+        self._stub_get_limits()
         result = self.driver._get_quotas(FakeContext('test_project',
                                                      'test_class'),
                                          quota.QUOTAS._resources,
                                          ['volumes', 'gigabytes'],
                                          True)
 
-        self.assertEqual(self.calls, ['get_project_quotas'])
+        self.assertEqual(self.calls, ['_get_limits'])
         self.assertEqual(result, dict(
                 volumes=10,
                 gigabytes=1000,
                 ))
 
+    def test_get_limits_cached(self):
+        self._stub_get_by_project()
+        context = FakeContext('test_project', 'test_class')
+        result1 = self.driver._get_limits(context)
+        result2 = self.driver._get_limits(context)
+
+        self.assertEqual(self.calls, [
+                'quota_get_all_by_project',
+                'quota_class_get_all_by_name',
+                ])
+        self.assertEqual(result1, result2)
+        self.assertEqual(result1[0]['gigabytes'], 50)
+        self.assertEqual(result1[1]['gigabytes'], 500)
+
+    def test_get_limits_expired(self):
+        self._stub_get_by_project()
+        self.flags(quota_limit_cache_ttl=30)
+        context = FakeContext('test_project', 'test_class')
+        self.driver._get_limits(context)
+        timeutils.advance_time_seconds(31)
+        self.driver._get_limits(context)
+
+        self.assertEqual(self.calls, [
+                'quota_get_all_by_project',
+                'quota_class_get_all_by_name',
+                'quota_get_all_by_project',
+                'quota_class_get_all_by_name',
+                ])
+
+    def test_get_limits_expired_evicted(self):
+        self._stub_get_by_project()
+        self.flags(quota_limit_cache_ttl=30)
+        self.driver._get_limits(FakeContext('test_project', 'test_class'))
+        self.driver._get_limits(FakeContext('test_project', None))
+        timeutils.advance_time_seconds(31)
+        self.driver._get_limits(FakeContext('test_project', None))
+
+        self.assertEqual(self.driver._limits.keys(),
+                         [('test_project', None)])
+
+    def test_get_limits_cache_disabled(self):
+        self._stub_get_by_project()
+        self.flags(quota_limit_cache_ttl=0)
+        context = FakeContext('test_project', None)
+        self.driver._get_limits(context)
+        self.driver._get_limits(context)
+
+        self.assertEqual(self.calls, [
+                'quota_get_all_by_project',
+                'quota_get_all_by_project',
+                ])
+
+    def test_invalidate_limits(self):
+        self._stub_get_by_project()
+        context = FakeContext('test_project', 'test_class')
+        self.driver._get_limits(context)
+        self.driver.invalidate_limits(project_id='other_project')
+        self.driver._get_limits(context)
+        self.driver.invalidate_limits(project_id='test_project')
+        self.driver._get_limits(context)
+        self.driver.invalidate_limits(quota_class='test_class')
+        self.driver._get_limits(context)
+        self.driver.invalidate_limits()
+        self.driver._get_limits(context)
+
+        self.assertEqual(self.calls, [
+                'quota_get_all_by_project',
+                'quota_class_get_all_by_name',
+                ] * 4)
+
     def _stub_quota_reserve(self):
         def fake_quota_reserve(context, resources, quotas, deltas, expire,
                                until_refresh, max_age):
@@ -808,7 +893,7 @@ class DbQuotaDriverTestCase(test.TestCase):
         self.stubs.Set(db, 'quota_reserve', fake_quota_reserve)
 
     def test_reserve_bad_expire(self):
-        self._stub_get_project_quotas()
+        self._stub_get_limits()
         self._stub_quota_reserve()
         self.assertRaises(exception.InvalidReservationExpiration,
                           self.driver.reserve,
@@ -818,7 +903,7 @@ class DbQuotaDriverTestCase(test.TestCase):
         self.assertEqual(self.calls, [])
 
     def test_reserve_default_expire(self):
-        self._stub_get_project_quotas()
+        self._stub_get_limits()
         self._stub_quota_reserve()
         result = self.driver.reserve(FakeContext('test_project', 'test_class'),
                                      quota.QUOTAS._resources,
@@ -826,13 +911,13 @@ class DbQuotaDriverTestCase(test.TestCase):
 
         expire = timeutils.utcnow() + datetime.timedelta(seconds=86400)
         self.assertEqual(self.calls, [
-                'get_project_quotas',
+                '_get_limits',
                 ('quota_reserve', expire, 0, 0),
                 ])
         self.assertEqual(result, ['resv-1', 'resv-2', 'resv-3'])
 
     def test_reserve_int_expire(self):
-        self._stub_get_project_quotas()
+        self._stub_get_limits()
         self._stub_quota_reserve()
         result = self.driver.reserve(FakeContext('test_project', 'test_class'),
                                      quota.QUOTAS._resources,
@@ -840,13 +925,13 @@ class DbQuotaDriverTestCase(test.TestCase):
 
         expire = timeutils.utcnow() + datetime.timedelta(seconds=3600)
         self.assertEqual(self.calls, [
-                'get_project_quotas',
+                '_get_limits',
                 ('quota_reserve', expire, 0, 0),
                 ])
         self.assertEqual(result, ['resv-1', 'resv-2', 'resv-3'])
 
     def test_reserve_timedelta_expire(self):
-        self._stub_get_project_quotas()
+        self._stub_get_limits()
         self._stub_quota_reserve()
         expire_delta = datetime.timedelta(seconds=60)
         result = self.driver.reserve(FakeContext('test_project', 'test_class'),
@@ -855,13 +940,13 @@ class DbQuotaDriverTestCase(test.TestCase):
 
         expire = timeutils.utcnow() + expire_delta
         self.assertEqual(self.calls, [
-                'get_project_quotas',
+                '_get_limits',
                 ('quota_reserve', expire, 0, 0),
                 ])
         self.assertEqual(result, ['resv-1', 'resv-2', 'resv-3'])
 
     def test_reserve_datetime_expire(self):
-        self._stub_get_project_quotas()
+        self._stub_get_limits()
         self._stub_quota_reserve()
         expire = timeutils.utcnow() + datetime.timedelta(seconds=120)
         result = self.driver.reserve(FakeContext('test_project', 'test_class'),
@@ -869,13 +954,13 @@ class DbQuotaDriverTestCase(test.TestCase):
                                      dict(volumes=2), expire=expire)
 
         self.assertEqual(self.calls, [
-                'get_project_quotas',
+                '_get_limits',
                 ('quota_reserve', expire, 0, 0),
                 ])
         self.assertEqual(result, ['resv-1', 'resv-2', 'resv-3'])
 
     def test_reserve_until_refresh(self):
-        self._stub_get_project_quotas()
+        self._stub_get_limits()
         self._stub_quota_reserve()
         self.flags(until_refresh=500)
         expire = timeutils.utcnow() + datetime.timedelta(seconds=120)
@@ -884,13 +969,13 @@ class DbQuotaDriverTestCase(test.TestCase):
                                      dict(volumes=2), expire=expire)
 
         self.assertEqual(self.calls, [
-                'get_project_quotas',
+                '_get_limits',
                 ('quota_reserve', expire, 500, 0),
                 ])
         self.assertEqual(result, ['resv-1', 'resv-2', 'resv-3'])
 
     def test_reserve_max_age(self):
-        self._stub_get_project_quotas()
+        self._stub_get_limits()
         self._stub_quota_reserve()
         self.flags(max_age=86400)
         expire = timeutils.utcnow() + datetime.timedelta(seconds=120)
@@ -899,7 +984,7 @@ class DbQuotaDriverTestCase(test.TestCase):
                                      dict(volumes=2), expire=expire)
 
         self.assertEqual(self.calls, [
-                'get_project_quotas',
+                '_get_limits',
                 ('quota_reserve', expire, 0, 86400),
                 ])
         self.assertEqual(result, ['resv-1', 'resv-2', 'resv-3'])
@@ -970,20 +1055,21 @@ class QuotaReserveSqlAlchemyTestCase(test.TestCase):
 
             return quota_usage_ref
 
-        def fake_reservation_create(context, uuid, usage_id, project_id,
-                                    resource, delta, expire, session=None):
-            reservation_ref = self._make_reservation(
-                uuid, usage_id, project_id, resource, delta, expire,
-                timeutils.utcnow(), timeutils.utcnow())
-
-            self.reservations_created[resource] = reservation_ref
+        def fake_reservations_create(session, reservations):
+            for values in reservations:
+                reservation_ref = self._make_reservation(
+                    values['uuid'], values['usage_id'], values['project_id'],
+                    values['resource'], values['delta'], values['expire'],
+                    timeutils.utcnow(), timeutils.utcnow())
 
-            return reservation_ref
+                self.reservations_created[values['resource']] = \
+                        reservation_ref
 
         self.stubs.Set(sqa_api, 'get_session', fake_get_session)
         self.stubs.Set(sqa_api, '_get_quota_usages', fake_get_quota_usages)
         self.stubs.Set(sqa_api, 'quota_usage_create', fake_quota_usage_create)
-        self.stubs.Set(sqa_api, 'reservation_create', fake_reservation_create)
+        self.stubs.Set(sqa_api, '_reservations_create',
+                       fake_reservations_create)
 
         timeutils.set_time_override()
 
@@ -1087,11 +1173,11 @@ class QuotaReserveSqlAlchemyTestCase(test.TestCase):
                 ])
         self.compare_reservation(result, [
                 dict(resource='volumes',
-                     usage_id=self.usages_created['volumes'],
+                     usage_id=self.usages_created['volumes'].id,
                      project_id='test_project',
                      delta=2),
                 dict(resource='gigabytes',
-                     usage_id=self.usages_created['gigabytes'],
+                     usage_id=self.usages_created['gigabytes'].id,
                      delta=2 * 1024),
                 ])
 
@@ -1126,11 +1212,11 @@ class QuotaReserveSqlAlchemyTestCase(test.TestCase):
         self.assertEqual(self.usages_created, {})
         self.compare_reservation(result, [
                 dict(resource='volumes',
-                     usage_id=self.usages['volumes'],
+                     usage_id=self.usages['volumes'].id,
                      project_id='test_project',
                      delta=2),
                 dict(resource='gigabytes',
-                     usage_id=self.usages['gigabytes'],
+                     usage_id=self.usages['gigabytes'].id,
                      delta=2 * 1024),
                 ])
 
@@ -1165,11 +1251,11 @@ class QuotaReserveSqlAlchemyTestCase(test.TestCase):
         self.assertEqual(self.usages_created, {})
         self.compare_reservation(result, [
                 dict(resource='volumes',
-                     usage_id=self.usages['volumes'],
+                     usage_id=self.usages['volumes'].id,
                      project_id='test_project',
                      delta=2),
                 dict(resource='gigabytes',
-                     usage_id=self.usages['gigabytes'],
+                     usage_id=self.usages['gigabytes'].id,
                      delta=2 * 1024),
                 ])
 
@@ -1209,11 +1295,11 @@ class QuotaReserveSqlAlchemyTestCase(test.TestCase):
         self.assertEqual(self.usages_created, {})
         self.compare_reservation(result, [
                 dict(resource='volumes',
-                     usage_id=self.usages['volumes'],
+                     usage_id=self.usages['volumes'].id,
                      project_id='test_project',
                      delta=2),
                 dict(resource='gigabytes',
-                     usage_id=self.usages['gigabytes'],
+                     usage_id=self.usages['gigabytes'].id,
                      delta=2 * 1024),
                 ])
 
@@ -1248,11 +1334,11 @@ class QuotaReserveSqlAlchemyTestCase(test.TestCase):
         self.assertEqual(self.usages_created, {})
         self.compare_reservation(result, [
                 dict(resource='volumes',
-                     usage_id=self.usages['volumes'],
+                     usage_id=self.usages['volumes'].id,
                      project_id='test_project',
                      delta=2),
                 dict(resource='gigabytes',
-                     usage_id=self.usages['gigabytes'],
+                     usage_id=self.usages['gigabytes'].id,
                      delta=2 * 1024),
                 ])
 
@@ -1287,11 +1373,11 @@ class QuotaReserveSqlAlchemyTestCase(test.TestCase):
         self.assertEqual(self.usages_created, {})
         self.compare_reservation(result, [
                 dict(resource='volumes',
-                     usage_id=self.usages['volumes'],
+                     usage_id=self.usages['volumes'].id,
                      project_id='test_project',
                      delta=-2),
                 dict(resource='gigabytes',
-                     usage_id=self.usages['gigabytes'],
+                     usage_id=self.usages['gigabytes'].id,
                      delta=-2 * 1024),
                 ])
 
@@ -1359,11 +1445,11 @@ class QuotaReserveSqlAlchemyTestCase(test.TestCase):
         self.assertEqual(self.usages_created, {})
         self.compare_reservation(result, [
                 dict(resource='volumes',
-                     usage_id=self.usages['volumes'],
+                     usage_id=self.usages['volumes'].id,
                      project_id='test_project',
                      delta=-2),
                 dict(resource='gigabytes',
-                     usage_id=self.usages['gigabytes'],
+                     usage_id=self.usages['gigabytes'].id,
                      project_id='test_project',
                      delta=-2 * 1024),
                 ])
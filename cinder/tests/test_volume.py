@@ -35,9 +35,11 @@ from cinder.tests.image import fake as fake_image
 from cinder.openstack.common import importutils
 from cinder.openstack.common.notifier import test_notifier
 from cinder.openstack.common import rpc
+from cinder.openstack.common import timeutils
 import cinder.policy
 from cinder import quota
 from cinder import test
+from cinder.volume import driver
 from cinder.volume import iscsi
 
 QUOTAS = quota.QUOTAS
@@ -119,6 +121,52 @@ class VolumeTestCase(test.TestCase):
                           self.context,
                           volume_id)
 
+    def _create_exported_volumes(self):
+        volumes = []
+        for status in ['available', 'in-use', 'error']:
+            volume = self._create_volume()
+            db.volume_update(self.context, volume['id'],
+                             {'status': status, 'host': self.volume.host})
+            volumes.append(volume['id'])
+        return volumes
+
+    def test_init_host_recovers_exports_in_bulk(self):
+        """Test init_host re-exports usable volumes in one driver call."""
+        volume_ids = self._create_exported_volumes()
+        calls = []
+        self.stubs.Set(self.volume.driver, 'ensure_exports',
+                       lambda ctxt, volumes: calls.append(volumes))
+        self.volume.init_host()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(v['id'] for v in calls[0]),
+                         sorted(volume_ids[:2]))
+        self.assertEqual(self.volume.export_recovery['done'], 2)
+        self.assertEqual(self.volume.export_recovery['failed'], 0)
+
+    def test_init_host_recovers_exports_in_parallel(self):
+        """Test init_host falls back to parallel per volume re-exports."""
+        volume_ids = self._create_exported_volumes()
+        self.flags(volume_export_recovery_workers=4)
+        exported = []
+
+        def fake_ensure_exports(ctxt, volumes):
+            raise NotImplementedError()
+
+        def fake_ensure_export(ctxt, volume):
+            if volume['id'] == volume_ids[1]:
+                raise exception.ProcessExecutionError()
+            exported.append(volume['id'])
+
+        self.stubs.Set(self.volume.driver, 'ensure_exports',
+                       fake_ensure_exports)
+        self.stubs.Set(self.volume.driver, 'ensure_export',
+                       fake_ensure_export)
+        self.volume.init_host()
+        self.assertEqual(exported, volume_ids[:1])
+        self.assertEqual(self.volume.export_recovery['total'], 2)
+        self.assertEqual(self.volume.export_recovery['done'], 1)
+        self.assertEqual(self.volume.export_recovery['failed'], 1)
+
     def test_create_delete_volume_with_metadata(self):
         """Test volume can be created with metadata and deleted."""
         test_meta = {'fake_key': 'fake_value'}
@@ -520,6 +568,35 @@ class VolumeTestCase(test.TestCase):
             db.volume_destroy(self.context, volume_id)
             os.unlink(dst_path)
 
+    def test_copy_volume_to_image_qcow2_reports_savings(self):
+        dst_fd, dst_path = tempfile.mkstemp()
+        os.write(dst_fd, 'data')
+        os.close(dst_fd)
+        self.stubs.Set(self.volume.driver, 'local_path',
+                       lambda volume: dst_path)
+        image_service = fake_image.FakeImageService()
+        image = image_service.create(self.context, {'disk_format': 'qcow2'})
+        volume_id = 1
+        db.volume_create(self.context, {'id': volume_id,
+                                        'size': 1,
+                                        'status': 'uploading',
+                                        'instance_uuid': None,
+                                        'host': 'dummy'})
+        try:
+            self.volume.copy_volume_to_image(self.context, volume_id,
+                                             image['id'])
+            msg = test_notifier.NOTIFICATIONS[-1]
+            self.assertEqual(msg['event_type'], 'volume.upload.end')
+            payload = msg['payload']
+            self.assertEqual(payload['image_id'], image['id'])
+            # header, tables and one data cluster
+            self.assertEqual(payload['upload_bytes'], 6 * 65536)
+            self.assertTrue(payload['upload_bytes_saved_ratio'] > 0.99)
+            self.assertTrue('upload_mb_per_second' in payload)
+        finally:
+            db.volume_destroy(self.context, volume_id)
+            os.unlink(dst_path)
+
     def test_copy_volume_to_image_exception(self):
         dst_fd, dst_path = tempfile.mkstemp()
         os.close(dst_fd)
@@ -631,17 +708,113 @@ class VolumeTestCase(test.TestCase):
         self.assertTrue('created_at' in payload)
         self.volume.delete_volume(self.context, volume_id)
 
+    def test_report_driver_status_resends_unchanged_stats(self):
+        """Ensure unchanged capabilities are refreshed periodically."""
+        self.flags(volume_capabilities_resend_interval=120)
+        self.stubs.Set(self.volume.driver, 'get_volume_stats',
+                       lambda refresh: {'free_capacity_gb': 10})
+        timeutils.set_time_override()
+        self.volume._report_driver_status(self.context)
+        self.assertEqual(self.volume.last_capabilities,
+                         {'free_capacity_gb': 10,
+                          'availability_zone':
+                              FLAGS.storage_availability_zone,
+                          'finished_volume_ids': [],
+                          'worker_pools':
+                              self.volume.get_worker_pool_stats(None)})
+        timeutils.advance_time_seconds(60)
+        self.volume._report_driver_status(self.context)
+        self.assertEqual(self.volume.last_capabilities, None)
+        timeutils.advance_time_seconds(61)
+        self.volume._report_driver_status(self.context)
+        self.assertEqual(self.volume.last_capabilities['free_capacity_gb'],
+                         10)
+        timeutils.clear_time_override()
+
+    def test_report_driver_status_reports_finished_volumes(self):
+        """Ensure created volumes are reported to release their claims."""
+        volume = self._create_volume()
+        self.volume._report_driver_status(self.context)
+        self.volume._report_driver_status(self.context)
+        self.assertEqual(self.volume.last_capabilities, None)
+        self.volume.create_volume(self.context, volume['id'])
+        self.volume._report_driver_status(self.context)
+        self.assertEqual(
+                self.volume.last_capabilities['finished_volume_ids'],
+                [volume['id']])
+        self.volume._report_driver_status(self.context)
+        self.assertEqual(self.volume.last_capabilities, None)
+        self.volume.delete_volume(self.context, volume['id'])
+
+    def test_report_driver_status_keeps_volumes_finished_meanwhile(self):
+        """Ensure volumes finished while stats are gathered are kept."""
+        def get_volume_stats(refresh):
+            self.volume._finished_volume_ids.append('finished-meanwhile')
+            return {}
+
+        self.volume._finished_volume_ids.append('finished-before')
+        self.stubs.Set(self.volume.driver, 'get_volume_stats',
+                       get_volume_stats)
+        self.volume._report_driver_status(self.context)
+        self.assertEqual(
+                self.volume.last_capabilities['finished_volume_ids'],
+                ['finished-before'])
+        self.assertEqual(self.volume._finished_volume_ids,
+                         ['finished-meanwhile'])
+
     def test_begin_roll_detaching_volume(self):
         """Test begin_detaching and roll_detaching functions."""
         volume = self._create_volume()
+        db.volume_update(self.context, volume['id'], {'status': 'in-use'})
         volume_api = cinder.volume.api.API()
         volume_api.begin_detaching(self.context, volume)
         volume = db.volume_get(self.context, volume['id'])
         self.assertEqual(volume['status'], "detaching")
+        self.assertRaises(exception.InvalidVolume,
+                          volume_api.begin_detaching,
+                          self.context,
+                          volume)
         volume_api.roll_detaching(self.context, volume)
         volume = db.volume_get(self.context, volume['id'])
         self.assertEqual(volume['status'], "in-use")
 
+    def test_reserve_unreserve_volume(self):
+        """Test only one of two reservations of a volume applies."""
+        volume = self._create_volume()
+        db.volume_update(self.context, volume['id'], {'status': 'available'})
+        volume_api = cinder.volume.api.API()
+        volume_api.reserve_volume(self.context, volume)
+        self.assertRaises(exception.InvalidVolume,
+                          volume_api.reserve_volume,
+                          self.context,
+                          volume)
+        volume = db.volume_get(self.context, volume['id'])
+        self.assertEqual(volume['status'], "attaching")
+        volume_api.unreserve_volume(self.context, volume)
+        volume_api.unreserve_volume(self.context, volume)
+        volume = db.volume_get(self.context, volume['id'])
+        self.assertEqual(volume['status'], "available")
+
+    def test_delete_volume_checks_status(self):
+        """Test delete only applies to available or errored volumes."""
+        volume = self._create_volume()
+        db.volume_update(self.context, volume['id'], {'host': 'fakehost'})
+        volume = db.volume_get(self.context, volume['id'])
+        volume_api = cinder.volume.api.API()
+        self.assertRaises(exception.InvalidVolume,
+                          volume_api.delete,
+                          self.context,
+                          volume)
+        self.assertEqual(db.volume_get(self.context,
+                                       volume['id'])['status'], "creating")
+
+        db.volume_update(self.context, volume['id'], {'status': 'error'})
+        self.stubs.Set(rpc, 'cast', lambda *args: None)
+        volume_api.delete(self.context, volume)
+        volume = db.volume_get(self.context, volume['id'])
+        self.assertEqual(volume['status'], "deleting")
+        self.assertNotEqual(volume['terminated_at'], None)
+
 
 class DriverTestCase(test.TestCase):
     """Base Test class for Drivers."""
@@ -689,21 +862,227 @@ class VolumeDriverTestCase(DriverTestCase):
 
     def test_delete_busy_volume(self):
         """Test deleting a busy volume."""
-        self.stubs.Set(self.volume.driver, '_volume_not_present',
-                       lambda x: False)
         self.stubs.Set(self.volume.driver, '_delete_volume',
                        lambda x, y: False)
-        # Want DriverTestCase._fake_execute to return 'o' so that
-        # volume.driver.delete_volume() raises the VolumeIsBusy exception.
-        self.output = 'o'
+        # Want DriverTestCase._fake_execute to report an origin volume so
+        # that volume.driver.delete_volume() raises VolumeIsBusy.
+        self.output = '  test1:1099511627776:owi-a-:\n'
         self.assertRaises(exception.VolumeIsBusy,
                           self.volume.driver.delete_volume,
                           {'name': 'test1', 'size': 1024})
-        # when DriverTestCase._fake_execute returns something other than
-        # 'o' volume.driver.delete_volume() does not raise an exception.
-        self.output = 'x'
+        # when the volume is not an origin volume.driver.delete_volume()
+        # does not raise an exception.
+        self.output = '  test1:1099511627776:-wi-a-:\n'
+        self.volume.driver.inventory.invalidate()
         self.volume.driver.delete_volume({'name': 'test1', 'size': 1024})
 
+    def test_inventory_is_cached(self):
+        """Test the logical volumes are listed once for several queries."""
+        calls = []
+
+        def _fake_execute(*cmd, **kwargs):
+            calls.append(cmd)
+            return ('  test1:1073741824:owi-a-:\n'
+                    '  _snapshot-1:1073741824:swi-a-:test1\n'), None
+        self.volume.driver.set_execute(_fake_execute)
+        inventory = self.volume.driver.inventory
+        self.assertTrue(inventory.exists('test1'))
+        self.assertTrue(inventory.is_origin('test1'))
+        self.assertFalse(inventory.is_origin('_snapshot-1'))
+        self.assertEqual(inventory.get('_snapshot-1')['origin'], 'test1')
+        self.assertEqual(inventory.get('test1')['size'], 1073741824)
+        self.assertFalse(inventory.exists('test2'))
+        self.assertEqual(len(calls), 1)
+
+        inventory.remove('test1')
+        self.assertFalse(inventory.exists('test1'))
+        self.assertEqual(len(calls), 1)
+        inventory.remove('_snapshot-1')
+        self.assertTrue(inventory.exists('test1'))
+        self.assertEqual(len(calls), 2)
+
+        self.flags(lvm_inventory_ttl=-1)
+        inventory.exists('test1')
+        self.assertEqual(len(calls), 3)
+
+    def test_inventory_reloaded_after_create(self):
+        """Test a lookup during lvcreate doesn't hide the new volume."""
+        lvs = []
+        inventory = self.volume.driver.inventory
+
+        def _fake_execute(*cmd, **kwargs):
+            if cmd[0] == 'lvs':
+                return ''.join('  %s:1073741824:-wi-a-:\n' % name
+                               for name in lvs), None
+            if cmd[0] == 'lvcreate':
+                # a lookup from another greenthread while lvcreate runs
+                self.assertFalse(inventory.exists(cmd[4]))
+                lvs.append(cmd[4])
+            return '', None
+        self.volume.driver.set_execute(_fake_execute)
+        self.volume.driver.create_volume({'name': 'test1', 'size': 1})
+        self.assertTrue(inventory.exists('test1'))
+
+    def test_inventory_listing_overlapping_a_change_is_not_kept(self):
+        calls = []
+        inventory = self.volume.driver.inventory
+
+        def _fake_execute(*cmd, **kwargs):
+            calls.append(cmd[0])
+            if len(calls) == 1:
+                # another greenthread changes the group meanwhile
+                inventory.invalidate()
+            return '  test1:1073741824:-wi-a-:\n', None
+        self.volume.driver.set_execute(_fake_execute)
+        self.assertTrue(inventory.exists('test1'))
+        self.assertTrue(inventory.exists('test1'))
+        self.assertTrue(inventory.exists('test1'))
+        self.assertEqual(len(calls), 2)
+
+    def test_failed_delete_is_retried(self):
+        """Test a failed lvremove leaves the volume to be deleted again."""
+        calls = []
+
+        def _fake_execute(*cmd, **kwargs):
+            calls.append(cmd[0])
+            if cmd[0] == 'lvs':
+                return '  test1:1073741824:-wi-a-:\n', None
+            if cmd[0] == 'lvremove' and calls.count('lvremove') == 1:
+                raise exception.ProcessExecutionError()
+            return '', None
+        self.flags(num_shell_tries=1, volume_wipe_async=False)
+        self.volume.driver.set_execute(_fake_execute)
+        volume = {'name': 'test1', 'size': 1}
+        self.assertRaises(exception.ProcessExecutionError,
+                          self.volume.driver.delete_volume, volume)
+        self.volume.driver.delete_volume(volume)
+        self.assertEqual(calls.count('lvremove'), 2)
+
+    def test_get_volume_stats_reports_capacity(self):
+        calls = []
+
+        def _fake_execute(*cmd, **kwargs):
+            calls.append(cmd[0])
+            if cmd[0] == 'vgs':
+                return '  10737418240:4294967296:2\n', None
+            return ('  test1:4294967296:-wi-a-:\n'
+                    '  test2:2147483648:-wi-a-:\n'), None
+        self.volume.driver.set_execute(_fake_execute)
+        stats = self.volume.driver.get_volume_stats()
+        self.assertEqual(stats, {'total_capacity_gb': 10.0,
+                                 'free_capacity_gb': 4.0,
+                                 'allocated_capacity_gb': 6.0,
+                                 'lv_count': 2})
+        self.volume.driver.get_volume_stats()
+        self.assertEqual(calls.count('vgs'), 1)
+        self.volume.driver.get_volume_stats(refresh=True)
+        self.assertEqual(calls.count('vgs'), 2)
+        self.flags(lvm_stats_interval=-1)
+        self.volume.driver.get_volume_stats()
+        self.assertEqual(calls.count('vgs'), 3)
+
+    def test_get_volume_stats_after_create(self):
+        """Test the free space reported with a new volume includes it."""
+        vg = {'free': 4294967296}
+
+        def _fake_execute(*cmd, **kwargs):
+            if cmd[0] == 'vgs':
+                return '  10737418240:%d:0\n' % vg['free'], None
+            if cmd[0] == 'lvcreate':
+                vg['free'] -= 1073741824
+            return '', None
+        self.volume.driver.set_execute(_fake_execute)
+        stats = self.volume.driver.get_volume_stats()
+        self.assertEqual(stats['free_capacity_gb'], 4.0)
+        self.volume.driver.create_volume({'name': 'test1', 'size': 1})
+        stats = self.volume.driver.get_volume_stats()
+        self.assertEqual(stats['free_capacity_gb'], 3.0)
+
+    def test_get_volume_stats_with_overridden_create_volume(self):
+        def _fake_execute(*cmd, **kwargs):
+            if cmd[0] == 'vgs':
+                return '  10737418240:4294967296:0\n', None
+            return '', None
+
+        class _Driver(driver.VolumeDriver):
+            def create_volume(self, volume):
+                return super(_Driver, self).create_volume(volume)
+        volume_driver = _Driver(execute=_fake_execute)
+        stats = volume_driver.get_volume_stats(refresh=True)
+        self.assertEqual(stats['free_capacity_gb'], 4.0)
+
+    def test_get_volume_stats_without_volume_group(self):
+        volume_driver = driver.RBDDriver(execute=lambda *cmd, **kw: ('', ''))
+        self.assertEqual(volume_driver.get_volume_stats(refresh=True), None)
+
+
+class ThinVolumeDriverTestCase(test.TestCase):
+    """Test case for VolumeDriver with lvm_type=thin"""
+
+    def setUp(self):
+        super(ThinVolumeDriverTestCase, self).setUp()
+        self.flags(volume_group='vg', lvm_type='thin')
+        self.cmds = []
+        self.output = ''
+
+        def _fake_execute(*cmd, **kwargs):
+            self.cmds.append(' '.join(cmd))
+            return self.output, None
+        self.driver = driver.VolumeDriver(execute=_fake_execute)
+
+    def test_check_for_setup_error_creates_pool(self):
+        self.output = 'vg'
+        self.driver.check_for_setup_error()
+        self.assertEqual(self.cmds[-1], 'lvcreate -T -l 95%FREE vg/vg-pool')
+
+    def test_check_for_setup_error_existing_pool(self):
+        self.output = 'vg\n  vg-pool:1073741824:twi-a-tz--:\n'
+        self.driver.check_for_setup_error()
+        self.assertFalse([c for c in self.cmds if c.startswith('lvcreate')])
+
+    def test_create_volume(self):
+        self.driver.create_volume({'name': 'volume-1', 'size': 1})
+        self.assertEqual(self.cmds, ['lvcreate -T -V 1G -n volume-1 '
+                                     'vg/vg-pool'])
+
+    def test_create_snapshot(self):
+        self.driver.create_snapshot({'name': 'snapshot-1',
+                                     'volume_name': 'volume-1',
+                                     'volume_size': 1})
+        self.assertEqual(self.cmds, [
+            'lvcreate --name _snapshot-1 --snapshot vg/volume-1',
+            'lvchange -a y -K vg/_snapshot-1'])
+
+    def test_create_volume_from_snapshot(self):
+        self.driver.create_volume_from_snapshot(
+            {'name': 'volume-2', 'size': 2},
+            {'name': 'snapshot-1', 'volume_size': 1})
+        self.assertEqual(self.cmds, [
+            'lvcreate --name volume-2 --snapshot vg/_snapshot-1',
+            'lvchange -a y -K vg/volume-2',
+            'lvextend -L 2G vg/volume-2'])
+
+    def test_delete_volume_skips_wipe(self):
+        self.output = '  volume-1:1073741824:Vwi-a-tz--:\n'
+        self.driver.delete_volume({'name': 'volume-1', 'size': 1})
+        self.assertFalse([c for c in self.cmds if c.startswith('dd')])
+        self.assertEqual(self.cmds[-1], 'lvremove -f vg/volume-1')
+
+    def test_get_volume_stats_reports_thin_pool(self):
+        def _fake_execute(*cmd, **kwargs):
+            if cmd[0] == 'vgs':
+                return '  10737418240:536870912:2\n', None
+            if cmd[-1] == 'vg/vg-pool':
+                return '  8589934592:25.00\n', None
+            return ('  vg-pool:8589934592:twi-a-tz--:\n'
+                    '  volume-1:21474836480:Vwi-a-tz--:\n'), None
+        self.driver.set_execute(_fake_execute)
+        stats = self.driver.get_volume_stats()
+        self.assertEqual(stats['free_capacity_gb'], 6.0)
+        self.assertEqual(stats['allocated_capacity_gb'], 20.0)
+        self.assertEqual(stats['thin_pool_capacity_gb'], 8.0)
+        self.assertEqual(stats['thin_pool_used_percent'], 25.0)
+
 
 class ISCSITestCase(DriverTestCase):
     """Test Case for ISCSIDriver"""
@@ -728,6 +1107,21 @@ class ISCSITestCase(DriverTestCase):
 
         return volume_id_list
 
+    def test_ensure_exports_of_a_driver_overriding_ensure_export(self):
+        exported = []
+
+        class _Driver(driver.ISCSIDriver):
+            def ensure_export(self, context, volume):
+                exported.append(volume['id'])
+        self.volume.driver = _Driver(execute=self.volume.driver._execute)
+        volume = db.volume_create(self.context, {'size': 1})
+        self.assertRaises(NotImplementedError,
+                          self.volume.driver.ensure_exports,
+                          self.context, [volume])
+        self.volume._recover_exports(self.context, [volume])
+        self.assertEqual(exported, [volume['id']])
+        self.assertEqual(self.volume.export_recovery['done'], 1)
+
     def test_check_for_export_with_no_volume(self):
         instance_uuid = '12345678-1234-5678-1234-567812345678'
         self.volume.check_for_export(self.context, instance_uuid)
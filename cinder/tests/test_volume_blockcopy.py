@@ -0,0 +1,119 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Tests for the volume block copy engine."""
+
+import os
+import shutil
+import tempfile
+
+import eventlet
+from eventlet import greenthread
+
+from cinder import test
+from cinder.volume import blockcopy
+
+
+class BlockCopyTestCase(test.TestCase):
+
+    def setUp(self):
+        super(BlockCopyTestCase, self).setUp()
+        self.flags(volume_copy_block_size_kb=64)
+        self.tmpdir = tempfile.mkdtemp()
+        self.block = 64 * 1024
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        super(BlockCopyTestCase, self).tearDown()
+
+    def _make_file(self, name, chunks, length):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'wb') as f:
+            for offset, data in chunks:
+                f.seek(offset)
+                f.write(data)
+            f.truncate(length)
+        return path
+
+    def _read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def test_copy_sparse_file(self):
+        length = 32 * self.block
+        src = self._make_file('src', [(0, 'a' * 100),
+                                      (20 * self.block, 'b' * self.block)],
+                              length)
+        dest = self._make_file('dest', [], 0)
+        stats = blockcopy.copy_volume(src, dest, length)
+        self.assertEqual(self._read(src), self._read(dest))
+        self.assertTrue(stats['bytes_read'] < length / 4)
+        self.assertTrue(stats['bytes_written'] <= 2 * self.block)
+        self.assertEqual(stats['bytes_written'] + stats['bytes_skipped'],
+                         length)
+
+    def test_copy_stops_at_size(self):
+        src = self._make_file('src', [(0, 'x' * 3 * self.block)],
+                              3 * self.block)
+        dest = self._make_file('dest', [], 0)
+        blockcopy.copy_volume(src, dest, self.block + 10)
+        self.assertEqual(self._read(dest), 'x' * (self.block + 10))
+
+    def test_copy_yields_to_other_green_threads(self):
+        length = 8 * self.block
+        src = self._make_file('src', [(0, 'z' * length)], length)
+        dest = self._make_file('dest', [], 0)
+        ticks = []
+
+        def tick():
+            while True:
+                ticks.append(len(ticks))
+                greenthread.sleep(0)
+        thread = eventlet.spawn(tick)
+        try:
+            blockcopy.copy_volume(src, dest, length)
+        finally:
+            thread.kill()
+        self.assertEqual(self._read(dest), 'z' * length)
+        self.assertTrue(len(ticks) >= 8)
+
+    def test_writer_skips_zero_blocks_and_keeps_length(self):
+        dest = self._make_file('dest', [(0, 'old' * 100)], 4 * self.block)
+        with blockcopy.BlockWriter(dest) as writer:
+            writer.write('\0' * self.block)
+            writer.write('y' * 10)
+            writer.skip(self.block)
+        self.assertEqual(writer.bytes_written, self.block)
+        self.assertEqual(writer.bytes_skipped, self.block + 10)
+        data = self._read(dest)
+        self.assertEqual(len(data), 4 * self.block)
+        self.assertEqual(data.strip('\0'), 'y' * 10)
+
+    def test_reader_is_file_like(self):
+        length = 4 * self.block
+        src = self._make_file('src', [(2 * self.block, 'z' * 10)], length)
+        with blockcopy.BlockReader(src) as reader:
+            reader.seek(0, os.SEEK_END)
+            self.assertEqual(reader.tell(), length)
+            reader.seek(0)
+            chunks = []
+            while True:
+                chunk = reader.read(8192)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                self.assertEqual(reader.tell(), len(''.join(chunks)))
+        self.assertEqual(''.join(chunks), self._read(src))
@@ -0,0 +1,157 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Tests for the volume host image cache."""
+
+import os
+import shutil
+import tempfile
+
+import eventlet
+
+from cinder import context
+from cinder import exception
+from cinder import test
+from cinder.volume import driver
+from cinder.volume import image_cache
+
+
+class FakeImageService(object):
+
+    def __init__(self, images):
+        self.images = images
+        self.downloads = []
+
+    def show(self, context, image_id):
+        data = self.images[image_id]
+        return {'id': image_id, 'checksum': 'sum%d' % len(data or '')}
+
+    def download(self, context, image_id, data):
+        self.downloads.append(image_id)
+        eventlet.sleep(0)
+        if self.images[image_id] is None:
+            raise exception.ImageNotFound(image_id=image_id)
+        data.write(self.images[image_id])
+
+    def download_ranges(self, context, image_id, open_writer):
+        with open_writer(None) as writer:
+            self.download(context, image_id, writer)
+
+
+class ImageCacheTestCase(test.TestCase):
+
+    def setUp(self):
+        super(ImageCacheTestCase, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.flags(image_cache_dir=os.path.join(self.tmpdir, 'cache'),
+                   image_cache_max_size_gb=1,
+                   volume_copy_block_size_kb=4)
+        self.context = context.get_admin_context()
+        self.service = FakeImageService({'a': 'a' * 8192,
+                                         'b': 'b' * 8192,
+                                         'c': '\0' * 4096 + 'c' * 4096,
+                                         'bad': None})
+        self.cache = image_cache.ImageCache()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        super(ImageCacheTestCase, self).tearDown()
+
+    def _fetch(self, image_id):
+        with self.cache.fetch(self.context, self.service, image_id) as path:
+            with open(path, 'rb') as f:
+                return f.read()
+
+    def test_image_is_downloaded_once(self):
+        self.assertEqual(self._fetch('a'), 'a' * 8192)
+        self.assertEqual(self._fetch('a'), 'a' * 8192)
+        self.assertEqual(self.service.downloads, ['a'])
+        stats = self.cache.get_stats()
+        self.assertEqual(stats['image_cache_hits'], 1)
+        self.assertEqual(stats['image_cache_misses'], 1)
+        self.assertEqual(stats['image_cache_images'], 1)
+        self.assertTrue(os.path.exists(os.path.join(self.tmpdir, 'cache',
+                                                    'a-sum8192')))
+
+    def test_cached_file_is_sparse(self):
+        self.assertEqual(self._fetch('c'), '\0' * 4096 + 'c' * 4096)
+
+    def test_concurrent_fetches_download_once(self):
+        pool = eventlet.GreenPool()
+        results = list(pool.imap(self._fetch, ['a'] * 5))
+        self.assertEqual(results, ['a' * 8192] * 5)
+        self.assertEqual(self.service.downloads, ['a'])
+        self.assertEqual(self.cache.get_stats()['image_cache_hits'], 4)
+
+    def test_fill_yields_to_other_green_threads(self):
+        self.service.images['big'] = 'x' * 64 * 1024
+        ticks = []
+
+        def tick():
+            while True:
+                ticks.append(len(ticks))
+                eventlet.sleep(0)
+        thread = eventlet.spawn(tick)
+        try:
+            self.assertEqual(self._fetch('big'), 'x' * 64 * 1024)
+        finally:
+            thread.kill()
+        # one block of the image is written between two ticks
+        self.assertTrue(len(ticks) >= 16)
+
+    def test_least_recently_used_image_is_evicted(self):
+        self.stubs.Set(self.cache, '_usage', lambda path: 600 * 1024 ** 2)
+        self._fetch('a')
+        self._fetch('b')
+        self.assertEqual(self.cache.get_stats()['image_cache_evictions'], 1)
+        self._fetch('b')
+        self._fetch('a')
+        self.assertEqual(self.service.downloads, ['a', 'b', 'a'])
+        self.assertEqual(self.cache.get_stats()['image_cache_evictions'], 2)
+
+    def test_failed_download_is_not_cached(self):
+        self.assertRaises(exception.ImageNotFound, self._fetch, 'bad')
+        self.assertEqual(os.listdir(os.path.join(self.tmpdir, 'cache')), [])
+        self.assertRaises(exception.ImageNotFound, self._fetch, 'bad')
+        self.assertEqual(self.service.downloads, ['bad', 'bad'])
+
+    def test_cache_is_reloaded(self):
+        self._fetch('a')
+        with open(os.path.join(self.tmpdir, 'cache', 'b-sum8192.part'),
+                  'wb') as f:
+            f.write('partial')
+        self.cache = image_cache.ImageCache()
+        self._fetch('a')
+        self.assertEqual(self.service.downloads, ['a'])
+        self.assertEqual(os.listdir(os.path.join(self.tmpdir, 'cache')),
+                         ['a-sum8192'])
+
+    def test_driver_copies_from_cache(self):
+        copies = []
+        volume_driver = driver.ISCSIDriver(execute=lambda *a, **k: ('', ''))
+        volume_driver.image_cache = self.cache
+        self.stubs.Set(volume_driver, '_copy_volume',
+                       lambda *args, **kwargs: copies.append(args))
+        for name in ('volume-1', 'volume-2'):
+            volume_driver.copy_image_to_volume(self.context,
+                                               {'name': name, 'size': 1},
+                                               self.service, 'a')
+        cached = os.path.join(self.tmpdir, 'cache', 'a-sum8192')
+        self.assertEqual([(src, size) for src, dest, size in copies],
+                         [(cached, 1), (cached, 1)])
+        self.assertEqual(self.service.downloads, ['a'])
+        self.assertEqual(volume_driver.get_volume_stats()['image_cache_hits'],
+                         1)
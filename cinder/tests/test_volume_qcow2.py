@@ -0,0 +1,150 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Tests for streaming qcow2 images of volumes."""
+
+import os
+import shutil
+import struct
+import tempfile
+
+import eventlet
+from eventlet import greenthread
+
+from cinder import test
+from cinder.volume import qcow2
+
+
+MB = 1024 * 1024
+
+
+def read_qcow2(image):
+    """Returns the data clusters of a qcow2 image and its refcounts."""
+    (magic, version, backing, backing_size, cluster_bits, size, crypt,
+     l1_size, l1_offset, refcount_offset, refcount_clusters, snapshots,
+     snapshots_offset) = qcow2.HEADER.unpack(image[:qcow2.HEADER.size])
+    assert (magic, version, cluster_bits) == (qcow2.QCOW_MAGIC, 2, 16)
+    cluster = 1 << cluster_bits
+    mask = (1 << 62) - 1
+
+    def table(offset, count):
+        return struct.unpack('>%dQ' % count, image[offset:offset + 8 * count])
+
+    clusters = {}
+    for i, l2_offset in enumerate(table(l1_offset, l1_size)):
+        if not l2_offset:
+            continue
+        for j, data_offset in enumerate(table(l2_offset & mask,
+                                              cluster / 8)):
+            if data_offset:
+                data_offset &= mask
+                index = i * cluster / 8 + j
+                assert index * cluster < size
+                clusters[index] = image[data_offset:data_offset + cluster]
+    refcounts = []
+    for block in table(refcount_offset, refcount_clusters * cluster / 8):
+        if block:
+            refcounts.extend(struct.unpack('>%dH' % (cluster / 2),
+                                           image[block:block + cluster]))
+    return clusters, refcounts[:len(image) / cluster]
+
+
+class Qcow2StreamTestCase(test.TestCase):
+
+    def setUp(self):
+        super(Qcow2StreamTestCase, self).setUp()
+        self.flags(volume_copy_block_size_kb=1024)
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'volume')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        super(Qcow2StreamTestCase, self).tearDown()
+
+    def _make_volume(self, size, chunks):
+        with open(self.path, 'wb') as f:
+            for offset, data in chunks:
+                f.seek(offset)
+                f.write(data)
+            f.truncate(size)
+
+    def _stream(self, size):
+        with qcow2.Qcow2Stream(self.path, size) as stream:
+            stream.seek(0, os.SEEK_END)
+            self.assertEqual(stream.tell(), stream.size)
+            stream.seek(0)
+            chunks = []
+            while True:
+                chunk = stream.read(65536 + 7)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        image = ''.join(chunks)
+        self.assertEqual(len(image), stream.size)
+        return image
+
+    def _read_volume(self, cluster):
+        with open(self.path, 'rb') as f:
+            f.seek(cluster * qcow2.CLUSTER_SIZE)
+            return f.read(qcow2.CLUSTER_SIZE)
+
+    def test_image_holds_only_data_clusters(self):
+        size = 1024 * MB
+        self._make_volume(size, [(0, 'boot'),
+                                 (600 * MB + 100, os.urandom(100000)),
+                                 (size - 1, 'x')])
+        image = self._stream(size)
+        clusters, refcounts = read_qcow2(image)
+        self.assertEqual(sorted(clusters), [0, 9600, 9601, 16383])
+        for index, data in clusters.iteritems():
+            self.assertTrue(data == self._read_volume(index))
+        self.assertEqual(refcounts, [1] * (len(image) / qcow2.CLUSTER_SIZE))
+        # header, l1, refcount table and block, 2 l2 tables, 4 data clusters
+        self.assertEqual(len(image), 10 * qcow2.CLUSTER_SIZE)
+
+    def test_zeros_written_to_a_file_are_skipped(self):
+        size = 8 * MB
+        self._make_volume(size, [(0, '\0' * size), (3 * MB, 'data')])
+        clusters, refcounts = read_qcow2(self._stream(size))
+        self.assertEqual(clusters.keys(), [48])
+        self.assertTrue(clusters[48] == self._read_volume(48))
+
+    def test_scan_yields_to_other_green_threads(self):
+        size = 8 * MB
+        self._make_volume(size, [(0, 'd' * size)])
+        ticks = []
+
+        def tick():
+            while True:
+                ticks.append(len(ticks))
+                greenthread.sleep(0)
+        thread = eventlet.spawn(tick)
+        try:
+            qcow2.Qcow2Stream(self.path, size).close()
+        finally:
+            thread.kill()
+        self.assertTrue(len(ticks) >= 8)
+
+    def test_empty_volume(self):
+        self._make_volume(0, [])
+        image = self._stream(2 * MB)
+        self.assertEqual(read_qcow2(image), ({}, [1, 1, 1, 1]))
+
+    def test_seek_after_read_fails(self):
+        self._make_volume(MB, [(0, 'data')])
+        with qcow2.Qcow2Stream(self.path, MB) as stream:
+            stream.read(10)
+            self.assertRaises(IOError, stream.seek, 0)
@@ -0,0 +1,110 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Tests for the background volume wipe queue."""
+
+from cinder import exception
+from cinder import test
+from cinder.volume import driver
+from cinder.volume import wipe
+
+
+class WipeQueueTestCase(test.TestCase):
+
+    def setUp(self):
+        super(WipeQueueTestCase, self).setUp()
+        self.flags(volume_group='vg', volume_wipe_chunk_mb=512)
+        self.cmds = []
+        self.output = ''
+        self.queue = wipe.WipeQueue(execute=self.fake_execute)
+
+    def fake_execute(self, *cmd, **kwargs):
+        self.cmds.append(' '.join(cmd))
+        if cmd[0] == 'dd' and self.output is None:
+            raise exception.ProcessExecutionError()
+        return self.output, None
+
+    def test_enqueue_renames_wipes_and_removes(self):
+        self.queue.enqueue('volume-1', 1024)
+        self.assertEqual(self.cmds[0], 'lvrename vg volume-1 wipe-volume-1')
+        self.queue._pool.waitall()
+        self.assertEqual(self.cmds[1:], [
+            'dd if=/dev/zero of=/dev/vg/wipe-volume-1 bs=1M count=512 '
+            'seek=0 oflag=direct',
+            'dd if=/dev/zero of=/dev/vg/wipe-volume-1 bs=1M count=512 '
+            'seek=512 oflag=direct',
+            'lvremove -f vg/wipe-volume-1'])
+        self.assertEqual(self.queue.get_stats(),
+                         {'wipe_queue_depth': 0, 'wipe_bytes_remaining': 0})
+
+    def test_stats_report_pending_work(self):
+        self.queue.enqueue('volume-1', 1024)
+        self.queue.enqueue('volume-2', 100)
+        self.assertEqual(self.queue.get_stats(),
+                         {'wipe_queue_depth': 2,
+                          'wipe_bytes_remaining': 1124 * 1024 * 1024})
+        self.queue._pool.waitall()
+        self.assertEqual(self.queue.get_stats()['wipe_queue_depth'], 0)
+
+    def test_recover_requeues_renamed_volumes(self):
+        self.output = ('  volume-1        1024.00\n'
+                       '  wipe-volume-2    100.00\n')
+        self.queue.recover()
+        self.queue._pool.waitall()
+        self.assertEqual(self.cmds[1:], [
+            'dd if=/dev/zero of=/dev/vg/wipe-volume-2 bs=1M count=100 '
+            'seek=0 oflag=direct',
+            'lvremove -f vg/wipe-volume-2'])
+
+    def test_failed_wipe_keeps_volume(self):
+        self.output = None
+        self.queue.enqueue('volume-1', 100)
+        self.queue._pool.waitall()
+        self.assertFalse([c for c in self.cmds if c.startswith('lvremove')])
+        self.assertEqual(self.queue.get_stats()['wipe_queue_depth'], 0)
+
+
+class VolumeDriverWipeTestCase(test.TestCase):
+
+    def setUp(self):
+        super(VolumeDriverWipeTestCase, self).setUp()
+        self.flags(volume_group='vg', volume_wipe_async=True)
+        self.cmds = []
+
+        def _fake_execute(*cmd, **kwargs):
+            self.cmds.append(' '.join(cmd))
+            if cmd[0] == 'vgs':
+                return '  10737418240:5368709120:2\n', None
+            return ('  volume-1:2147483648:-wi-a-:\n'
+                    '  _snapshot-1:104857600:swi-a-:volume-2\n'), None
+        self.driver = driver.VolumeDriver(execute=_fake_execute)
+        self.stubs.Set(self.driver.wipe_queue, '_dispatch', lambda: None)
+
+    def test_delete_volume_is_queued(self):
+        self.driver.delete_volume({'name': 'volume-1', 'size': 2})
+        self.assertTrue('lvrename vg volume-1 wipe-volume-1' in self.cmds)
+        self.assertFalse([c for c in self.cmds if c.startswith('dd')])
+        stats = self.driver.get_volume_stats()
+        self.assertEqual(stats['wipe_queue_depth'], 1)
+        self.assertEqual(stats['wipe_bytes_remaining'], 2 * 1024 ** 3)
+
+    def test_delete_snapshot_is_queued(self):
+        self.driver.delete_snapshot({'name': 'snapshot-1',
+                                     'volume_size': 0})
+        self.assertTrue('lvrename vg _snapshot-1 wipe-_snapshot-1'
+                        in self.cmds)
+        self.assertEqual(self.driver.get_volume_stats()['wipe_queue_depth'],
+                         1)
@@ -0,0 +1,143 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Tests for the volume service worker pools."""
+
+from eventlet import event
+from eventlet import greenthread
+
+from cinder import exception
+from cinder import test
+from cinder.volume import manager
+from cinder.volume import workers
+
+
+class FakeDispatcher(object):
+
+    def __init__(self):
+        self.calls = []
+        self.blockers = {}
+
+    def dispatch(self, ctxt, version, method, **kwargs):
+        self.calls.append(method)
+        if method in self.blockers:
+            self.blockers[method].wait()
+        if method == 'fail':
+            raise exception.NotFound()
+        return method
+
+
+class WorkerPoolTestCase(test.TestCase):
+
+    def test_pool_limits_running_operations(self):
+        pool = workers.WorkerPool('test', 2)
+        blocker = event.Event()
+        done = [pool.submit(blocker.wait) for i in xrange(5)]
+        greenthread.sleep(0)
+        self.assertEqual(pool.get_stats(),
+                         {'size': 2, 'running': 2, 'queued': 3})
+        blocker.send(True)
+        self.assertEqual([d.wait() for d in done], [True] * 5)
+        self.assertEqual(pool.get_stats()['queued'], 0)
+
+    def test_submit_returns_exception(self):
+        pool = workers.WorkerPool('test', 1)
+        done = pool.submit(FakeDispatcher().dispatch, None, None, 'fail')
+        self.assertRaises(exception.NotFound, done.wait)
+
+
+class PoolDispatcherTestCase(test.TestCase):
+
+    def setUp(self):
+        super(PoolDispatcherTestCase, self).setUp()
+        self.fake = FakeDispatcher()
+        self.pools = {'control': workers.WorkerPool('control', 2),
+                      'slow': workers.WorkerPool('slow', 1)}
+
+        def _classify(method, kwargs):
+            if method.startswith('slow'):
+                return 'slow', False
+            return 'control', True
+        self.dispatcher = workers.PoolDispatcher(self.fake, self.pools,
+                                                 _classify)
+
+    def test_calls_are_not_starved_by_casts(self):
+        blocker = event.Event()
+        self.fake.blockers['slow'] = blocker
+        for i in xrange(3):
+            self.assertEqual(self.dispatcher.dispatch(None, None, 'slow'),
+                             None)
+        self.assertEqual(self.dispatcher.dispatch(None, None, 'attach'),
+                         'attach')
+        self.assertEqual(self.pools['slow'].get_stats()['queued'], 2)
+        blocker.send(True)
+        self.pools['slow']._pool.waitall()
+        self.assertEqual(self.fake.calls,
+                         ['slow', 'attach', 'slow', 'slow'])
+
+    def test_call_raises_exception(self):
+        self.assertRaises(exception.NotFound, self.dispatcher.dispatch,
+                          None, None, 'fail')
+
+    def test_cast_exception_is_logged(self):
+        self.dispatcher.dispatch(None, None, 'slow_fail')
+        self.pools['slow']._pool.waitall()
+        self.assertEqual(self.fake.calls, ['slow_fail'])
+
+
+class VolumeManagerPoolsTestCase(test.TestCase):
+
+    def setUp(self):
+        super(VolumeManagerPoolsTestCase, self).setUp()
+        self.flags(volume_data_copy_pool_size=3)
+        self.manager = manager.VolumeManager()
+
+    def test_classify_operation(self):
+        classify = self.manager._classify_operation
+        self.assertEqual(classify('create_volume', {'volume_id': 1}),
+                         ('control', False))
+        self.assertEqual(classify('create_volume', {'image_id': 'i'}),
+                         ('data_copy', False))
+        self.assertEqual(classify('create_volume', {'snapshot_id': 's'}),
+                         ('data_copy', False))
+        self.assertEqual(classify('delete_volume', {}), ('wipe', False))
+        self.assertEqual(classify('create_snapshot', {}),
+                         ('snapshot', False))
+        self.assertEqual(classify('initialize_connection', {}),
+                         ('control', True))
+
+    def test_get_worker_pool_stats(self):
+        stats = self.manager.get_worker_pool_stats(None)
+        self.assertEqual(sorted(stats),
+                         ['control', 'data_copy', 'snapshot', 'wipe'])
+        self.assertEqual(stats['data_copy'],
+                         {'size': 3, 'running': 0, 'queued': 0})
+
+    def test_reported_capabilities_include_pool_stats(self):
+        self.stubs.Set(self.manager.driver, 'get_volume_stats',
+                       lambda refresh=False: {'free_capacity_gb': 10})
+        reported = []
+        self.stubs.Set(self.manager, 'update_service_capabilities',
+                       reported.append)
+        self.manager._report_driver_status(None)
+        self.assertEqual(reported[0]['worker_pools'],
+                         self.manager.get_worker_pool_stats(None))
+        self.assertEqual(reported[0]['free_capacity_gb'], 10)
+
+    def test_rpc_dispatcher_uses_pools(self):
+        dispatcher = self.manager.create_rpc_dispatcher()
+        self.assertTrue(isinstance(dispatcher, workers.PoolDispatcher))
+        self.assertEqual(dispatcher.pools, self.manager.worker_pools)
@@ -209,9 +209,6 @@ class API(base.Base):
             # NOTE(vish): scheduling failed, so delete it
             self.db.volume_destroy(context, volume_id)
             return
-        if volume['status'] not in ["available", "error"]:
-            msg = _("Volume status must be available or error")
-            raise exception.InvalidVolume(reason=msg)
 
         snapshots = self.db.snapshot_get_all_for_volume(context, volume_id)
         if len(snapshots):
@@ -219,8 +216,11 @@ class API(base.Base):
             raise exception.InvalidVolume(reason=msg)
 
         now = timeutils.utcnow()
-        self.db.volume_update(context, volume_id, {'status': 'deleting',
-                                                   'terminated_at': now})
+        if not self.db.volume_conditional_update(context, volume_id,
+                {'status': 'deleting', 'terminated_at': now},
+                {'status': ['available', 'error']}):
+            msg = _("Volume status must be available or error")
+            raise exception.InvalidVolume(reason=msg)
         host = volume['host']
         rpc.cast(context,
                  rpc.queue_get_for(context, FLAGS.volume_topic, host),
@@ -237,50 +237,36 @@ class API(base.Base):
         check_policy(context, 'get', volume)
         return volume
 
-    def get_all(self, context, search_opts=None):
+    def get_all(self, context, marker=None, limit=None,
+                sort_key='created_at', sort_dir='desc', search_opts=None):
         check_policy(context, 'get_all')
 
         if search_opts is None:
             search_opts = {}
 
-        if (context.is_admin and 'all_tenants' in search_opts):
-            # Need to remove all_tenants to pass the filtering below.
-            del search_opts['all_tenants']
-            volumes = self.db.volume_get_all(context)
+        all_tenants = context.is_admin and 'all_tenants' in search_opts
+        # search_option to volume column mapping, the filters are
+        # applied by the database
+        filters = dict(search_opts)
+        filters.pop('all_tenants', None)
+        if 'name' in filters:
+            filters['display_name'] = filters.pop('name')
+        if filters:
+            LOG.debug(_("Searching by: %s") % str(filters))
+
+        if all_tenants:
+            volumes = self.db.volume_get_all(context, marker=marker,
+                                             limit=limit, sort_key=sort_key,
+                                             sort_dir=sort_dir,
+                                             filters=filters)
         else:
             volumes = self.db.volume_get_all_by_project(context,
-                                                        context.project_id)
-        if search_opts:
-            LOG.debug(_("Searching by: %s") % str(search_opts))
-
-            def _check_metadata_match(volume, searchdict):
-                volume_metadata = {}
-                for i in volume.get('volume_metadata'):
-                    volume_metadata[i['key']] = i['value']
-
-                for k, v in searchdict.iteritems():
-                    if (k not in volume_metadata.keys() or
-                        volume_metadata[k] != v):
-                        return False
-                return True
-
-            # search_option to filter_name mapping.
-            filter_mapping = {'metadata': _check_metadata_match}
-
-            result = []
-            for volume in volumes:
-                # go over all filters in the list
-                for opt, values in search_opts.iteritems():
-                    try:
-                        filter_func = filter_mapping[opt]
-                    except KeyError:
-                        # no such filter - ignore it, go to next filter
-                        continue
-                    else:
-                        if filter_func(volume, values):
-                            result.append(volume)
-                            break
-            volumes = result
+                                                        context.project_id,
+                                                        marker=marker,
+                                                        limit=limit,
+                                                        sort_key=sort_key,
+                                                        sort_dir=sort_dir,
+                                                        filters=filters)
         return volumes
 
     def get_snapshot(self, context, snapshot_id):
@@ -288,7 +274,9 @@ class API(base.Base):
         rv = self.db.snapshot_get(context, snapshot_id)
         return dict(rv.iteritems())
 
-    def get_all_snapshots(self, context, search_opts=None):
+    def get_all_snapshots(self, context, marker=None, limit=None,
+                          sort_key='created_at', sort_dir='desc',
+                          search_opts=None):
         check_policy(context, 'get_all_snapshots')
 
         search_opts = search_opts or {}
@@ -296,10 +284,16 @@ class API(base.Base):
         if (context.is_admin and 'all_tenants' in search_opts):
             # Need to remove all_tenants to pass the filtering below.
             del search_opts['all_tenants']
-            return self.db.snapshot_get_all(context)
+            return self.db.snapshot_get_all(context, marker=marker,
+                                            limit=limit, sort_key=sort_key,
+                                            sort_dir=sort_dir)
         else:
             return self.db.snapshot_get_all_by_project(context,
-                                                       context.project_id)
+                                                       context.project_id,
+                                                       marker=marker,
+                                                       limit=limit,
+                                                       sort_key=sort_key,
+                                                       sort_dir=sort_dir)
 
     @wrap_check_policy
     def check_attach(self, context, volume):
@@ -326,23 +320,36 @@ class API(base.Base):
                   "args": {'instance_id': instance_id,
                            'volume_id': volume['id']}})
 
+    def _update_status(self, context, volume, status, expected_status):
+        """Move the volume from one of expected_status to status.
+
+        Checks and sets the status in one UPDATE, so two requests can't
+        both make the same transition; returns whether it applied.
+        """
+        return self.db.volume_conditional_update(context, volume['id'],
+                                                 {'status': status},
+                                                 {'status': expected_status})
+
     @wrap_check_policy
     def reserve_volume(self, context, volume):
-        self.update(context, volume, {"status": "attaching"})
+        if not self._update_status(context, volume, "attaching",
+                                   "available"):
+            msg = _("status must be available")
+            raise exception.InvalidVolume(reason=msg)
 
     @wrap_check_policy
     def unreserve_volume(self, context, volume):
-        if volume['status'] == "attaching":
-            self.update(context, volume, {"status": "available"})
+        self._update_status(context, volume, "available", "attaching")
 
     @wrap_check_policy
     def begin_detaching(self, context, volume):
-        self.update(context, volume, {"status": "detaching"})
+        if not self._update_status(context, volume, "detaching", "in-use"):
+            msg = _("status must be in-use")
+            raise exception.InvalidVolume(reason=msg)
 
     @wrap_check_policy
     def roll_detaching(self, context, volume):
-        if volume['status'] == "detaching":
-            self.update(context, volume, {"status": "in-use"})
+        self._update_status(context, volume, "in-use", "detaching")
 
     @wrap_check_policy
     def attach(self, context, volume, instance_uuid, mountpoint):
@@ -0,0 +1,292 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+In-process block copy engine for volume data paths.
+
+Data is moved in large aligned blocks, optionally with O_DIRECT so that bulk
+copies don't evict the page cache. Blocks that only contain zeros are not
+written when the destination already reads back zeros, and holes in sparse
+source files are found with SEEK_DATA/SEEK_HOLE instead of being read.
+
+The reads and writes block the process, so the engine yields to the other
+green threads after every block.
+
+"""
+
+import errno
+import fcntl
+import io
+import mmap
+import os
+import stat
+import time
+
+from eventlet import greenthread
+
+from cinder import flags
+from cinder.openstack.common import cfg
+from cinder.openstack.common import log as logging
+
+
+LOG = logging.getLogger(__name__)
+
+blockcopy_opts = [
+    cfg.StrOpt('volume_copy_method',
+               default='sparse',
+               help='How volume data is copied: dd runs dd as root, sparse '
+                    'uses the in-process zero-skipping copy engine'),
+    cfg.IntOpt('volume_copy_block_size_kb',
+               default=1024,
+               help='Block size in KB used by the volume copy engine'),
+    cfg.BoolOpt('volume_copy_direct_io',
+                default=True,
+                help='Open volumes with O_DIRECT while copying so bulk '
+                     'copies bypass the page cache'),
+    ]
+
+FLAGS = flags.FLAGS
+FLAGS.register_opts(blockcopy_opts)
+
+# not exposed by the os module before python 3.3
+SEEK_DATA = 3
+SEEK_HOLE = 4
+
+# O_DIRECT needs buffers, offsets and lengths aligned to the logical block size
+# of the device; a page covers all of them.
+ALIGNMENT = mmap.PAGESIZE
+
+
+def _block_size():
+    size = FLAGS.volume_copy_block_size_kb * 1024
+    return max(ALIGNMENT, size - size % ALIGNMENT)
+
+
+def _is_regular_file(fd):
+    return stat.S_ISREG(os.fstat(fd).st_mode)
+
+
+def _open(path, flags, direct=None):
+    """Open path, with O_DIRECT if requested and supported."""
+    if direct is None:
+        direct = FLAGS.volume_copy_direct_io
+    if direct and hasattr(os, 'O_DIRECT'):
+        try:
+            return os.open(path, flags | os.O_DIRECT)
+        except OSError as e:
+            # tmpfs and some network filesystems refuse O_DIRECT
+            if e.errno != errno.EINVAL:
+                raise
+    return os.open(path, flags)
+
+
+def _clear_direct(fd):
+    """Drop O_DIRECT so that an unaligned tail can be transferred."""
+    if hasattr(os, 'O_DIRECT'):
+        fl = fcntl.fcntl(fd, fcntl.F_GETFL)
+        fcntl.fcntl(fd, fcntl.F_SETFL, fl & ~os.O_DIRECT)
+
+
+def _next_data(fd, offset):
+    """Return the offset of the next data region of a sparse file.
+
+    Returns None when the rest of the file is a hole, and offset itself if
+    the filesystem can't report holes.
+    """
+    try:
+        return os.lseek(fd, offset, SEEK_DATA)
+    except OSError as e:
+        if e.errno == errno.ENXIO:
+            return None
+        return offset
+
+
+class BlockWriter(object):
+    """File-like object writing aligned blocks to a volume.
+
+    If sparse is True the destination is known to read back zeros, so zero
+    blocks are skipped instead of written. Regular files are always written
+    sparsely and keep at least their original length. If offset is given,
+    writing starts there and the rest of the destination is left alone, so
+    several writers can fill different parts of it.
+    """
+
+    def __init__(self, path, sparse=False, direct=None, offset=None):
+        self._fd = _open(path, os.O_WRONLY, direct)
+        self._file = io.FileIO(self._fd, 'wb', closefd=False)
+        self._size = _block_size()
+        self._buf = mmap.mmap(-1, self._size)
+        self._zeros = '\0' * self._size
+        self._fill = 0
+        self._offset = offset or 0
+        self._length = None
+        self._aligned = True
+        self.sparse = sparse
+        if _is_regular_file(self._fd):
+            if offset is None:
+                self._length = os.fstat(self._fd).st_size
+                os.ftruncate(self._fd, 0)
+            self.sparse = True
+        self.bytes_written = 0
+        self.bytes_skipped = 0
+
+    def write(self, data):
+        pos = 0
+        while pos < len(data):
+            count = min(self._size - self._fill, len(data) - pos)
+            self._buf[self._fill:self._fill + count] = data[pos:pos + count]
+            self._fill += count
+            pos += count
+            if self._fill == self._size:
+                self._flush()
+
+    def skip(self, count):
+        """Advance over count bytes of zeros without passing them in."""
+        while count:
+            if self._fill or not self.sparse or count < self._size:
+                step = min(self._size - self._fill, count)
+                self.write(self._zeros[:step])
+            else:
+                step = count - count % self._size
+                self._offset += step
+                self.bytes_skipped += step
+            count -= step
+
+    def _flush(self):
+        greenthread.sleep(0)
+        count = self._fill
+        self._fill = 0
+        if (self.sparse and
+            buffer(self._buf, 0, count) == buffer(self._zeros, 0, count)):
+            self._offset += count
+            self.bytes_skipped += count
+            return
+        if count % ALIGNMENT and self._aligned:
+            _clear_direct(self._fd)
+            self._aligned = False
+        os.lseek(self._fd, self._offset, os.SEEK_SET)
+        self._file.write(buffer(self._buf, 0, count))
+        self._offset += count
+        self.bytes_written += count
+
+    def close(self):
+        if self._fill:
+            self._flush()
+        if self._length is not None:
+            os.ftruncate(self._fd, max(self._length, self._offset))
+        self._buf.close()
+        os.close(self._fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class BlockReader(object):
+    """File-like object reading a volume in aligned blocks."""
+
+    def __init__(self, path, direct=None):
+        self._fd = _open(path, os.O_RDONLY, direct)
+        self._file = io.FileIO(self._fd, 'rb', closefd=False)
+        self._size = _block_size()
+        self._buf = mmap.mmap(-1, self._size)
+        self._offset = 0
+        self._pending = ''
+        self._sparse = _is_regular_file(self._fd)
+        self.bytes_read = 0
+
+    def readblock(self):
+        """Return the next block of data, or the length of a hole.
+
+        Holes in sparse files are returned as an int so callers can pass
+        them on without reading or materializing zeros. Returns an empty
+        string at the end of the volume.
+        """
+        if self._sparse:
+            data_offset = _next_data(self._fd, self._offset)
+            if data_offset is None:
+                data_offset = max(os.fstat(self._fd).st_size, self._offset)
+            if data_offset > self._offset:
+                hole = data_offset - self._offset
+                self._offset = data_offset
+                return hole
+        greenthread.sleep(0)
+        os.lseek(self._fd, self._offset, os.SEEK_SET)
+        count = self._file.readinto(self._buf)
+        self._offset += count
+        self.bytes_read += count
+        return self._buf[:count]
+
+    def read(self, size=-1):
+        if not self._pending:
+            block = self.readblock()
+            if isinstance(block, (int, long)):
+                count = min(block, self._size)
+                self._offset -= block - count
+                block = '\0' * count
+            self._pending = block
+        if size < 0:
+            size = len(self._pending)
+        data = self._pending[:size]
+        self._pending = self._pending[size:]
+        return data
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        self._offset = os.lseek(self._fd, offset, whence)
+        self._pending = ''
+
+    def tell(self):
+        return self._offset - len(self._pending)
+
+    def close(self):
+        self._buf.close()
+        os.close(self._fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def copy_volume(src, dest, size_in_bytes, sparse=False, direct=None):
+    """Copy size_in_bytes from src to dest with the block copy engine.
+
+    Returns a dict with the number of bytes read, written and skipped.
+    """
+    start = time.time()
+    with BlockReader(src, direct) as reader:
+        with BlockWriter(dest, sparse, direct) as writer:
+            remaining = size_in_bytes
+            while remaining > 0:
+                block = reader.readblock()
+                if isinstance(block, (int, long)):
+                    count = min(block, remaining)
+                    writer.skip(count)
+                elif not block:
+                    break
+                else:
+                    count = min(len(block), remaining)
+                    writer.write(block[:count])
+                remaining -= count
+    stats = {'bytes_read': reader.bytes_read,
+             'bytes_written': writer.bytes_written,
+             'bytes_skipped': writer.bytes_skipped,
+             'seconds': time.time() - start}
+    LOG.debug(_("Copied %(src)s to %(dest)s: %(stats)s") % locals())
+    return stats
@@ -30,7 +30,11 @@ from cinder import flags
 from cinder.openstack.common import log as logging
 from cinder.openstack.common import cfg
 from cinder import utils
+from cinder.volume import blockcopy
+from cinder.volume import image_cache
 from cinder.volume import iscsi
+from cinder.volume import qcow2
+from cinder.volume import wipe
 
 
 LOG = logging.getLogger(__name__)
@@ -39,6 +43,19 @@ volume_opts = [
     cfg.StrOpt('volume_group',
                default='cinder-volumes',
                help='Name for the VG that will contain exported volumes'),
+    cfg.IntOpt('lvm_inventory_ttl',
+               default=60,
+               help='Seconds the cached list of logical volumes is trusted '
+                    'before it is reloaded'),
+    cfg.IntOpt('lvm_stats_interval',
+               default=60,
+               help='Seconds the capacity of the volume group is cached '
+                    'for stats requests not asking for a refresh'),
+    cfg.StrOpt('lvm_type',
+               default='default',
+               help='Type of LVM volumes to deploy: default (thick) or thin '
+                    '(thin-provisioned volumes and snapshots in a thin '
+                    'pool named <volume_group>-pool)'),
     cfg.IntOpt('num_shell_tries',
                default=3,
                help='number of times to attempt to run flakey shell commands'),
@@ -77,15 +94,142 @@ FLAGS = flags.FLAGS
 FLAGS.register_opts(volume_opts)
 
 
+class LVMInventory(object):
+    """Cached view of the logical volumes in the volume group.
+
+    All logical volumes are loaded with a single lvs call and kept for
+    lvm_inventory_ttl seconds, so existence, size and origin checks don't
+    each need their own root command.
+    """
+
+    def __init__(self, execute=utils.execute):
+        self.set_execute(execute)
+        self._lvs = None
+        self._loaded_at = 0
+        self._generation = 0
+        self._vg = None
+        self._vg_loaded_at = 0
+
+    def set_execute(self, execute):
+        """Set the function to be used to execute commands."""
+        self._execute = execute
+
+    def invalidate(self):
+        """Forget the cached group and volumes, e.g. after a mutation."""
+        self._lvs = None
+        self._vg = None
+        self._generation += 1
+
+    def remove(self, lv_name):
+        """Drop a removed logical volume without reloading the group."""
+        self._vg = None
+        self._generation += 1
+        if self._lvs is None:
+            return
+        lv = self._lvs.pop(lv_name, None)
+        if lv and lv['origin']:
+            # the origin may no longer have snapshots
+            self.invalidate()
+
+    def _get_all(self):
+        if (self._lvs is None or
+            time.time() - self._loaded_at > FLAGS.lvm_inventory_ttl):
+            generation = self._generation
+            out, err = self._execute('lvs', '--noheadings', '--nosuffix',
+                                     '--units', 'b', '--separator', ':',
+                                     '-o', 'lv_name,lv_size,lv_attr,origin',
+                                     FLAGS.volume_group, run_as_root=True)
+            lvs = {}
+            for line in (out or '').splitlines():
+                fields = line.strip().split(':')
+                if len(fields) != 4:
+                    continue
+                name, size, attr, origin = fields
+                lvs[name] = {'name': name,
+                             'size': int(float(size)),
+                             'attr': attr,
+                             'origin': origin}
+            # lvs runs in a green subprocess; if the group was changed
+            # while it ran, the listing may predate the change, so it is
+            # used for this lookup but not kept.
+            if generation != self._generation:
+                return lvs
+            self._lvs = lvs
+            self._loaded_at = time.time()
+        return self._lvs
+
+    def get(self, lv_name):
+        """Return a dict describing a logical volume, or None."""
+        return self._get_all().get(lv_name)
+
+    def get_all(self):
+        """Return dicts describing all logical volumes."""
+        return self._get_all().values()
+
+    def exists(self, lv_name):
+        return lv_name in self._get_all()
+
+    def is_origin(self, lv_name):
+        """Whether the logical volume has snapshots depending on it."""
+        lv = self.get(lv_name)
+        return bool(lv) and lv['attr'][:1] in ('o', 'O')
+
+    def get_vg(self, thin_pool=None, refresh=False):
+        """Return the size, free space and LV count of the volume group.
+
+        The result is cached for lvm_stats_interval seconds unless refresh
+        is True. If thin_pool is given, its size and data usage are
+        included.
+        """
+        if (refresh or self._vg is None or
+            time.time() - self._vg_loaded_at > FLAGS.lvm_stats_interval):
+            generation = self._generation
+            out, err = self._execute('vgs', '--noheadings', '--nosuffix',
+                                     '--units', 'b', '--separator', ':',
+                                     '-o', 'vg_size,vg_free,lv_count',
+                                     FLAGS.volume_group, run_as_root=True)
+            size, free, lv_count = (out or '0:0:0').strip().split(':')
+            vg = {'size': int(float(size)),
+                  'free': int(float(free)),
+                  'lv_count': int(lv_count)}
+            if thin_pool:
+                out, err = self._execute('lvs', '--noheadings', '--nosuffix',
+                                         '--units', 'b', '--separator', ':',
+                                         '-o', 'lv_size,data_percent',
+                                         '%s/%s' % (FLAGS.volume_group,
+                                                    thin_pool),
+                                         run_as_root=True)
+                pool_size, used = (out or '0:0').strip().split(':')
+                vg['pool_size'] = int(float(pool_size))
+                vg['pool_used_percent'] = float(used or 0)
+            # as for the logical volumes, a free space read while the
+            # group was changed is returned but not kept
+            if generation != self._generation:
+                return vg
+            self._vg = vg
+            self._vg_loaded_at = time.time()
+        return self._vg
+
+
 class VolumeDriver(object):
     """Executes commands relating to Volumes."""
+
+    # Drivers whose volumes don't live in FLAGS.volume_group set this to
+    # False, so get_volume_stats doesn't report the group's capacity.
+    reports_lvm_capacity = True
+
     def __init__(self, execute=utils.execute, *args, **kwargs):
         # NOTE(vish): db is set by Manager
         self.db = None
+        self.wipe_queue = wipe.WipeQueue()
+        self.inventory = LVMInventory()
+        self.image_cache = image_cache.ImageCache()
         self.set_execute(execute)
 
     def set_execute(self, execute):
         self._execute = execute
+        self.wipe_queue.set_execute(execute)
+        self.inventory.set_execute(execute)
 
     def _try_execute(self, *command, **kwargs):
         # NOTE(vish): Volume commands can partially fail due to timing, but
@@ -113,34 +257,88 @@ class VolumeDriver(object):
             exception_message = (_("volume group %s doesn't exist")
                                   % FLAGS.volume_group)
             raise exception.VolumeBackendAPIException(data=exception_message)
+        if FLAGS.lvm_type == 'thin':
+            self._ensure_thin_pool()
+        if FLAGS.volume_wipe_async:
+            self.wipe_queue.recover()
 
-    def _create_volume(self, volume_name, sizestr):
-        self._try_execute('lvcreate', '-L', sizestr, '-n',
-                          volume_name, FLAGS.volume_group, run_as_root=True)
+    def _thin_pool_name(self):
+        return '%s-pool' % FLAGS.volume_group
 
-    def _copy_volume(self, srcstr, deststr, size_in_g):
-        self._execute('dd', 'if=%s' % srcstr, 'of=%s' % deststr,
-                      'count=%d' % (size_in_g * 1024), 'bs=1M',
-                      run_as_root=True)
+    def _ensure_thin_pool(self):
+        if self.inventory.exists(self._thin_pool_name()):
+            return
+        LOG.info(_("Creating thin pool %s"), self._thin_pool_name())
+        self._try_execute('lvcreate', '-T', '-l', '95%FREE',
+                          '%s/%s' % (FLAGS.volume_group,
+                                     self._thin_pool_name()),
+                          run_as_root=True)
+        self.inventory.invalidate()
 
-    def _volume_not_present(self, volume_name):
-        path_name = '%s/%s' % (FLAGS.volume_group, volume_name)
+    def _create_volume(self, volume_name, sizestr):
         try:
-            self._try_execute('lvdisplay', path_name, run_as_root=True)
-        except Exception as e:
-            # If the volume isn't present
-            return True
-        return False
+            if FLAGS.lvm_type == 'thin':
+                self._try_execute('lvcreate', '-T', '-V', sizestr, '-n',
+                                  volume_name,
+                                  '%s/%s' % (FLAGS.volume_group,
+                                             self._thin_pool_name()),
+                                  run_as_root=True)
+            else:
+                self._try_execute('lvcreate', '-L', sizestr, '-n',
+                                  volume_name, FLAGS.volume_group,
+                                  run_as_root=True)
+        finally:
+            self.inventory.invalidate()
+
+    def _create_thin_snapshot(self, name, origin_name):
+        """Creates a thin snapshot, which only copies pool metadata."""
+        try:
+            self._try_execute('lvcreate', '--name', name, '--snapshot',
+                              '%s/%s' % (FLAGS.volume_group, origin_name),
+                              run_as_root=True)
+            # thin snapshots are created with the activation skip flag set, so
+            # they have to be activated explicitly.
+            self._try_execute('lvchange', '-a', 'y', '-K',
+                              '%s/%s' % (FLAGS.volume_group, name),
+                              run_as_root=True)
+        finally:
+            self.inventory.invalidate()
+
+    def _copy_volume(self, srcstr, deststr, size_in_g, sparse=False):
+        # wiping with /dev/zero has nothing to skip, so it is always left to
+        # dd.
+        if FLAGS.volume_copy_method == 'dd' or srcstr == '/dev/zero':
+            self._execute('dd', 'if=%s' % srcstr, 'of=%s' % deststr,
+                          'count=%d' % (size_in_g * 1024), 'bs=1M',
+                          run_as_root=True)
+            return
+        with utils.temporary_chown(srcstr):
+            with utils.temporary_chown(deststr):
+                blockcopy.copy_volume(srcstr, deststr,
+                                      int(size_in_g) * 1024 ** 3,
+                                      sparse=sparse)
+
+    def _volume_not_present(self, volume_name):
+        return not self.inventory.exists(volume_name)
 
     def _delete_volume(self, volume, size_in_g):
         """Deletes a logical volume."""
-        # zero out old volumes to prevent data leaking between users
-        # TODO(ja): reclaiming space should be done lazy and low priority
-        self._copy_volume('/dev/zero', self.local_path(volume), size_in_g)
+        lv_name = self._escape_snapshot(volume['name'])
+        # unprovisioned blocks of a thin pool read back as zeros, so thin
+        # volumes don't need to be wiped.
+        if FLAGS.lvm_type != 'thin':
+            if FLAGS.volume_wipe_async:
+                size_in_mb = int(size_in_g) * 1024 or 100
+                self.wipe_queue.enqueue(lv_name, size_in_mb)
+                self.inventory.remove(lv_name)
+                return
+            # zero out old volumes to prevent data leaking between users
+            self._copy_volume('/dev/zero', self.local_path(volume),
+                              size_in_g)
         self._try_execute('lvremove', '-f', "%s/%s" %
-                          (FLAGS.volume_group,
-                           self._escape_snapshot(volume['name'])),
+                          (FLAGS.volume_group, lv_name),
                           run_as_root=True)
+        self.inventory.remove(lv_name)
 
     def _sizestr(self, size_in_g):
         if int(size_in_g) == 0:
@@ -161,6 +359,19 @@ class VolumeDriver(object):
 
     def create_volume_from_snapshot(self, volume, snapshot):
         """Creates a volume from a snapshot."""
+        if FLAGS.lvm_type == 'thin':
+            self._create_thin_snapshot(volume['name'],
+                                       self._escape_snapshot(snapshot['name']))
+            if int(volume['size']) > int(snapshot['volume_size']):
+                try:
+                    self._try_execute('lvextend', '-L',
+                                      self._sizestr(volume['size']),
+                                      '%s/%s' % (FLAGS.volume_group,
+                                                 volume['name']),
+                                      run_as_root=True)
+                finally:
+                    self.inventory.invalidate()
+            return
         self._create_volume(volume['name'], self._sizestr(volume['size']))
         self._copy_volume(self.local_path(snapshot), self.local_path(volume),
                           snapshot['volume_size'])
@@ -173,26 +384,26 @@ class VolumeDriver(object):
 
         # TODO(yamahata): lvm can't delete origin volume only without
         # deleting derived snapshots. Can we do something fancy?
-        out, err = self._execute('lvdisplay', '--noheading',
-                                 '-C', '-o', 'Attr',
-                                 '%s/%s' % (FLAGS.volume_group,
-                                            volume['name']),
-                                 run_as_root=True)
-        # fake_execute returns None resulting unit test error
-        if out:
-            out = out.strip()
-            if (out[0] == 'o') or (out[0] == 'O'):
-                raise exception.VolumeIsBusy(volume_name=volume['name'])
+        if self.inventory.is_origin(volume['name']):
+            raise exception.VolumeIsBusy(volume_name=volume['name'])
 
         self._delete_volume(volume, volume['size'])
 
     def create_snapshot(self, snapshot):
         """Creates a snapshot."""
+        if FLAGS.lvm_type == 'thin':
+            self._create_thin_snapshot(self._escape_snapshot(snapshot['name']),
+                                       snapshot['volume_name'])
+            return
         orig_lv_name = "%s/%s" % (FLAGS.volume_group, snapshot['volume_name'])
-        self._try_execute('lvcreate', '-L',
-                          self._sizestr(snapshot['volume_size']),
-                          '--name', self._escape_snapshot(snapshot['name']),
-                          '--snapshot', orig_lv_name, run_as_root=True)
+        try:
+            self._try_execute('lvcreate', '-L',
+                              self._sizestr(snapshot['volume_size']),
+                              '--name',
+                              self._escape_snapshot(snapshot['name']),
+                              '--snapshot', orig_lv_name, run_as_root=True)
+        finally:
+            self.inventory.invalidate()
 
     def delete_snapshot(self, snapshot):
         """Deletes a snapshot."""
@@ -214,6 +425,14 @@ class VolumeDriver(object):
         """Synchronously recreates an export for a logical volume."""
         raise NotImplementedError()
 
+    def ensure_exports(self, context, volumes):
+        """Synchronously recreates the exports for many volumes at once.
+
+        Drivers that can't do better than one ensure_export call per volume
+        don't implement this, and the manager recovers them in parallel.
+        """
+        raise NotImplementedError()
+
     def create_export(self, context, volume):
         """Exports the volume. Can optionally return a Dictionary of changes
         to the volume object to be persisted."""
@@ -246,7 +465,33 @@ class VolumeDriver(object):
     def get_volume_stats(self, refresh=False):
         """Return the current state of the volume service. If 'refresh' is
            True, run the update first."""
-        return None
+        stats = {}
+        if self.reports_lvm_capacity:
+            stats.update(self._get_capacity_stats(refresh))
+        if FLAGS.volume_wipe_async:
+            stats.update(self.wipe_queue.get_stats())
+        if self.image_cache.enabled():
+            stats.update(self.image_cache.get_stats())
+        return stats or None
+
+    def _get_capacity_stats(self, refresh=False):
+        """Return the capacity of the volume group in GB."""
+        gb = float(1024 ** 3)
+        thin = FLAGS.lvm_type == 'thin'
+        vg = self.inventory.get_vg(thin and self._thin_pool_name(),
+                                   refresh=refresh)
+        allocated = sum(lv['size'] for lv in self.inventory.get_all()
+                        if lv['name'] != self._thin_pool_name())
+        stats = {'total_capacity_gb': round(vg['size'] / gb, 2),
+                 'free_capacity_gb': round(vg['free'] / gb, 2),
+                 'allocated_capacity_gb': round(allocated / gb, 2),
+                 'lv_count': vg['lv_count']}
+        if thin:
+            pool_free = vg['pool_size'] * (1 - vg['pool_used_percent'] / 100)
+            stats['free_capacity_gb'] = round(pool_free / gb, 2)
+            stats['thin_pool_capacity_gb'] = round(vg['pool_size'] / gb, 2)
+            stats['thin_pool_used_percent'] = vg['pool_used_percent']
+        return stats
 
     def do_setup(self, context):
         """Any initialization the volume driver does while starting"""
@@ -257,7 +502,11 @@ class VolumeDriver(object):
         raise NotImplementedError()
 
     def copy_volume_to_image(self, context, volume, image_service, image_id):
-        """Copy the volume to the specified image."""
+        """Copy the volume to the specified image.
+
+        May return a dict with the upload_bytes and volume_bytes of the
+        upload, which are reported in the upload notification.
+        """
         raise NotImplementedError()
 
     def clone_image(self, volume, image_location):
@@ -321,6 +570,25 @@ class ISCSIDriver(VolumeDriver):
                                         0, volume_path,
                                         check_exit_code=False)
 
+    def ensure_exports(self, context, volumes):
+        """Recreates the exports for many volumes with one reconfiguration."""
+        # only tgtadm can apply a whole configuration at once,
+        # ietadm needs the iscsi_targets table for every volume
+        if not isinstance(self.tgtadm, iscsi.TgtAdm):
+            raise NotImplementedError()
+        # subclasses that override ensure_export don't export logical
+        # volumes of the volume group, so they recover one at a time
+        if (type(self).ensure_export.__func__ is not
+            ISCSIDriver.ensure_export.__func__):
+            raise NotImplementedError()
+
+        targets = []
+        for volume in volumes:
+            iscsi_name = "%s%s" % (FLAGS.iscsi_target_prefix, volume['name'])
+            volume_path = "/dev/%s/%s" % (FLAGS.volume_group, volume['name'])
+            targets.append((iscsi_name, 1, 0, volume_path))
+        self.tgtadm.create_iscsi_targets(targets)
+
     def _ensure_iscsi_targets(self, context, host):
         """Ensure that target ids have been created in datastore."""
         # NOTE(jdg): tgtadm doesn't use the iscsi_targets table
@@ -553,16 +821,47 @@ class ISCSIDriver(VolumeDriver):
     def copy_image_to_volume(self, context, volume, image_service, image_id):
         """Fetch the image from image_service and write it to the volume."""
         volume_path = self.local_path(volume)
+        if self.image_cache.enabled():
+            with self.image_cache.fetch(context, image_service,
+                                        image_id) as image_path:
+                self._copy_volume(image_path, volume_path, volume['size'],
+                                  sparse=FLAGS.lvm_type == 'thin')
+            return
         with utils.temporary_chown(volume_path):
-            with utils.file_open(volume_path, "wb") as image_file:
-                image_service.download(context, image_id, image_file)
+            if FLAGS.volume_copy_method == 'dd':
+                with utils.file_open(volume_path, "wb") as image_file:
+                    image_service.download(context, image_id, image_file)
+                return
+            # a new thin volume reads back zeros, so zero blocks of the image
+            # don't need to be written.
+            sparse = FLAGS.lvm_type == 'thin'
+
+            def _open_writer(offset):
+                return blockcopy.BlockWriter(volume_path, sparse,
+                                             offset=offset)
+            image_service.download_ranges(context, image_id, _open_writer)
 
     def copy_volume_to_image(self, context, volume, image_service, image_id):
-        """Copy the volume to the specified image."""
+        """Copy the volume to the specified image.
+
+        Volumes uploaded as qcow2 images leave out their zero clusters.
+        Returns the number of bytes uploaded and the size of the volume.
+        """
         volume_path = self.local_path(volume)
+        size = int(volume['size']) * 1024 ** 3
+        disk_format = image_service.show(context, image_id).get('disk_format')
         with utils.temporary_chown(volume_path):
-            with utils.file_open(volume_path) as volume_file:
-                image_service.update(context, image_id, {}, volume_file)
+            if disk_format == 'qcow2':
+                with qcow2.Qcow2Stream(volume_path, size) as image_file:
+                    image_service.update(context, image_id, {}, image_file)
+                return {'upload_bytes': image_file.size, 'volume_bytes': size}
+            if FLAGS.volume_copy_method == 'dd':
+                with utils.file_open(volume_path) as volume_file:
+                    image_service.update(context, image_id, {}, volume_file)
+            else:
+                with blockcopy.BlockReader(volume_path) as volume_file:
+                    image_service.update(context, image_id, {}, volume_file)
+        return {'upload_bytes': size, 'volume_bytes': size}
 
 
 class FakeISCSIDriver(ISCSIDriver):
@@ -584,6 +883,9 @@ class FakeISCSIDriver(ISCSIDriver):
     def terminate_connection(self, volume, connector):
         pass
 
+    def _copy_volume(self, srcstr, deststr, size_in_g, sparse=False):
+        LOG.debug(_("FAKE ISCSI: copy %(srcstr)s to %(deststr)s") % locals())
+
     @staticmethod
     def fake_execute(cmd, *_args, **_kwargs):
         """Execute that simply logs the command."""
@@ -594,6 +896,8 @@ class FakeISCSIDriver(ISCSIDriver):
 class RBDDriver(VolumeDriver):
     """Implements RADOS block device (RBD) volume commands"""
 
+    reports_lvm_capacity = False
+
     def check_for_setup_error(self):
         """Returns an error if prerequisites aren't met"""
         (stdout, stderr) = self._execute('rados', 'lspools')
@@ -788,6 +1092,8 @@ class RBDDriver(VolumeDriver):
 class SheepdogDriver(VolumeDriver):
     """Executes commands relating to Sheepdog Volumes"""
 
+    reports_lvm_capacity = False
+
     def check_for_setup_error(self):
         """Returns an error if prerequisites aren't met"""
         try:
@@ -865,6 +1171,8 @@ class SheepdogDriver(VolumeDriver):
 class LoggingVolumeDriver(VolumeDriver):
     """Logs and records calls, for unit tests."""
 
+    reports_lvm_capacity = False
+
     def check_for_setup_error(self):
         pass
 
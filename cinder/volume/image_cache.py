@@ -0,0 +1,184 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Local cache of image data on volume hosts.
+
+Images are downloaded once into sparse files named <image id>-<checksum>
+under image_cache_dir. Later volumes created from the same image are
+copied from the local file instead of being downloaded again. The least
+recently used images are removed when the cache grows beyond
+image_cache_max_size_gb.
+
+The images are written through blockcopy.BlockWriter, which yields to the
+other green threads after every block, and eviction yields after each
+image it removes.
+
+"""
+
+import collections
+import contextlib
+import os
+
+from eventlet import event
+from eventlet import greenthread
+
+from cinder import flags
+from cinder.openstack.common import cfg
+from cinder.openstack.common import log as logging
+from cinder.volume import blockcopy
+
+
+LOG = logging.getLogger(__name__)
+
+image_cache_opts = [
+    cfg.StrOpt('image_cache_dir',
+               default='$state_path/image-cache',
+               help='Directory where images are cached on volume hosts'),
+    cfg.IntOpt('image_cache_max_size_gb',
+               default=0,
+               help='Maximum disk space used by cached images, 0 disables '
+                    'the image cache'),
+    ]
+
+FLAGS = flags.FLAGS
+FLAGS.register_opts(image_cache_opts)
+
+PART_SUFFIX = '.part'
+
+
+class ImageCache(object):
+    """Least recently used cache of image files."""
+
+    def __init__(self):
+        # key -> disk usage, and the keys least recently used first
+        self._entries = None
+        self._lru = []
+        self._in_use = collections.defaultdict(int)
+        self._filling = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def enabled():
+        return FLAGS.image_cache_max_size_gb > 0
+
+    def _path(self, key):
+        return os.path.join(FLAGS.image_cache_dir, key)
+
+    @staticmethod
+    def _usage(path):
+        return os.stat(path).st_blocks * 512
+
+    def _load(self):
+        """Load the cached images left by a previous run, oldest first."""
+        if self._entries is not None:
+            return
+        if not os.path.isdir(FLAGS.image_cache_dir):
+            os.makedirs(FLAGS.image_cache_dir)
+        files = []
+        for name in os.listdir(FLAGS.image_cache_dir):
+            path = self._path(name)
+            if name.endswith(PART_SUFFIX):
+                LOG.info(_("Removing incomplete cached image %s"), path)
+                os.unlink(path)
+                continue
+            files.append((os.path.getmtime(path), name))
+        self._entries = {}
+        self._lru = []
+        for mtime, name in sorted(files):
+            self._entries[name] = self._usage(self._path(name))
+            self._lru.append(name)
+
+    @contextlib.contextmanager
+    def fetch(self, context, image_service, image_id):
+        """Yields the path of a local copy of the image.
+
+        The image is downloaded on a miss. The file is not evicted while
+        the caller is using it.
+        """
+        self._load()
+        meta = image_service.show(context, image_id)
+        key = '%s-%s' % (image_id, meta.get('checksum') or 'none')
+        # wait for a concurrent download of the same image instead of
+        # downloading it again.
+        while key in self._filling:
+            self._filling[key].wait()
+        if key in self._entries:
+            self.hits += 1
+            self._lru.remove(key)
+            self._lru.append(key)
+            os.utime(self._path(key), None)
+        else:
+            self.misses += 1
+            self._fill(context, image_service, image_id, key,
+                       meta.get('size') or 0)
+        self._in_use[key] += 1
+        try:
+            yield self._path(key)
+        finally:
+            self._in_use[key] -= 1
+            if not self._in_use[key]:
+                del self._in_use[key]
+            self._evict()
+
+    def _fill(self, context, image_service, image_id, key, size):
+        path = self._path(key)
+        part = path + PART_SUFFIX
+        done = self._filling[key] = event.Event()
+
+        def _open_writer(offset):
+            return blockcopy.BlockWriter(part, offset=offset)
+        try:
+            LOG.debug(_("Caching image %(image_id)s in %(path)s") % locals())
+            with open(part, 'wb') as f:
+                f.truncate(size)
+            image_service.download_ranges(context, image_id, _open_writer)
+            os.rename(part, path)
+            self._entries[key] = self._usage(path)
+            self._lru.append(key)
+        except Exception:
+            if os.path.exists(part):
+                os.unlink(part)
+            raise
+        finally:
+            del self._filling[key]
+            done.send()
+
+    def _evict(self):
+        max_size = FLAGS.image_cache_max_size_gb * 1024 ** 3
+        for key in list(self._lru):
+            if sum(self._entries.values()) <= max_size:
+                break
+            # another fetch may have evicted the image while this one
+            # yielded
+            if key in self._in_use or key not in self._entries:
+                continue
+            LOG.info(_("Evicting cached image %s"), key)
+            del self._entries[key]
+            self._lru.remove(key)
+            os.unlink(self._path(key))
+            self.evictions += 1
+            greenthread.sleep(0)
+
+    def get_stats(self):
+        entries = self._entries or {}
+        return {'image_cache_hits': self.hits,
+                'image_cache_misses': self.misses,
+                'image_cache_evictions': self.evictions,
+                'image_cache_images': len(entries),
+                'image_cache_bytes': sum(entries.values())}
@@ -63,6 +63,15 @@ class TargetAdmin(object):
         """Create a iSCSI target and logical unit"""
         raise NotImplementedError()
 
+    def create_iscsi_targets(self, targets, **kwargs):
+        """Create many iSCSI targets and logical units.
+
+        targets is a list of (name, tid, lun, path) tuples. Helpers that
+        can apply a whole configuration at once should override this.
+        """
+        for name, tid, lun, path in targets:
+            self.create_iscsi_target(name, tid, lun, path, **kwargs)
+
     def remove_iscsi_target(self, tid, lun, vol_id, **kwargs):
         """Remove a iSCSI target and logical unit"""
         raise NotImplementedError()
@@ -105,10 +114,8 @@ class TgtAdm(TargetAdmin):
 
         return None
 
-    def create_iscsi_target(self, name, tid, lun, path, **kwargs):
-        # Note(jdg) tid and lun aren't used by TgtAdm but remain for
-        # compatability
-
+    def _write_target_conf(self, name, path):
+        """Write the persistent tgt config for a target, returns its path."""
         if not os.path.exists(FLAGS.volumes_dir):
             os.makedirs(FLAGS.volumes_dir)
 
@@ -125,6 +132,14 @@ class TgtAdm(TargetAdmin):
         f = open(volume_path, 'w+')
         f.write(volume_conf)
         f.close()
+        return volume_path
+
+    def create_iscsi_target(self, name, tid, lun, path, **kwargs):
+        # Note(jdg) tid and lun aren't used by TgtAdm but remain for
+        # compatability
+
+        vol_id = name.split(':')[1]
+        volume_path = self._write_target_conf(name, path)
 
         try:
             (out, err) = self._execute('tgt-admin',
@@ -146,6 +161,17 @@ class TgtAdm(TargetAdmin):
 
         return tid
 
+    def create_iscsi_targets(self, targets, **kwargs):
+        """Write all target configs and apply them with one tgt-admin run."""
+        for name, tid, lun, path in targets:
+            self._write_target_conf(name, path)
+
+        try:
+            self._execute('tgt-admin', '--update', 'ALL', run_as_root=True)
+        except exception.ProcessExecutionError, e:
+            LOG.error(_("Failed to update iscsi targets: %s") % e)
+            raise exception.ISCSITargetCreateFailed(volume_id='ALL')
+
     def remove_iscsi_target(self, tid, lun, vol_id, **kwargs):
         LOG.info(_('Removing volume: %s') % vol_id)
         vol_uuid_file = 'volume-%s' % vol_id
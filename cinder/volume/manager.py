@@ -37,6 +37,10 @@ intact.
 
 """
 
+import time
+
+import eventlet
+
 from cinder import context
 from cinder import exception
 from cinder import flags
@@ -49,6 +53,7 @@ from cinder.openstack.common import importutils
 from cinder.openstack.common import timeutils
 from cinder import utils
 from cinder.volume import utils as volume_utils
+from cinder.volume import workers
 
 
 LOG = logging.getLogger(__name__)
@@ -63,6 +68,28 @@ volume_manager_opts = [
     cfg.BoolOpt('volume_force_update_capabilities',
                 default=False,
                 help='if True will force update capabilities on each check'),
+    cfg.IntOpt('volume_capabilities_resend_interval',
+               default=120,
+               help='Seconds after which unchanged capabilities are sent to '
+                    'the schedulers again so that they do not expire'),
+    cfg.IntOpt('volume_export_recovery_workers',
+               default=1,
+               help='Number of volumes re-exported in parallel on startup '
+                    'when the driver can\'t re-export them in bulk'),
+    cfg.IntOpt('volume_control_pool_size',
+               default=32,
+               help='Number of concurrent control plane operations such as '
+                    'attach and initialize_connection'),
+    cfg.IntOpt('volume_data_copy_pool_size',
+               default=4,
+               help='Number of concurrent operations copying volume data, '
+                    'such as creating volumes from images or snapshots'),
+    cfg.IntOpt('volume_wipe_pool_size',
+               default=2,
+               help='Number of concurrent volume and snapshot deletions'),
+    cfg.IntOpt('volume_snapshot_pool_size',
+               default=4,
+               help='Number of concurrent snapshot creations'),
     ]
 
 FLAGS = flags.FLAGS
@@ -71,6 +98,15 @@ FLAGS.register_opts(volume_manager_opts)
 
 class VolumeManager(manager.SchedulerDependentManager):
     """Manages attachable block storage devices."""
+
+    # operation class of the rpc methods that are only ever cast, everything
+    # else is a call on the control plane.
+    CAST_OPERATIONS = {'create_volume': 'data_copy',
+                       'copy_volume_to_image': 'data_copy',
+                       'delete_volume': 'wipe',
+                       'delete_snapshot': 'wipe',
+                       'create_snapshot': 'snapshot'}
+
     def __init__(self, volume_driver=None, *args, **kwargs):
         """Load the driver from the one specified in args, or from flags."""
         if not volume_driver:
@@ -82,6 +118,36 @@ class VolumeManager(manager.SchedulerDependentManager):
         #             by the driver.
         self.driver.db = self.db
         self._last_volume_stats = []
+        self._last_volume_stats_sent_at = None
+        self._finished_volume_ids = []
+        self.export_recovery = {}
+        self.worker_pools = {
+            'control': workers.WorkerPool('control',
+                                          FLAGS.volume_control_pool_size),
+            'data_copy': workers.WorkerPool('data_copy',
+                                            FLAGS.volume_data_copy_pool_size),
+            'wipe': workers.WorkerPool('wipe', FLAGS.volume_wipe_pool_size),
+            'snapshot': workers.WorkerPool('snapshot',
+                                           FLAGS.volume_snapshot_pool_size)}
+
+    def create_rpc_dispatcher(self):
+        dispatcher = super(VolumeManager, self).create_rpc_dispatcher()
+        return workers.PoolDispatcher(dispatcher, self.worker_pools,
+                                      self._classify_operation)
+
+    def _classify_operation(self, method, kwargs):
+        """Returns the worker pool for an rpc method and if it is a call."""
+        if method not in self.CAST_OPERATIONS:
+            return 'control', True
+        if (method == 'create_volume' and not kwargs.get('snapshot_id') and
+            not kwargs.get('image_id')):
+            return 'control', False
+        return self.CAST_OPERATIONS[method], False
+
+    def get_worker_pool_stats(self, context):
+        """Returns the size, running and queued operations of each pool."""
+        return dict((name, pool.get_stats())
+                    for name, pool in self.worker_pools.iteritems())
 
     def init_host(self):
         """Do any initialization that needs to be run if this is a
@@ -93,11 +159,54 @@ class VolumeManager(manager.SchedulerDependentManager):
 
         volumes = self.db.volume_get_all_by_host(ctxt, self.host)
         LOG.debug(_("Re-exporting %s volumes"), len(volumes))
+        exports = []
         for volume in volumes:
             if volume['status'] in ['available', 'in-use']:
-                self.driver.ensure_export(ctxt, volume)
+                exports.append(volume)
             else:
                 LOG.info(_("volume %s: skipping export"), volume['name'])
+        self._recover_exports(ctxt, exports)
+
+    def _recover_exports(self, context, volumes):
+        """Recreates the exports of volumes, in bulk or in parallel."""
+        start = time.time()
+        self.export_recovery = {'total': len(volumes), 'done': 0,
+                                'failed': 0, 'seconds': 0}
+        try:
+            self.driver.ensure_exports(context, volumes)
+            self.export_recovery['done'] = len(volumes)
+        except NotImplementedError:
+            self._recover_exports_in_parallel(context, volumes)
+        except Exception:
+            LOG.exception(_("Bulk re-export failed, re-exporting volumes "
+                            "one at a time"))
+            self._recover_exports_in_parallel(context, volumes)
+        self.export_recovery['seconds'] = time.time() - start
+        LOG.info(_("Re-exported %(done)d of %(total)d volumes, "
+                   "%(failed)d failed, in %(seconds).1f seconds"),
+                 self.export_recovery)
+
+    def _recover_exports_in_parallel(self, context, volumes):
+        recovery = self.export_recovery
+        step = max(1, len(volumes) / 10)
+
+        def _ensure_export(volume):
+            try:
+                self.driver.ensure_export(context, volume)
+                recovery['done'] += 1
+            except Exception:
+                LOG.exception(_("volume %s: failed to re-export"),
+                              volume['name'])
+                recovery['failed'] += 1
+            finished = recovery['done'] + recovery['failed']
+            if finished % step == 0:
+                LOG.info(_("Re-exported %(done)d of %(total)d volumes"),
+                         recovery)
+
+        pool = eventlet.GreenPool(FLAGS.volume_export_recovery_workers)
+        for volume in volumes:
+            pool.spawn_n(_ensure_export, volume)
+        pool.waitall()
 
     def create_volume(self, context, volume_id, snapshot_id=None,
                       image_id=None):
@@ -149,6 +258,7 @@ class VolumeManager(manager.SchedulerDependentManager):
                 self.db.volume_update(context, volume_ref['id'], model_update)
         except Exception:
             with excutils.save_and_reraise_exception():
+                self._finished_volume_ids.append(volume_ref['id'])
                 self.db.volume_update(context,
                                       volume_ref['id'], {'status': 'error'})
 
@@ -157,6 +267,7 @@ class VolumeManager(manager.SchedulerDependentManager):
                               volume_ref['id'], {'status': status,
                                                  'launched_at': now})
         LOG.debug(_("volume %s: created successfully"), volume_ref['name'])
+        self._finished_volume_ids.append(volume_ref['id'])
         self._reset_stats()
 
         if image_id and not cloned:
@@ -186,14 +297,15 @@ class VolumeManager(manager.SchedulerDependentManager):
         except exception.VolumeIsBusy:
             LOG.debug(_("volume %s: volume is busy"), volume_ref['name'])
             self.driver.ensure_export(context, volume_ref)
-            self.db.volume_update(context, volume_ref['id'],
-                                  {'status': 'available'})
+            self.db.volume_conditional_update(context, volume_ref['id'],
+                                              {'status': 'available'},
+                                              {'status': 'deleting'})
             return True
         except Exception:
             with excutils.save_and_reraise_exception():
-                self.db.volume_update(context,
-                                      volume_ref['id'],
-                                      {'status': 'error_deleting'})
+                self.db.volume_conditional_update(context, volume_ref['id'],
+                                                  {'status': 'error_deleting'},
+                                                  {'status': 'deleting'})
 
         self.db.volume_destroy(context, volume_id)
         LOG.debug(_("volume %s: deleted successfully"), volume_ref['name'])
@@ -264,9 +376,9 @@ class VolumeManager(manager.SchedulerDependentManager):
                                       mountpoint)
         except Exception:
             with excutils.save_and_reraise_exception():
-                self.db.volume_update(context,
-                                      volume_id,
-                                      {'status': 'error_attaching'})
+                self.db.volume_conditional_update(context, volume_id,
+                        {'status': 'error_attaching'},
+                        {'status': ['available', 'attaching']})
 
         self.db.volume_attached(context.elevated(),
                                 volume_id,
@@ -281,9 +393,9 @@ class VolumeManager(manager.SchedulerDependentManager):
             self.driver.detach_volume(context, volume_id)
         except Exception:
             with excutils.save_and_reraise_exception():
-                self.db.volume_update(context,
-                                      volume_id,
-                                      {'status': 'error_detaching'})
+                self.db.volume_conditional_update(context, volume_id,
+                        {'status': 'error_detaching'},
+                        {'status': ['in-use', 'detaching']})
 
         self.db.volume_detached(context.elevated(), volume_id)
 
@@ -311,13 +423,19 @@ class VolumeManager(manager.SchedulerDependentManager):
         payload = {'volume_id': volume_id, 'image_id': image_id}
         try:
             volume = self.db.volume_get(context, volume_id)
+            self._notify_about_volume_usage(context, volume, "upload.start",
+                                            {'image_id': image_id})
             self.driver.ensure_export(context.elevated(), volume)
             image_service, image_id = glance.get_remote_image_service(context,
                                                                       image_id)
-            self.driver.copy_volume_to_image(context, volume, image_service,
-                                             image_id)
+            start = time.time()
+            stats = self.driver.copy_volume_to_image(context, volume,
+                                                     image_service, image_id)
             LOG.debug(_("Uploaded volume %(volume_id)s to "
                         "image (%(image_id)s) successfully") % locals())
+            self._notify_about_volume_usage(
+                context, volume, "upload.end",
+                self._upload_usage(image_id, stats, time.time() - start))
         except Exception, error:
             with excutils.save_and_reraise_exception():
                 payload['message'] = unicode(error)
@@ -329,6 +447,20 @@ class VolumeManager(manager.SchedulerDependentManager):
                 self.db.volume_update(context, volume_id,
                                       {'status': 'in-use'})
 
+    @staticmethod
+    def _upload_usage(image_id, stats, seconds):
+        """Returns the throughput and savings of an upload."""
+        usage = {'image_id': image_id, 'upload_seconds': seconds}
+        if stats:
+            uploaded = stats['upload_bytes']
+            usage['upload_bytes'] = uploaded
+            usage['upload_mb_per_second'] = (uploaded / (1024.0 * 1024) /
+                                             max(seconds, 0.001))
+            if stats['volume_bytes']:
+                usage['upload_bytes_saved_ratio'] = (
+                    1 - float(uploaded) / stats['volume_bytes'])
+        return usage
+
     def initialize_connection(self, context, volume_id, connector):
         """Prepare volume for connection from host represented by connector.
 
@@ -366,7 +498,8 @@ class VolumeManager(manager.SchedulerDependentManager):
               json in various places, so it should not contain any non-json
               data types.
         """
-        volume_ref = self.db.volume_get(context, volume_id)
+        volume_ref = self.db.volume_get(context, volume_id,
+                                        columns_to_join=[])
         return self.driver.initialize_connection(volume_ref, connector)
 
     def terminate_connection(self, context, volume_id, connector):
@@ -374,7 +507,8 @@ class VolumeManager(manager.SchedulerDependentManager):
 
         The format of connector is the same as for initialize_connection.
         """
-        volume_ref = self.db.volume_get(context, volume_id)
+        volume_ref = self.db.volume_get(context, volume_id,
+                                        columns_to_join=[])
         self.driver.terminate_connection(volume_ref, connector)
 
     def check_for_export(self, context, instance_uuid):
@@ -396,21 +530,40 @@ class VolumeManager(manager.SchedulerDependentManager):
 
     @manager.periodic_task
     def _report_driver_status(self, context):
-        volume_stats = self.driver.get_volume_stats(refresh=True)
-        if volume_stats:
-            LOG.info(_("Checking volume capabilities"))
-
-            if self._volume_stats_changed(self._last_volume_stats,
-                                          volume_stats):
-                LOG.info(_("New capabilities found: %s"), volume_stats)
-                self._last_volume_stats = volume_stats
-
-                # This will grab info about the host and queue it
-                # to be sent to the Schedulers.
-                self.update_service_capabilities(self._last_volume_stats)
-            else:
-                # avoid repeating fanouts
-                self.update_service_capabilities(None)
+        # volumes that finish while the driver gathers its stats are left
+        # for the next report rather than cleared unreported.
+        finished_volume_ids = self._finished_volume_ids
+        self._finished_volume_ids = []
+        # hosts are reported even if the driver has no stats, the schedulers
+        # only place volumes on hosts they know.
+        volume_stats = dict(self.driver.get_volume_stats(refresh=True) or {},
+                            availability_zone=FLAGS.storage_availability_zone)
+        LOG.info(_("Checking volume capabilities"))
+
+        # the schedulers hold a claim on the capacity of each volume they place
+        # here until we report that its creation finished, so report those
+        # volumes right away.
+        # the schedulers also forget hosts that stop reporting, so unchanged
+        # stats are refreshed now and then.
+        if self._volume_stats_changed(self._last_volume_stats,
+                                      volume_stats):
+            LOG.info(_("New capabilities found: %s"), volume_stats)
+        elif not (finished_volume_ids or
+                  timeutils.is_older_than(self._last_volume_stats_sent_at,
+                        FLAGS.volume_capabilities_resend_interval)):
+            # avoid repeating fanouts
+            self.update_service_capabilities(None)
+            return
+
+        self._last_volume_stats = volume_stats
+        self._last_volume_stats_sent_at = timeutils.utcnow()
+        # the queue depths of the worker pools ride along with the stats,
+        # they change too often to trigger a fanout on their own.
+        # This will grab info about the host and queue it
+        # to be sent to the Schedulers.
+        self.update_service_capabilities(dict(volume_stats,
+                finished_volume_ids=finished_volume_ids,
+                worker_pools=self.get_worker_pool_stats(context)))
 
     def _reset_stats(self):
         LOG.info(_("Clear capabilities"))
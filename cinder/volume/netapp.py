@@ -89,6 +89,8 @@ class DfmLun(object):
 class NetAppISCSIDriver(driver.ISCSIDriver):
     """NetApp iSCSI volume driver."""
 
+    reports_lvm_capacity = False
+
     IGROUP_PREFIX = 'openstack-'
     DATASET_PREFIX = 'OpenStack_'
     DATASET_METADATA_PROJECT_KEY = 'OpenStackProject'
@@ -1018,6 +1020,8 @@ class NetAppLun(object):
 class NetAppCmodeISCSIDriver(driver.ISCSIDriver):
     """NetApp C-mode iSCSI volume driver."""
 
+    reports_lvm_capacity = False
+
     def __init__(self, *args, **kwargs):
         super(NetAppCmodeISCSIDriver, self).__init__(*args, **kwargs)
         self.lun_table = {}
@@ -74,6 +74,8 @@ FLAGS.register_opts(nexenta_opts)
 class NexentaDriver(driver.ISCSIDriver):  # pylint: disable=R0921
     """Executes volume driver commands on Nexenta Appliance."""
 
+    reports_lvm_capacity = False
+
     def __init__(self):
         super(NexentaDriver, self).__init__()
 
@@ -64,6 +64,8 @@ class NfsDriver(driver.VolumeDriver):
     """NFS based cinder driver. Creates file on NFS share for using it
     as block device on hypervisor."""
 
+    reports_lvm_capacity = False
+
     def do_setup(self, context):
         """Any initialization the volume driver does while starting"""
         super(NfsDriver, self).do_setup(context)
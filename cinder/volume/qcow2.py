@@ -0,0 +1,213 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Streaming qcow2 images of volumes.
+
+A Qcow2Stream is a file-like object that produces a version 2 qcow2 image
+of a volume without writing it to a temporary file. The volume is scanned
+once for clusters that hold data, which fixes the layout of the image, and
+is read a second time for those clusters only while the image is streamed.
+All zero clusters are left out, so a mostly empty volume produces a small
+image.
+
+"""
+
+import array
+import errno
+import os
+import struct
+
+from cinder.volume import blockcopy
+
+
+QCOW_MAGIC = 0x514649fb
+QCOW_VERSION = 2
+OFLAG_COPIED = 1 << 63
+CLUSTER_BITS = 16
+CLUSTER_SIZE = 1 << CLUSTER_BITS
+L2_ENTRIES = CLUSTER_SIZE / 8
+REFCOUNTS_PER_BLOCK = CLUSTER_SIZE / 2
+HEADER = struct.Struct('>IIQIIQIIQQIIQ')
+ZEROS = '\0' * CLUSTER_SIZE
+
+
+def _clusters(size):
+    return (size + CLUSTER_SIZE - 1) / CLUSTER_SIZE
+
+
+def _pad(data):
+    return data + '\0' * (-len(data) % CLUSTER_SIZE)
+
+
+class Qcow2Stream(object):
+    """File-like qcow2 image holding the non-zero clusters of a volume."""
+
+    def __init__(self, path, size_in_bytes, direct=None):
+        self.virtual_size = size_in_bytes
+        self._reader = blockcopy.BlockReader(path, direct)
+        self._allocated = self._scan()
+        self._layout()
+        self._chunks = self._generate()
+        self._pending = ''
+        self._pos = 0
+        self._started = False
+
+    def _scan(self):
+        """Returns the indexes of the clusters that hold data.
+
+        The whole volume is read here, but readblock yields to the other
+        green threads after every block, so the scan doesn't hold the hub.
+        """
+        allocated = array.array('L')
+        offset = 0
+        while offset < self.virtual_size:
+            block = self._reader.readblock()
+            if isinstance(block, (int, long)):
+                offset += block
+                continue
+            if not block:
+                break
+            end = min(offset + len(block), self.virtual_size)
+            cluster = offset >> CLUSTER_BITS
+            while cluster << CLUSTER_BITS < end:
+                start = max(cluster << CLUSTER_BITS, offset)
+                stop = min((cluster + 1) << CLUSTER_BITS, end)
+                if ((not allocated or allocated[-1] != cluster) and
+                    buffer(block, start - offset, stop - start) !=
+                    buffer(ZEROS, 0, stop - start)):
+                    allocated.append(cluster)
+                cluster += 1
+            offset += len(block)
+        return allocated
+
+    def _layout(self):
+        self._l1_size = max(1, (_clusters(self.virtual_size) +
+                                L2_ENTRIES - 1) / L2_ENTRIES)
+        self._l2_tables = sorted(set(c / L2_ENTRIES
+                                     for c in self._allocated))
+        l1_clusters = _clusters(self._l1_size * 8)
+        fixed = 1 + l1_clusters + len(self._l2_tables) + len(self._allocated)
+        # the refcount blocks count themselves and the table that points to
+        # them, so grow both until they fit.
+        self._refcount_blocks = self._refcount_clusters = 0
+        while True:
+            total = fixed + self._refcount_clusters + self._refcount_blocks
+            blocks = (total + REFCOUNTS_PER_BLOCK - 1) / REFCOUNTS_PER_BLOCK
+            table = _clusters(blocks * 8)
+            if (blocks, table) == (self._refcount_blocks,
+                                   self._refcount_clusters):
+                break
+            self._refcount_blocks, self._refcount_clusters = blocks, table
+        self._total_clusters = total
+        self._l1_offset = CLUSTER_SIZE
+        self._refcount_offset = self._l1_offset + l1_clusters * CLUSTER_SIZE
+        self._blocks_offset = (self._refcount_offset +
+                               self._refcount_clusters * CLUSTER_SIZE)
+        self._l2_offset = (self._blocks_offset +
+                           self._refcount_blocks * CLUSTER_SIZE)
+        self._data_offset = (self._l2_offset +
+                             len(self._l2_tables) * CLUSTER_SIZE)
+        self.size = total * CLUSTER_SIZE
+
+    def _generate(self):
+        yield _pad(HEADER.pack(QCOW_MAGIC, QCOW_VERSION, 0, 0, CLUSTER_BITS,
+                               self.virtual_size, 0, self._l1_size,
+                               self._l1_offset, self._refcount_offset,
+                               self._refcount_clusters, 0, 0))
+        l1 = [0] * self._l1_size
+        for i, index in enumerate(self._l2_tables):
+            l1[index] = (self._l2_offset + i * CLUSTER_SIZE) | OFLAG_COPIED
+        yield _pad(struct.pack('>%dQ' % len(l1), *l1))
+        yield _pad(struct.pack('>%dQ' % self._refcount_blocks,
+                               *[self._blocks_offset + i * CLUSTER_SIZE
+                                 for i in xrange(self._refcount_blocks)]))
+        remaining = self._total_clusters
+        for i in xrange(self._refcount_blocks):
+            count = min(remaining, REFCOUNTS_PER_BLOCK)
+            yield _pad('\0\1' * count)
+            remaining -= count
+        j = 0
+        for index in self._l2_tables:
+            l2 = [0] * L2_ENTRIES
+            while (j < len(self._allocated) and
+                   self._allocated[j] / L2_ENTRIES == index):
+                l2[self._allocated[j] % L2_ENTRIES] = (
+                    (self._data_offset + j * CLUSTER_SIZE) | OFLAG_COPIED)
+                j += 1
+            yield struct.pack('>%dQ' % L2_ENTRIES, *l2)
+        for cluster in self._allocated:
+            yield self._read_cluster(cluster)
+
+    def _read_cluster(self, cluster):
+        offset = cluster << CLUSTER_BITS
+        if self._reader.tell() != offset:
+            self._reader.seek(offset)
+        want = min(CLUSTER_SIZE, self.virtual_size - offset)
+        chunks = []
+        while want:
+            chunk = self._reader.read(want)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            want -= len(chunk)
+        return _pad(''.join(chunks))
+
+    @property
+    def bytes_read(self):
+        return self._reader.bytes_read
+
+    def read(self, size=-1):
+        if not self._started:
+            if self._pos:
+                raise IOError(errno.ESPIPE, _("Illegal seek"))
+            self._started = True
+        chunks = [self._pending]
+        count = len(self._pending)
+        while size < 0 or count < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            chunks.append(chunk)
+            count += len(chunk)
+        data = ''.join(chunks)
+        if size < 0:
+            size = len(data)
+        self._pending = data[size:]
+        self._pos += min(size, len(data))
+        return data[:size]
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        """Only supports finding the size of the image before reading."""
+        if whence == os.SEEK_END:
+            offset += self.size
+        elif whence == os.SEEK_CUR:
+            offset += self._pos
+        if self._started and offset != self._pos:
+            raise IOError(errno.ESPIPE, _("Illegal seek"))
+        self._pos = offset
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        self._reader.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -86,6 +86,8 @@ class SanISCSIDriver(cinder.volume.driver.ISCSIDriver):
     remote protocol.
     """
 
+    reports_lvm_capacity = False
+
     def __init__(self):
         super(SanISCSIDriver, self).__init__()
         self.run_local = FLAGS.san_is_local
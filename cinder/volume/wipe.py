@@ -0,0 +1,152 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Background secure-wipe queue for deleted logical volumes.
+
+Instead of zeroing a logical volume inline while the delete request waits,
+the volume is renamed into a pending-wipe namespace and zeroed by a small
+pool of background workers. The renamed logical volumes are the queue
+itself, so a restart of the volume service simply picks them up again.
+
+"""
+
+import collections
+import math
+import time
+
+import eventlet
+from eventlet import greenthread
+
+from cinder import flags
+from cinder.openstack.common import cfg
+from cinder.openstack.common import log as logging
+from cinder import utils
+
+
+LOG = logging.getLogger(__name__)
+
+wipe_opts = [
+    cfg.BoolOpt('volume_wipe_async',
+                default=False,
+                help='If True, deleted volumes are renamed and zeroed by a '
+                     'background worker pool instead of during the delete '
+                     'request'),
+    cfg.IntOpt('volume_wipe_workers',
+               default=1,
+               help='Number of volumes that are wiped concurrently'),
+    cfg.IntOpt('volume_wipe_bandwidth_mb',
+               default=0,
+               help='Total write bandwidth in MB/s shared by the wipe '
+                    'workers, 0 means unlimited'),
+    cfg.IntOpt('volume_wipe_chunk_mb',
+               default=256,
+               help='Size in MB of each zeroing pass of a wipe worker'),
+    ]
+
+FLAGS = flags.FLAGS
+FLAGS.register_opts(wipe_opts)
+
+# Logical volumes with this prefix are owned by the wipe queue.
+WIPE_PREFIX = 'wipe-'
+
+
+class WipeQueue(object):
+    """Zeroes and removes deleted logical volumes in the background."""
+
+    def __init__(self, execute=utils.execute):
+        self.set_execute(execute)
+        self._pending = collections.deque()
+        self._remaining = {}
+        self._pool = eventlet.GreenPool(FLAGS.volume_wipe_workers)
+
+    def set_execute(self, execute):
+        """Set the function to be used to execute commands."""
+        self._execute = execute
+
+    def enqueue(self, lv_name, size_in_mb):
+        """Move a logical volume into the wipe namespace and queue it."""
+        wipe_name = WIPE_PREFIX + lv_name
+        self._execute('lvrename', FLAGS.volume_group, lv_name, wipe_name,
+                      run_as_root=True)
+        self._add(wipe_name, size_in_mb)
+
+    def recover(self):
+        """Requeue logical volumes left behind by a previous run."""
+        out, err = self._execute('lvs', '--noheadings', '--nosuffix',
+                                 '--units', 'm', '-o', 'lv_name,lv_size',
+                                 FLAGS.volume_group, run_as_root=True)
+        for line in (out or '').splitlines():
+            fields = line.split()
+            if len(fields) != 2 or not fields[0].startswith(WIPE_PREFIX):
+                continue
+            if fields[0] in self._remaining:
+                continue
+            LOG.info(_("Resuming wipe of %s"), fields[0])
+            self._add(fields[0], int(math.ceil(float(fields[1]))))
+
+    def get_stats(self):
+        """Return the queue depth and the number of bytes left to wipe."""
+        return {'wipe_queue_depth': len(self._remaining),
+                'wipe_bytes_remaining': sum(self._remaining.values()) *
+                                        1024 * 1024}
+
+    def _add(self, wipe_name, size_in_mb):
+        self._remaining[wipe_name] = size_in_mb
+        self._pending.append(wipe_name)
+        self._dispatch()
+
+    def _dispatch(self):
+        # spawn_n blocks once the pool is full, so only start as many workers
+        # as there are free slots.
+        for i in xrange(min(self._pool.free(), len(self._pending))):
+            self._pool.spawn_n(self._worker)
+
+    def _worker(self):
+        while self._pending:
+            self._wipe(self._pending.popleft())
+
+    def _wipe(self, wipe_name):
+        try:
+            self._zero(wipe_name)
+            self._execute('lvremove', '-f',
+                          '%s/%s' % (FLAGS.volume_group, wipe_name),
+                          run_as_root=True)
+            LOG.debug(_("Wiped and removed %s"), wipe_name)
+        except Exception:
+            # the logical volume keeps its wipe name, so it will be picked up
+            # again by recover().
+            LOG.exception(_("Failed to wipe %s"), wipe_name)
+        finally:
+            del self._remaining[wipe_name]
+
+    def _zero(self, wipe_name):
+        path = '/dev/%s/%s' % (FLAGS.volume_group, wipe_name)
+        size_in_mb = self._remaining[wipe_name]
+        bandwidth = float(FLAGS.volume_wipe_bandwidth_mb) / \
+                    max(FLAGS.volume_wipe_workers, 1)
+        offset = 0
+        while offset < size_in_mb:
+            count = min(FLAGS.volume_wipe_chunk_mb, size_in_mb - offset)
+            start = time.time()
+            self._execute('dd', 'if=/dev/zero', 'of=%s' % path,
+                          'bs=1M', 'count=%d' % count, 'seek=%d' % offset,
+                          'oflag=direct', run_as_root=True)
+            offset += count
+            self._remaining[wipe_name] = size_in_mb - offset
+            if bandwidth:
+                greenthread.sleep(max(0, count / bandwidth -
+                                         (time.time() - start)))
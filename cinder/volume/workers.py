@@ -0,0 +1,103 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Per operation class worker pools for the volume service.
+
+Every rpc message is handed to the pool of its operation class. Each pool
+runs a fixed number of operations at a time and queues the rest, so a burst
+of slow data copies or wipes can't take all the rpc threads away from
+cheap, latency sensitive calls such as initialize_connection.
+
+"""
+
+import sys
+
+import eventlet
+from eventlet import event
+from eventlet import queue
+
+from cinder.openstack.common import log as logging
+
+
+LOG = logging.getLogger(__name__)
+
+
+class WorkerPool(object):
+    """Runs queued operations with a fixed number of green threads."""
+
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+        self._queue = queue.LightQueue()
+        self._pool = eventlet.GreenPool(size)
+
+    def submit(self, func, *args, **kwargs):
+        """Queue an operation, returns an event that receives its result."""
+        done = event.Event()
+        self._queue.put((func, args, kwargs, done))
+        for i in xrange(min(self._pool.free(), self._queue.qsize())):
+            self._pool.spawn_n(self._worker)
+        return done
+
+    def _worker(self):
+        while not self._queue.empty():
+            func, args, kwargs, done = self._queue.get()
+            try:
+                done.send(func(*args, **kwargs))
+            except Exception:
+                done.send_exception(*sys.exc_info())
+
+    def get_stats(self):
+        return {'size': self.size,
+                'running': self._pool.running(),
+                'queued': self._queue.qsize()}
+
+
+class PoolDispatcher(object):
+    """Rpc dispatcher that runs each message in its operation class pool.
+
+    classify(method, kwargs) returns the name of the pool for a message and
+    whether the caller waits for the result. Messages that nobody waits for
+    release the rpc thread as soon as they are queued.
+    """
+
+    def __init__(self, dispatcher, pools, classify):
+        self.dispatcher = dispatcher
+        self.pools = pools
+        self.classify = classify
+
+    def dispatch(self, ctxt, version, method, **kwargs):
+        name, wait = self.classify(method, kwargs)
+        pool = self.pools[name]
+        if not wait:
+            pool.submit(self._cast, ctxt, version, method, kwargs)
+            return
+        return pool.submit(self._dispatch, ctxt, version, method,
+                           kwargs).wait()
+
+    def _dispatch(self, ctxt, version, method, kwargs):
+        # the worker is a new green thread, so the context has to be stored
+        # again for logging.
+        if hasattr(ctxt, 'update_store'):
+            ctxt.update_store()
+        return self.dispatcher.dispatch(ctxt, version, method, **kwargs)
+
+    def _cast(self, ctxt, version, method, kwargs):
+        try:
+            self._dispatch(ctxt, version, method, kwargs)
+        except Exception:
+            LOG.exception(_("Exception during %s"), method)
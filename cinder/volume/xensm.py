@@ -26,6 +26,8 @@ FLAGS = flags.FLAGS
 
 class XenSMDriver(cinder.volume.driver.VolumeDriver):
 
+    reports_lvm_capacity = False
+
     def _convert_config_params(self, conf_str):
         params = dict([item.split("=") for item in conf_str.split()])
         return params
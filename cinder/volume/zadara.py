@@ -247,6 +247,8 @@ class ZadaraVPSAConnection(object):
 class ZadaraVPSAISCSIDriver(driver.ISCSIDriver):
     """Zadara VPSA iSCSI volume driver."""
 
+    reports_lvm_capacity = False
+
     def __init__(self, *args, **kwargs):
         super(ZadaraVPSAISCSIDriver, self).__init__(*args, **kwargs)
 
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Compare the dd volume copy path with the block copy engine.
+
+Builds a partially filled source volume and an empty destination volume on
+loop devices and copies between them with dd and with
+cinder.volume.blockcopy, reporting the elapsed time and the I/O done on the
+loop devices. A second engine run reads the sparse backing file directly to
+show the effect of SEEK_DATA on sparse sources. Must be run as root:
+
+    sudo tools/volume_copy_benchmark.py --size_mb=4096 --fill_percent=10
+"""
+
+import gettext
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'cinder', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+gettext.install('cinder', unicode=1)
+from cinder import flags
+from cinder.openstack.common import cfg
+from cinder.volume import blockcopy
+
+
+benchmark_opts = [
+    cfg.IntOpt('size_mb',
+               default=1024,
+               help='Size of the benchmark volumes in MB'),
+    cfg.IntOpt('fill_percent',
+               default=10,
+               help='Percentage of 1MB blocks of the source that hold data'),
+    cfg.IntOpt('runs',
+               default=3,
+               help='Number of runs of each copy method'),
+    ]
+
+FLAGS = flags.FLAGS
+FLAGS.register_cli_opts(benchmark_opts)
+
+MB = 1024 * 1024
+
+
+def _run(*cmd):
+    return subprocess.check_output(cmd, stderr=subprocess.STDOUT).strip()
+
+
+def _make_source(path):
+    with open(path, 'wb') as f:
+        for block in xrange(FLAGS.size_mb):
+            if random.randint(1, 100) <= FLAGS.fill_percent:
+                f.seek(block * MB)
+                f.write(os.urandom(MB))
+        f.truncate(FLAGS.size_mb * MB)
+
+
+def _make_dest(path):
+    with open(path, 'wb') as f:
+        f.truncate(FLAGS.size_mb * MB)
+
+
+def _io_counters(loop):
+    """Returns the (read, written) bytes of a loop device."""
+    name = os.path.basename(loop)
+    with open('/sys/block/%s/stat' % name) as f:
+        fields = f.read().split()
+    return int(fields[2]) * 512, int(fields[6]) * 512
+
+
+def _drop_caches():
+    _run('sync')
+    with open('/proc/sys/vm/drop_caches', 'w') as f:
+        f.write('3\n')
+
+
+def _measure(name, copy, loops):
+    times = []
+    for run in xrange(FLAGS.runs):
+        _drop_caches()
+        before = [_io_counters(loop) for loop in loops]
+        start = time.time()
+        copy()
+        _run('sync')
+        times.append(time.time() - start)
+    after = [_io_counters(loop) for loop in loops]
+    read = after[0][0] - before[0][0]
+    written = after[1][1] - before[1][1]
+    print '%-28s %8.2fs %10dMB %10dMB' % (name, min(times),
+                                           read / MB, written / MB)
+
+
+def main():
+    flags.parse_args(sys.argv)
+    if os.getuid() != 0:
+        sys.exit('The volume copy benchmark must be run as root')
+
+    tmpdir = tempfile.mkdtemp()
+    src_file = os.path.join(tmpdir, 'src')
+    dest_file = os.path.join(tmpdir, 'dest')
+    _make_source(src_file)
+    _make_dest(dest_file)
+    src = _run('losetup', '--find', '--show', src_file)
+    dest = _run('losetup', '--find', '--show', dest_file)
+    size = FLAGS.size_mb * MB
+    try:
+        print '%-28s %9s %12s %12s' % ('method', 'best', 'src read',
+                                       'dest written')
+
+        def dd():
+            _run('dd', 'if=%s' % src, 'of=%s' % dest, 'bs=1M',
+                 'count=%d' % FLAGS.size_mb)
+
+        def engine():
+            blockcopy.copy_volume(src, dest, size, sparse=False)
+
+        def engine_sparse_dest():
+            _make_dest(dest_file)
+            blockcopy.copy_volume(src, dest, size, sparse=True)
+
+        def engine_sparse_source():
+            _make_dest(dest_file)
+            blockcopy.copy_volume(src_file, dest, size, sparse=True)
+
+        _measure('dd bs=1M', dd, (src, dest))
+        _measure('blockcopy', engine, (src, dest))
+        _measure('blockcopy, zeroed dest', engine_sparse_dest, (src, dest))
+        _measure('blockcopy, sparse source', engine_sparse_source,
+                 (src, dest))
+    finally:
+        _run('losetup', '-d', src)
+        _run('losetup', '-d', dest)
+        os.unlink(src_file)
+        os.unlink(dest_file)
+        os.rmdir(tmpdir)
+
+
+if __name__ == '__main__':
+    main()